@@ -2,8 +2,10 @@
 # All Rights Reserved.
 
 # Python
+import functools
 import inspect
 import logging
+import threading
 import time
 
 # Django
@@ -12,6 +14,7 @@ from django.contrib.auth import views as auth_views
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import FieldDoesNotExist
 from django.db import connection, transaction
+from django.db.models import QuerySet, prefetch_related_objects
 from django.db.models.fields.related import OneToOneRel
 from django.http import QueryDict
 from django.shortcuts import get_object_or_404
@@ -37,7 +40,9 @@ from ansible_base.lib.utils.requests import get_remote_host
 # AWX
 from awx.main.models import UnifiedJob, UnifiedJobTemplate, User, Role, Credential, WorkflowJobTemplateNode, WorkflowApprovalTemplate
 from awx.main.access import optimize_queryset
+from awx.main.analytics import subsystem_metrics as s_metrics
 from awx.main.utils import camelcase_to_underscore, get_search_fields, getattrd, get_object_or_400, decrypt_field, get_awx_version
+from awx.main.utils.profiling import QueryCounter, QueryProfile
 from awx.main.utils.licensing import server_product_name
 from awx.main.views import ApiErrorView
 from awx.api.serializers import ResourceAccessListElementSerializer, CopySerializer
@@ -134,6 +139,28 @@ def get_default_schema():
     return views.APIView.schema
 
 
+_api_metrics = None
+_api_metrics_lock = threading.Lock()
+
+
+def record_query_profile_metrics(profile, n_plus_one, over_budget):
+    # the metric objects of APIMetrics belong to the class, and are not thread
+    # safe, so the request threads record to one instance, one at a time
+    global _api_metrics
+    try:
+        with _api_metrics_lock:
+            if _api_metrics is None:
+                _api_metrics = s_metrics.APIMetrics()
+            _api_metrics.observe('api_request_queries', profile.count)
+            _api_metrics.observe('api_request_query_milliseconds', int(profile.seconds * 1000))
+            _api_metrics.inc('api_requests_n_plus_one', int(n_plus_one))
+            _api_metrics.inc('api_requests_over_query_budget', int(over_budget))
+            # saved with every request, another one may not come for as long as the metrics interval
+            _api_metrics.pipe_execute()
+    except Exception:
+        logger.exception('Failed to record API query profile metrics')
+
+
 class APIView(views.APIView):
     # Schema is inherited from DRF's APIView, which uses DEFAULT_SCHEMA_CLASS
     # No need to override it here - drf-spectacular will handle it
@@ -249,12 +276,37 @@ class APIView(views.APIView):
             q_times = [float(q['time']) for q in connection.queries[queries_before:]]
             response['X-API-Query-Count'] = len(q_times)
             response['X-API-Query-Time'] = '%0.3fs' % sum(q_times)
+        if hasattr(self, 'capability_queries'):
+            response['X-API-Capability-Query-Count'] = self.capability_queries.count
+        if hasattr(self, 'query_profile'):
+            self.report_query_profile(request, response)
 
         if getattr(self, 'deprecated', False):
             response['Warning'] = '299 awx "This resource has been deprecated and will be removed in a future release."'
 
         return response
 
+    def report_query_profile(self, request, response):
+        profile = self.query_profile
+        response['X-API-Query-Count'] = profile.count
+        response['X-API-Query-Time'] = '%0.3fs' % profile.seconds
+        response['X-API-Query-Sections'] = ', '.join('%s=%d' % (section, queries) for section, queries, seconds in profile.top_sections())
+        candidates = profile.n_plus_one_candidates()
+        if candidates:
+            response['X-API-Query-N-Plus-One'] = ', '.join('%s x%d' % (section, queries) for section, queries, shape in candidates)
+        over_budget = bool(settings.AWX_API_QUERY_BUDGET) and profile.count > settings.AWX_API_QUERY_BUDGET
+        if over_budget:
+            logger.warning(
+                '%s %s made %d queries, more than AWX_API_QUERY_BUDGET (%d); most by %s; N+1 candidates: %s',
+                request.method,
+                request.path,
+                profile.count,
+                settings.AWX_API_QUERY_BUDGET,
+                response['X-API-Query-Sections'],
+                '; '.join('%s x%d: %s' % candidate for candidate in candidates) or 'none',
+            )
+        record_query_profile_metrics(profile, bool(candidates), over_budget)
+
     def get_authenticate_header(self, request):
         # HTTP Basic auth is insecure by default, because the basic auth
         # backend does not provide CSRF protection.
@@ -333,6 +385,10 @@ class APIView(views.APIView):
             request.version, request.versioning_scheme = (scheme.determine_version(request, *args, **kwargs), scheme)
             if 'version' in kwargs:
                 kwargs.pop('version')
+        if settings.AWX_API_QUERY_PROFILE:
+            self.query_profile = QueryProfile(settings.AWX_API_QUERY_PROFILE_N_PLUS_ONE_THRESHOLD)
+            with connection.execute_wrapper(self.query_profile):
+                return super(APIView, self).dispatch(request, *args, **kwargs)
         return super(APIView, self).dispatch(request, *args, **kwargs)
 
     def check_permissions(self, request):
@@ -362,6 +418,16 @@ class GenericAPIView(generics.GenericAPIView, APIView):
             serializer._data = self.update_raw_data(serializer.data)
         return serializer
 
+    def get_serializer_context(self):
+        context = super(GenericAPIView, self).get_serializer_context()
+        # Queries made for user_capabilities, by all serializers of the request
+        if not hasattr(self, 'capability_queries'):
+            self.capability_queries = QueryCounter()
+        context['capability_queries'] = self.capability_queries
+        if hasattr(self, 'query_profile'):
+            context['query_profile'] = self.query_profile
+        return context
+
     def get_queryset(self):
         if self.queryset is not None:
             return self.queryset._clone()
@@ -396,6 +462,24 @@ class GenericAPIView(generics.GenericAPIView, APIView):
         return d
 
 
+@functools.lru_cache(maxsize=None)
+def summary_select_related(serializer_class, model):
+    if not hasattr(serializer_class, 'get_summary_select_related'):
+        return ()
+    return tuple(serializer_class.get_summary_select_related(model))
+
+
+@functools.lru_cache(maxsize=None)
+def summary_prefetch_related(serializer_class, model):
+    if not hasattr(serializer_class, 'get_summary_prefetch_related'):
+        return ()
+    return tuple(serializer_class.get_summary_prefetch_related(model))
+
+
+def prefetch_lookup_name(lookup):
+    return getattr(lookup, 'prefetch_to', lookup)
+
+
 class SimpleListAPIView(generics.ListAPIView, GenericAPIView):
     def get_queryset(self):
         return self.request.user.get_queryset(self.model)
@@ -405,7 +489,52 @@ class ListAPIView(generics.ListAPIView, GenericAPIView):
     # Base class for a read-only list view.
 
     def get_queryset(self):
-        return self.request.user.get_queryset(self.model)
+        return self.select_summary_related(self.request.user.get_queryset(self.model))
+
+    def select_summary_related(self, qs):
+        """
+        select_related the foreign keys the serializer puts in summary_fields and
+        related, and prefetch_related the rest of the objects it summarizes,
+        instead of fetching them for each row of the page.
+        """
+        if not isinstance(qs, QuerySet) or qs.query.values_select or qs.query.combinator:
+            return qs
+        if qs.query.deferred_loading != (frozenset(), True):
+            # select_related can not follow deferred foreign keys
+            return qs
+        if qs.model in (UnifiedJob, UnifiedJobTemplate):
+            # django-polymorphic loads the rows again as their subclasses, without the joined objects
+            return qs
+        serializer_class = self.get_serializer_class()
+        select_related = summary_select_related(serializer_class, qs.model)
+        if select_related:
+            qs = qs.select_related(*select_related)
+        # the access class may prefetch the same objects already, with a queryset of its own
+        prefetched = set(prefetch_lookup_name(lookup) for lookup in qs._prefetch_related_lookups)
+        prefetch_related = [lookup for lookup in summary_prefetch_related(serializer_class, qs.model) if prefetch_lookup_name(lookup) not in prefetched]
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
+        return qs
+
+    def paginate_queryset(self, queryset):
+        page = super(ListAPIView, self).paginate_queryset(queryset)
+        if page is not None and getattr(queryset, 'model', None) in (UnifiedJob, UnifiedJobTemplate):
+            self.prefetch_summary_related(page)
+        return page
+
+    def prefetch_summary_related(self, page):
+        """
+        The counterpart of select_summary_related for polymorphic lists, which
+        prefetches the objects each subclass summarizes for the rows of the page.
+        """
+        serializer = self.get_serializer_class()()
+        objects_by_class = {}
+        for obj in page:
+            objects_by_class.setdefault(type(obj), []).append(obj)
+        for model, objects in objects_by_class.items():
+            serializer_class = serializer.get_sub_serializer(objects[0]) if hasattr(serializer, 'get_sub_serializer') else None
+            serializer_class = serializer_class or type(serializer)
+            prefetch_related_objects(objects, *summary_select_related(serializer_class, model), *summary_prefetch_related(serializer_class, model))
 
     def get_description_context(self):
         if 'username' in get_all_field_names(self.model):
@@ -528,12 +657,12 @@ class SubListAPIView(ParentMixin, ListAPIView):
         parent = self.get_parent_object()
         self.check_parent_access(parent)
         if not self.filter_read_permission:
-            return optimize_queryset(self.get_sublist_queryset(parent))
+            return self.select_summary_related(optimize_queryset(self.get_sublist_queryset(parent)))
         qs = self.request.user.get_queryset(self.model)
         if hasattr(self, 'parent_key'):
             # This is vastly preferable for ReverseForeignKey relationships
-            return qs.filter(**{self.parent_key: parent})
-        return qs.distinct() & self.get_sublist_queryset(parent).distinct()
+            return self.select_summary_related(qs.filter(**{self.parent_key: parent}))
+        return self.select_summary_related(qs.distinct() & self.get_sublist_queryset(parent).distinct())
 
     def get_sublist_queryset(self, parent):
         return getattrd(parent, self.relationship)
@@ -24,8 +24,9 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password as django_validate_password
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError as DjangoValidationError
 from django.db import models
+from django.db.models import Prefetch
 from django.db.models.functions import RowNumber
 from django.utils.translation import gettext_lazy as _
 from django.utils.encoding import force_str
@@ -47,7 +48,7 @@ from polymorphic.models import PolymorphicModel
 from ansible_base.lib.utils.models import get_type_for_model
 
 # AWX
-from awx.main.access import get_user_capabilities
+from awx.main.access import get_page_capabilities, get_user_capabilities
 from awx.main.constants import ACTIVE_STATES, CENSOR_VALUE
 from awx.main.models import (
     ActivityStream,
@@ -118,6 +119,7 @@ from awx.main.utils import (
     truncate_stdout,
     get_licenser,
 )
+from awx.main.utils.profiling import count_queries
 from awx.main.utils.filters import SmartFilter
 from awx.main.utils.named_url_graph import reset_counters
 from awx.main.scheduler.task_manager_models import TaskManagerModels
@@ -425,6 +427,53 @@ class BaseSerializer(serializers.ModelSerializer, metaclass=BaseSerializerMetacl
     def _get_summary_fields(self, obj):
         return {} if obj is None else self.get_summary_fields(obj)
 
+    @classmethod
+    def get_summary_select_related(cls, model):
+        """
+        The foreign keys of model which get_summary_fields and get_related
+        follow, so list views can select_related them instead of fetching
+        each one row by row.
+        """
+        select_related = []
+        for fk in list(SUMMARIZABLE_FK_FIELDS) + ['created_by', 'modified_by']:
+            # The special cases get_summary_fields does not access
+            if fk == 'job' and issubclass(model, UnifiedJob):
+                continue
+            if fk == 'project' and issubclass(model, (InventorySource, Project)):
+                continue
+            try:
+                field = model._meta.get_field(fk)
+            except FieldDoesNotExist:
+                continue
+            if not field.concrete or not (field.many_to_one or field.one_to_one) or field.remote_field.parent_link:
+                continue
+            if field.related_model in (UnifiedJob, UnifiedJobTemplate):
+                # a joined polymorphic base object would be loaded again as its subclass, row by row
+                continue
+            select_related.append(fk)
+        return select_related
+
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        """
+        The related objects of model which get_summary_fields and get_related
+        follow but select_related can not join, so list views can prefetch
+        them for the whole page instead.
+        """
+        prefetch_related = []
+        # last_job is summarized as last_update
+        for fk in list(SUMMARIZABLE_FK_FIELDS) + ['last_job']:
+            if fk == 'job' and issubclass(model, UnifiedJob):
+                continue
+            try:
+                field = model._meta.get_field(fk)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and field.many_to_one and field.related_model in (UnifiedJob, UnifiedJobTemplate):
+                # prefetched as a whole, the objects are loaded as their subclasses once for the page
+                prefetch_related.append(fk)
+        return prefetch_related
+
     def get_summary_fields(self, obj):
         # Return values for certain fields on related objects, to simplify
         # displaying lists of items without additional API requests.
@@ -437,6 +486,9 @@ class BaseSerializer(serializers.ModelSerializer, metaclass=BaseSerializerMetacl
                     continue
                 if fk == 'project' and (isinstance(obj, InventorySource) or isinstance(obj, Project)):
                     continue
+                if fk == 'project' and isinstance(obj, UnifiedJobTemplate) and not hasattr(type(obj), 'project_id'):
+                    # the accessor of the Project subclass, which other templates never have
+                    continue
 
                 try:
                     fkval = getattr(obj, fk, None)
@@ -487,6 +539,21 @@ class BaseSerializer(serializers.ModelSerializer, metaclass=BaseSerializerMetacl
 
         return summary_fields
 
+    @property
+    def _readable_fields(self):
+        query_profile = self.context.get('query_profile')
+        if query_profile is None:
+            yield from super(BaseSerializer, self)._readable_fields
+            return
+        outer_section = query_profile.section
+        try:
+            for field in super(BaseSerializer, self)._readable_fields:
+                # the queries until the next field is yielded are made to render this one
+                query_profile.section = '%s.%s' % (self.__class__.__name__, field.field_name)
+                yield field
+        finally:
+            query_profile.section = outer_section
+
     def _obj_capability_dict(self, obj):
         """
         Returns the user_capabilities dictionary for a single item
@@ -498,23 +565,39 @@ class BaseSerializer(serializers.ModelSerializer, metaclass=BaseSerializerMetacl
         if view and hasattr(view, 'parent_model') and hasattr(view, 'get_parent_object'):
             parent_obj = view.get_parent_object()
         if view and view.request and view.request.user:
-            capabilities_cache = {}
-            # if serializer has parent, it is ListView, apply page capabilities prefetch
-            if self.parent and hasattr(self, 'capabilities_prefetch') and self.capabilities_prefetch:
-                qs = self.parent.instance
-                if 'capability_map' not in self.context:
+            # counted for the X-API-Capability-Query-Count header
+            with count_queries(self.context.get('capability_queries')):
+                capabilities_cache = {}
+                page_capabilities = {}
+                # if serializer has parent, it is ListView, evaluate what the access classes can for the whole page
+                if isinstance(self.parent, serializers.ListSerializer) and self.parent.instance is not None:
+                    if not hasattr(self.parent, 'page_capabilities'):
+                        self.parent.page_capabilities = get_page_capabilities(view.request.user, self.parent.instance)
+                    page_capabilities = self.parent.page_capabilities.get(obj.id, {})
+                # and apply page capabilities prefetch
+                if self.parent and hasattr(self, 'capabilities_prefetch') and self.capabilities_prefetch:
+                    qs = self.parent.instance
                     if hasattr(self, 'polymorphic_base'):
-                        model = self.polymorphic_base.Meta.model
-                        prefetch_list = self.polymorphic_base.capabilities_prefetch
+                        # each type in a polymorphic list is prefetched for its own rows of the page
+                        model = type(obj)
+                        qs = [item for item in qs if type(item) is model]
+                        map_key = 'capability_map_{}'.format(model._meta.model_name)
                     else:
                         model = self.Meta.model
-                        prefetch_list = self.capabilities_prefetch
-                    self.context['capability_map'] = prefetch_page_capabilities(model, qs, prefetch_list, view.request.user)
-                if obj.id in self.context['capability_map']:
-                    capabilities_cache = self.context['capability_map'][obj.id]
-            return get_user_capabilities(
-                view.request.user, obj, method_list=self.show_capabilities, parent_obj=parent_obj, capabilities_cache=capabilities_cache
-            )
+                        map_key = 'capability_map'
+                    if map_key not in self.context:
+                        self.context[map_key] = prefetch_page_capabilities(model, qs, self.capabilities_prefetch, view.request.user)
+                    if obj.id in self.context[map_key]:
+                        capabilities_cache = self.context[map_key][obj.id]
+                user_capabilities = get_user_capabilities(
+                    view.request.user,
+                    obj,
+                    method_list=self.show_capabilities,
+                    parent_obj=parent_obj,
+                    capabilities_cache=capabilities_cache,
+                    page_capabilities=page_capabilities,
+                )
+            return user_capabilities
         else:
             # Contextual information to produce user_capabilities doesn't exist
             return {}
@@ -959,6 +1042,9 @@ class UnifiedJobListSerializer(UnifiedJobSerializer):
         serializer_class = self.get_sub_serializer(obj)
         if serializer_class:
             serializer = serializer_class(instance=obj, context=self.context)
+            # the page of the list view, for user_capabilities
+            if self.parent:
+                serializer.parent = self.parent
             ret = serializer.to_representation(obj)
         else:
             ret = super(UnifiedJobListSerializer, self).to_representation(obj)
@@ -1288,6 +1374,7 @@ class UserPersonalTokenSerializer(BaseOAuth2TokenSerializer):
 
 class OAuth2ApplicationSerializer(BaseSerializer):
     show_capabilities = ['edit', 'delete']
+    capabilities_prefetch = [{'edit': 'organization.admin'}]
 
     class Meta:
         model = OAuth2Application
@@ -1364,6 +1451,7 @@ class OAuth2ApplicationSerializer(BaseSerializer):
 
 class OrganizationSerializer(BaseSerializer):
     show_capabilities = ['edit', 'delete']
+    capabilities_prefetch = ['admin']
 
     class Meta:
         model = Organization
@@ -1724,6 +1812,10 @@ class BaseSerializerWithVariables(BaseSerializer):
 
 
 class LabelsListMixin(object):
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        return super(LabelsListMixin, cls).get_summary_prefetch_related(model) + ['labels']
+
     def _summary_field_labels(self, obj):
         label_list = [{'id': x.id, 'name': x.name} for x in obj.labels.all()[:10]]
         if has_model_field_prefetched(obj, 'labels'):
@@ -2334,6 +2426,8 @@ class BulkHostCreateSerializer(serializers.Serializer):
             Host.objects.bulk_create(result)
         except Exception as e:
             raise serializers.ValidationError({"detail": _(f"cannot create host, host creation error {e}")})
+        # bulk_create sends no post_save, which would invalidate the cached script data
+        Inventory.invalidate_script_data(validated_data['inventory'].id)
         new_total_hosts = old_total_hosts + len(result)
         request = self.context.get('request', None)
         changes = {'total_hosts': [old_total_hosts, new_total_hosts]}
@@ -2822,6 +2916,7 @@ class InventoryUpdateCancelSerializer(InventoryUpdateSerializer):
 
 class TeamSerializer(BaseSerializer):
     show_capabilities = ['edit', 'delete']
+    capabilities_prefetch = ['admin']
 
     class Meta:
         model = Team
@@ -3080,6 +3175,14 @@ class CredentialSerializer(BaseSerializer):
             value['inputs'] = data.display_inputs()
         return value
 
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        # the owner of the credential, linked from related
+        return super(CredentialSerializer, cls).get_summary_prefetch_related(model) + [
+            'admin_role__parents__content_type',
+            'admin_role__parents__content_object',
+        ]
+
     def get_related(self, obj):
         res = super(CredentialSerializer, self).get_related(obj)
 
@@ -3365,12 +3468,25 @@ class JobTemplateMixin(object):
     Provide recent jobs and survey details in summary_fields
     """
 
-    def _recent_jobs(self, obj):
+    @staticmethod
+    def _recent_jobs_queryset():
         # Exclude "joblets", jobs that ran as part of a sliced workflow job
-        uj_qs = obj.unifiedjob_unified_jobs.exclude(job__job_slice_count__gt=1).order_by('-created')
+        uj_qs = UnifiedJob.objects.exclude(job__job_slice_count__gt=1).order_by('-created')
         # Would like to apply an .only, but does not play well with non_polymorphic
         # .only('id', 'status', 'finished', 'polymorphic_ctype_id')
-        optimized_qs = uj_qs.non_polymorphic()
+        return uj_qs.non_polymorphic()
+
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        return super(JobTemplateMixin, cls).get_summary_prefetch_related(model) + [
+            Prefetch('unifiedjob_unified_jobs', queryset=cls._recent_jobs_queryset()[:10], to_attr='summary_recent_jobs')
+        ]
+
+    def _recent_jobs(self, obj):
+        if hasattr(obj, 'summary_recent_jobs'):
+            optimized_qs = obj.summary_recent_jobs
+        else:
+            optimized_qs = self._recent_jobs_queryset().filter(unified_job_template=obj)
         return [
             {
                 'id': x.id,
@@ -3510,6 +3626,10 @@ class JobTemplateSerializer(JobTemplateMixin, UnifiedJobTemplateSerializer, JobO
     def validate_extra_vars(self, value):
         return vars_validate_or_raise(value)
 
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        return super(JobTemplateSerializer, cls).get_summary_prefetch_related(model) + ['credentials__credential_type']
+
     def get_summary_fields(self, obj):
         summary_fields = super(JobTemplateSerializer, self).get_summary_fields(obj)
         all_creds = []
@@ -3602,6 +3722,10 @@ class JobSerializer(UnifiedJobSerializer, JobOptionsSerializer):
             ret['extra_vars'] = obj.display_extra_vars()
         return ret
 
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        return super(JobSerializer, cls).get_summary_prefetch_related(model) + ['credentials__credential_type']
+
     def get_summary_fields(self, obj):
         summary_fields = super(JobSerializer, self).get_summary_fields(obj)
         all_creds = []
@@ -4119,6 +4243,11 @@ class WorkflowApprovalSerializer(UnifiedJobSerializer):
             return False
         return obj.has_vote_from(request.user)
 
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        # workflow_job and workflow_job_template are followed through the node of the approval
+        return super(WorkflowApprovalSerializer, cls).get_summary_prefetch_related(model) + ['unified_job_node__workflow_job__unified_job_template']
+
     def get_related(self, obj):
         res = super(WorkflowApprovalSerializer, self).get_related(obj)
 
@@ -5341,8 +5470,18 @@ class NotificationTemplateSerializer(BaseSerializer):
             res['organization'] = self.reverse('api:organization_detail', kwargs={'pk': obj.organization.pk})
         return res
 
+    @classmethod
+    def get_summary_prefetch_related(cls, model):
+        return super(NotificationTemplateSerializer, cls).get_summary_prefetch_related(model) + [
+            Prefetch('notifications', queryset=Notification.objects.order_by('-created')[:5], to_attr='summary_recent_notifications')
+        ]
+
     def _recent_notifications(self, obj):
-        return [{'id': x.id, 'status': x.status, 'created': x.created, 'error': x.error} for x in obj.notifications.all().order_by('-created')[:5]]
+        if hasattr(obj, 'summary_recent_notifications'):
+            notifications = obj.summary_recent_notifications
+        else:
+            notifications = obj.notifications.all().order_by('-created')[:5]
+        return [{'id': x.id, 'status': x.status, 'created': x.created, 'error': x.error} for x in notifications]
 
     def get_summary_fields(self, obj):
         d = super(NotificationTemplateSerializer, self).get_summary_fields(obj)
@@ -12,6 +12,7 @@ from django.conf import settings
 from django.db.models import Q, Prefetch
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, FieldDoesNotExist
 
 # Django REST Framework
@@ -24,6 +25,7 @@ from ansible_base.lib.utils.validation import to_python_boolean
 
 # AWX
 from awx.main.utils import (
+    evaluate_page_capabilities,
     get_object_or_400,
     get_pk_from_dict,
     get_licenser,
@@ -185,6 +187,22 @@ def get_user_capabilities(user, instance, **kwargs):
     return access_class(user).get_user_capabilities(instance, **kwargs)
 
 
+def get_page_capabilities(user, page):
+    """
+    Returns the capabilities the user has on a page of objects, by id, which
+    the access class of each object evaluates for the whole page at once, see
+    BaseAccess.get_page_capabilities.  The page may mix polymorphic models.
+    """
+    objects_by_class = {}
+    for obj in page:
+        objects_by_class.setdefault(obj.__class__, []).append(obj)
+    mapping = {}
+    for model_class, objects in objects_by_class.items():
+        if model_class in access_registry:
+            mapping.update(access_registry[model_class](user).get_page_capabilities(objects))
+    return mapping
+
+
 def check_superuser(func):
     """
     check_superuser is a decorator that provides a simple short circuit
@@ -431,7 +449,23 @@ class BaseAccess(object):
                     )
                 )
 
-    def get_user_capabilities(self, obj, method_list=[], parent_obj=None, capabilities_cache={}):
+    def get_capability_conditions(self):
+        """
+        Returns conditions by display method of user_capabilities, a Q filter
+        on the model which holds for exactly the objects get_method_capability
+        allows, or a bool when the answer does not depend on the object, so
+        that get_page_capabilities checks them for a whole page in one query.
+        Display methods without one are checked object by object.
+        """
+        return {}
+
+    def get_page_capabilities(self, page):
+        conditions = self.get_capability_conditions()
+        if not conditions:
+            return {}
+        return evaluate_page_capabilities(self.model, page, conditions)
+
+    def get_user_capabilities(self, obj, method_list=[], parent_obj=None, capabilities_cache={}, page_capabilities={}):
         if obj is None:
             return {}
         user_capabilities = {}
@@ -474,6 +508,11 @@ class BaseAccess(object):
                     user_capabilities[display_method] = True
                 continue
 
+            # Evaluated for the whole page by the conditions of this class, which are exact
+            if display_method in page_capabilities:
+                user_capabilities[display_method] = page_capabilities[display_method]
+                continue
+
             # Aliases for going form UI language to API language
             if display_method == 'edit':
                 method = 'change'
@@ -1176,6 +1215,12 @@ class InventoryUpdateAccess(BaseAccess):
     def can_delete(self, obj):
         return self.user in obj.inventory_source.inventory.admin_role
 
+    def get_capability_conditions(self):
+        return {
+            'start': Q(inventory__in=Inventory.accessible_pk_qs(self.user, 'update_role')),
+            'delete': self.user.is_superuser or Q(inventory_source__inventory__in=Inventory.accessible_pk_qs(self.user, 'admin_role')),
+        }
+
 
 class CredentialTypeAccess(BaseAccess):
     """
@@ -1439,6 +1484,14 @@ class ExecutionEnvironmentAccess(BaseAccess):
             raise PermissionDenied
         return self.can_change(obj, None)
 
+    def get_capability_conditions(self):
+        if self.user.is_superuser:
+            # delete only depends on managed then
+            return {'edit': True, 'copy': True}
+        # copy is can_add in the same organization
+        change = Q(organization__in=Organization.accessible_pk_qs(self.user, 'execution_environment_admin_role'))
+        return {'edit': change, 'delete': Q(managed=False) & change, 'copy': change}
+
 
 class ProjectAccess(NotificationAttachMixin, BaseAccess):
     """
@@ -1541,6 +1594,12 @@ class ProjectUpdateAccess(BaseAccess):
     def can_delete(self, obj):
         return obj and self.user in obj.project.admin_role
 
+    def get_capability_conditions(self):
+        return {
+            'start': Q(project__in=Project.accessible_pk_qs(self.user, 'update_role')),
+            'delete': self.user.is_superuser or Q(project__in=Project.accessible_pk_qs(self.user, 'admin_role')),
+        }
+
 
 class JobTemplateAccess(NotificationAttachMixin, UnifiedCredentialsMixin, BaseAccess):
     """
@@ -1835,6 +1894,12 @@ class JobAccess(BaseAccess):
             return self.user in obj.job_template.execute_role
         return super(JobAccess, self).get_method_capability(method, obj, parent_obj)
 
+    def get_capability_conditions(self):
+        return {
+            'start': Q(job_template__isnull=True) | Q(job_template__in=JobTemplate.accessible_pk_qs(self.user, 'execute_role')),
+            'delete': self.user.is_superuser or Q(organization__in=Organization.accessible_pk_qs(self.user, 'admin_role')),
+        }
+
     def can_cancel(self, obj):
         if not obj.can_cancel:
             return False
@@ -2217,6 +2282,15 @@ class WorkflowJobAccess(BaseAccess):
             return self.user in obj.workflow_job_template.execute_role
         return super(WorkflowJobAccess, self).get_method_capability(method, obj, parent_obj)
 
+    def get_capability_conditions(self):
+        start = Q(workflow_job_template__in=WorkflowJobTemplate.accessible_pk_qs(self.user, 'execute_role'))
+        if self.user.is_superuser:
+            start |= Q(workflow_job_template__isnull=True)
+        return {
+            'start': start,
+            'delete': self.user.is_superuser or Q(workflow_job_template__organization__in=Organization.accessible_pk_qs(self.user, 'workflow_admin_role')),
+        }
+
     def can_start(self, obj, validate_license=True):
         if validate_license:
             self.check_license()
@@ -2332,6 +2406,13 @@ class AdHocCommandAccess(BaseAccess):
             validate_license=validate_license,
         )
 
+    def get_capability_conditions(self):
+        return {
+            'start': (Q(credential__isnull=True) | Q(credential__in=Credential.accessible_pk_qs(self.user, 'use_role')))
+            & (Q(inventory__isnull=True) | Q(inventory__in=Inventory.accessible_pk_qs(self.user, 'adhoc_role'))),
+            'delete': self.user.is_superuser or Q(inventory__organization__in=Organization.accessible_pk_qs(self.user, 'admin_role')),
+        }
+
     def can_cancel(self, obj):
         if not obj.can_cancel:
             return False
@@ -2644,6 +2725,23 @@ class ScheduleAccess(UnifiedCredentialsMixin, BaseAccess):
     def can_delete(self, obj):
         return self.can_change(obj, {})
 
+    def get_capability_conditions(self):
+        if self.user.is_superuser:
+            return {'edit': True}
+        # templates without roles allow neither, except inventory sources, see get_page_capabilities
+        admin = Q(unified_job_template__in=UnifiedJobTemplate.accessible_pk_qs(self.user, 'admin_role'))
+        execute = Q(unified_job_template__in=UnifiedJobTemplate.accessible_pk_qs(self.user, 'execute_role')) | Q(
+            unified_job_template__in=Project.accessible_pk_qs(self.user, 'update_role')
+        )
+        return {'edit': admin | (Q(created_by=self.user) & execute)}
+
+    def get_page_capabilities(self, page):
+        # inventory sources are changed by admins of their inventory, which is left to can_change
+        inventory_source_ct_id = ContentType.objects.get_for_model(InventorySource).id
+        return super(ScheduleAccess, self).get_page_capabilities(
+            [obj for obj in page if obj.unified_job_template.polymorphic_ctype_id != inventory_source_ct_id]
+        )
+
 
 class NotificationTemplateAccess(BaseAccess):
     """
@@ -2683,6 +2781,9 @@ class NotificationTemplateAccess(BaseAccess):
             return False
         return self.user in obj.organization.notification_admin_role
 
+    def get_capability_conditions(self):
+        return {'edit': self.user.is_superuser or Q(organization__in=Organization.accessible_pk_qs(self.user, 'notification_admin_role'))}
+
 
 class NotificationAccess(BaseAccess):
     """
@@ -380,7 +380,11 @@ class DispatcherMetrics(Metrics):
         SetIntM('task_manager_running_processed', 'Number of running tasks processed'),
         SetIntM('task_manager_pending_processed', 'Number of pending tasks processed'),
         SetIntM('task_manager_tasks_blocked', 'Number of tasks blocked from running'),
+        SetIntM('task_manager_tasks_skipped_capacity', 'Number of tasks not started for lack of capacity'),
+        SetFloatM('task_manager_capacity_fragmentation', 'Share of free execution capacity outside the instance with the most free capacity'),
         SetFloatM('task_manager_commit_seconds', 'Time spent in db transaction, including on_commit calls'),
+        SetIntM('task_manager_full_reconciles', 'Number of times all active tasks were loaded from db, with TASK_MANAGER_INCREMENTAL'),
+        SetIntM('task_manager_tasks_reloaded', 'Number of changed tasks loaded from db, with TASK_MANAGER_INCREMENTAL'),
         SetFloatM('dependency_manager_get_tasks_seconds', 'Time spent loading pending tasks from db'),
         SetFloatM('dependency_manager_generate_dependencies_seconds', 'Time spent generating dependencies for pending tasks'),
         SetFloatM('dependency_manager__schedule_seconds', 'Time spent in running the entire _schedule'),
@@ -392,6 +396,7 @@ class DispatcherMetrics(Metrics):
         SetFloatM('workflow_manager_recorded_timestamp', 'Unix timestamp when metrics were last recorded'),
         SetFloatM('workflow_manager_spawn_workflow_graph_jobs_seconds', 'Time spent spawning workflow tasks'),
         SetFloatM('workflow_manager_get_tasks_seconds', 'Time spent loading workflow tasks from db'),
+        SetIntM('workflow_manager_dags_built', 'Number of workflow graphs built from db, instead of reused from an earlier run'),
         # dispatcher subsystem metrics
         SetIntM('dispatcher_pool_scale_up_events', 'Number of times local dispatcher scaled up a worker since startup'),
         SetIntM('dispatcher_pool_active_task_count', 'Number of active tasks in the worker pool when last task was submitted'),
@@ -417,15 +422,52 @@ class CallbackReceiverMetrics(Metrics):
             'callback_receiver_batch_events_insert_db', 'Number of events batch inserted into database', settings.SUBSYSTEM_METRICS_BATCH_INSERT_BUCKETS
         ),
         SetFloatM('callback_receiver_event_processing_avg_seconds', 'Average processing time per event per callback receiver batch'),
+        FloatM('callback_receiver_events_insert_db_seconds_bulk_create', 'Total time spent saving events to database with the bulk_create ingest engine'),
+        IntM('callback_receiver_events_insert_db_bulk_create', 'Number of events inserted into database with the bulk_create ingest engine'),
+        HistogramM(
+            'callback_receiver_batch_events_insert_db_bulk_create',
+            'Number of events batch inserted into database with the bulk_create ingest engine',
+            settings.SUBSYSTEM_METRICS_BATCH_INSERT_BUCKETS,
+        ),
+        FloatM('callback_receiver_events_insert_db_seconds_copy', 'Total time spent saving events to database with the COPY ingest engine'),
+        IntM('callback_receiver_events_insert_db_copy', 'Number of events inserted into database with the COPY ingest engine'),
+        HistogramM(
+            'callback_receiver_batch_events_insert_db_copy',
+            'Number of events batch inserted into database with the COPY ingest engine',
+            settings.SUBSYSTEM_METRICS_BATCH_INSERT_BUCKETS,
+        ),
+        SetIntM('callback_receiver_flush_batch_size', 'Number of buffered events of one type which triggers a flush, as chosen by the flush policy'),
+        SetFloatM('callback_receiver_flush_interval_seconds', 'Maximum seconds events are buffered before a flush, as chosen by the flush policy'),
+        IntM('callback_receiver_flushes_forced', 'Number of flushes forced by an idle valkey queue or worker shutdown'),
+        IntM('callback_receiver_flushes_interval', 'Number of flushes triggered by the flush interval elapsing'),
+        IntM('callback_receiver_flushes_size', 'Number of flushes triggered by a buffer reaching the flush batch size'),
+        IntM('callback_receiver_flushes_memory', 'Number of flushes triggered by the in-memory event ceiling'),
     ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(settings.METRICS_SERVICE_CALLBACK_RECEIVER, *args, **kwargs)
 
 
+class APIMetrics(Metrics):
+    # only recorded with AWX_API_QUERY_PROFILE enabled
+    METRICSLIST = [
+        HistogramM('api_request_queries', 'Number of database queries per API request', settings.SUBSYSTEM_METRICS_API_QUERY_BUCKETS),
+        HistogramM(
+            'api_request_query_milliseconds',
+            'Milliseconds spent in database queries per API request',
+            settings.SUBSYSTEM_METRICS_API_QUERY_MILLISECONDS_BUCKETS,
+        ),
+        IntM('api_requests_n_plus_one', 'Number of API requests which repeated a query shape enough to be an N+1 candidate'),
+        IntM('api_requests_over_query_budget', 'Number of API requests which made more than AWX_API_QUERY_BUDGET queries'),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(settings.METRICS_SERVICE_API, *args, **kwargs)
+
+
 def metrics(request):
     output_text = ''
-    for m in [DispatcherMetrics(), CallbackReceiverMetrics()]:
+    for m in [DispatcherMetrics(), CallbackReceiverMetrics(), APIMetrics()]:
         output_text += m.generate_metrics(request)
     return output_text
 
@@ -113,4 +113,4 @@ ANSIBLE_RUNNER_NEEDS_UPDATE_MESSAGE = (
 SUBSCRIPTION_USAGE_MODEL_UNIQUE_HOSTS = 'unique_managed_hosts'
 
 # Shared prefetch to use for creating a queryset for the purpose of writing or saving facts
-HOST_FACTS_FIELDS = ('name', 'ansible_facts', 'ansible_facts_modified', 'modified', 'inventory_id')
+HOST_FACTS_FIELDS = ('name', 'ansible_facts', 'ansible_facts_digest', 'ansible_facts_modified', 'modified', 'inventory_id')
@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 import signal
@@ -19,9 +18,13 @@ from awx.main.consumers import emit_channel_notification
 from awx.main.models import JobEvent, AdHocCommandEvent, ProjectUpdateEvent, InventoryUpdateEvent, SystemJobEvent, UnifiedJob
 from awx.main.constants import ACTIVE_STATES
 from awx.main.models.events import emit_event_detail
+from awx.main.queue import callback_queue_shards
+from awx.main.utils.json_codec import get_json_codec
 from awx.main.utils.profiling import AWXProfiler
 import awx.main.analytics.subsystem_metrics as s_metrics
 from .base import BaseWorker
+from .flush_policy import get_flush_policy
+from .ingest import get_ingest_engine
 
 logger = logging.getLogger('awx.main.commands.run_callback_receiver')
 
@@ -71,11 +74,18 @@ class CallbackBrokerWorker(BaseWorker):
 
     def __init__(self):
         self.buff = {}
+        # (job id, final counter) of the jobs whose EOF was read, summarized once their events are flushed
+        self.finished_jobs = []
         self.valkey = valkey.Valkey.from_url(settings.BROKER_URL)
         self.subsystem_metrics = s_metrics.CallbackReceiverMetrics(auto_pipe_execute=False)
         self.queue_pop = 0
         self.queue_name = settings.CALLBACK_QUEUE
+        self.queue_names = [self.queue_name]
+        self.read_batch_size = settings.JOB_EVENT_READ_BATCH_SIZE
+        self.json_codec = get_json_codec()
         self.prof = AWXProfiler("CallbackBrokerWorker")
+        self.ingest_engine = get_ingest_engine(settings.JOB_EVENT_INGEST_ENGINE)
+        self.flush_policy = get_flush_policy(settings.JOB_EVENT_FLUSH_POLICY)
         for key in self.valkey.keys('awx_callback_receiver_statistics_*'):
             self.valkey.delete(key)
 
@@ -86,34 +96,114 @@ class CallbackBrokerWorker(BaseWorker):
 
     def read(self, queue):
         try:
-            res = self.valkey.blpop(self.queue_name, timeout=1)
+            res = self.valkey.blpop(self.queue_names, timeout=1)
             if res is None:
                 return {'event': 'FLUSH'}
-            self.total += 1
-            self.queue_pop += 1
-            self.subsystem_metrics.inc('callback_receiver_events_popped_redis', 1)
-            self.subsystem_metrics.inc('callback_receiver_events_in_memory', 1)
-            return json.loads(res[1])
+            messages = [res[1]]
+            if self.read_batch_size > 1:
+                # the queue is not empty; drain whatever else is already
+                # waiting (up to the batch size) in one more round trip
+                messages.extend(self.valkey.lpop(res[0], self.read_batch_size - 1) or [])
+            self.total += len(messages)
+            self.queue_pop += len(messages)
+            self.subsystem_metrics.inc('callback_receiver_events_popped_redis', len(messages))
+            self.subsystem_metrics.inc('callback_receiver_events_in_memory', len(messages))
+            if len(messages) == 1:
+                body = self.decode_message(messages[0])
+                return body if body is not None else {'event': 'FLUSH'}
+            return self.decode_batch(messages)
         except valkey.exceptions.ValkeyError:
             logger.exception("encountered an error communicating with valkey")
             time.sleep(1)
-        except (json.JSONDecodeError, KeyError):
-            logger.exception("failed to decode JSON message from valkey")
         finally:
             self.record_statistics()
             self.record_read_metrics()
 
         return {'event': 'FLUSH'}
 
+    def decode_batch(self, messages):
+        """
+        Decode a batch of raw valkey messages with a single JSON parse; if
+        any message is malformed, fall back to decoding them one at a time so
+        that only the bad messages are discarded.
+        """
+        try:
+            bodies = self.json_codec.loads(b'[' + b','.join(messages) + b']')
+            if len(bodies) == len(messages) and all(isinstance(body, dict) for body in bodies):
+                return [self.json_codec.decode_event(message, body) for message, body in zip(messages, bodies)]
+        except Exception:
+            pass
+        bodies = [self.decode_message(message) for message in messages]
+        return [body for body in bodies if body is not None]
+
+    def decode_message(self, message):
+        """
+        Decode one raw valkey message, or return None and drop it if it is
+        not a JSON object.
+        """
+        try:
+            body = self.json_codec.loads(message)
+            if not isinstance(body, dict):
+                raise ValueError(f'expected a JSON object, got {type(body).__name__}')
+            return self.json_codec.decode_event(message, body)
+        except Exception:
+            logger.exception("failed to decode JSON message from valkey")
+            self.subsystem_metrics.inc('callback_receiver_events_in_memory', -1)
+            return None
+
     def record_read_metrics(self):
         if self.queue_pop == 0:
             return
         if self.subsystem_metrics.should_pipe_execute() is True:
-            queue_size = self.valkey.llen(self.queue_name)
-            self.subsystem_metrics.set('callback_receiver_events_queue_size_redis', queue_size)
+            all_queues = self.all_queue_names()
+            with self.valkey.pipeline(transaction=False) as pipe:
+                for name in all_queues:
+                    pipe.llen(name)
+                queue_sizes = dict(zip(all_queues, pipe.execute()))
+            self.subsystem_metrics.set('callback_receiver_events_queue_size_redis', sum(queue_sizes.values()))
+            self.flush_policy.record_queue_size(sum(queue_sizes.get(name, 0) for name in self.queue_names))
             self.subsystem_metrics.pipe_execute()
             self.queue_pop = 0
 
+    def sample_queue_size(self):
+        """
+        Tell the flush policy how many events are waiting in the queues this
+        worker consumes, so the next batch is sized for a burst as it arrives
+        rather than at the next metrics interval.
+        """
+        if not self.flush_policy.samples_queue_size:
+            return
+        try:
+            with self.valkey.pipeline(transaction=False) as pipe:
+                for name in self.queue_names:
+                    pipe.llen(name)
+                self.flush_policy.record_queue_size(sum(pipe.execute()))
+        except valkey.exceptions.ValkeyError:
+            logger.exception("encountered an error communicating with valkey")
+
+    def all_queue_names(self):
+        shards = callback_queue_shards()
+        if self.queue_name not in shards:
+            shards.append(self.queue_name)
+        return shards
+
+    def owned_queue_names(self, idx):
+        """
+        Returns the valkey lists the worker with the given index consumes.
+
+        When events are sharded by job id, each worker owns every
+        JOB_EVENT_WORKERS-th shard; every worker also drains the unsharded
+        CALLBACK_QUEUE, which holds events published before sharding was
+        enabled.
+        """
+        shards = callback_queue_shards()
+        if shards == [self.queue_name]:
+            return shards
+        owned = shards[idx :: settings.JOB_EVENT_WORKERS]
+        if not owned:
+            logger.warning(f'Callback receiver worker {idx} owns none of the {len(shards)} CALLBACK_QUEUE_SHARDS, set it to at least JOB_EVENT_WORKERS')
+        return owned + [self.queue_name]
+
     def record_statistics(self):
         # buffer stat recording to once per (by default) 5s
         if time.time() - self.last_stats > settings.JOB_EVENT_STATISTICS_INTERVAL:
@@ -139,24 +229,27 @@ class CallbackBrokerWorker(BaseWorker):
             filepath = self.prof.stop()
             logger.error(f'profiling is disabled, wrote {filepath}')
 
-    def work_loop(self, *args, **kw):
+    def work_loop(self, queue, finished, idx, *args, **kw):
         if settings.AWX_CALLBACK_PROFILE:
             signal.signal(signal.SIGUSR1, self.toggle_profiling)
-        return super(CallbackBrokerWorker, self).work_loop(*args, **kw)
+        self.queue_names = self.owned_queue_names(idx)
+        return super(CallbackBrokerWorker, self).work_loop(queue, finished, idx, *args, **kw)
 
     def flush(self, force=False):
         now = tz_now()
-        if force or (time.time() - self.last_flush) > settings.JOB_EVENT_BUFFER_SECONDS or any([len(events) >= 1000 for events in self.buff.values()]):
+        flush_reason = 'forced' if force else self.flush_policy.should_flush(self.buff, self.last_flush)
+        if flush_reason:
             metrics_bulk_events_saved = 0
             metrics_singular_events_saved = 0
             metrics_events_batch_save_errors = 0
             metrics_events_broadcast = 0
             metrics_events_missing_created = 0
             metrics_total_job_event_processing_seconds = datetime.timedelta(seconds=0)
+            metrics_total_duration_to_save = 0.0
             for cls, events in self.buff.items():
                 if not events:
                     continue
-                logger.debug(f'{cls.__name__}.objects.bulk_create({len(events)})')
+                logger.debug(f'{cls.__name__} {self.ingest_engine.name} insert ({len(events)})')
                 for e in events:
                     e.modified = now  # this can be set before created because now is set above on line 149
                     if not e.created:
@@ -167,7 +260,7 @@ class CallbackBrokerWorker(BaseWorker):
                 metrics_duration_to_save = time.perf_counter()
                 saved_events = []
                 try:
-                    cls.objects.bulk_create(events)
+                    self.ingest_engine.insert(cls, events)
                     metrics_bulk_events_saved += len(events)
                     saved_events = events
                     self.buff[cls] = []
@@ -175,11 +268,14 @@ class CallbackBrokerWorker(BaseWorker):
                     # If the database is flaking, let ensure_connection throw a general exception
                     # will be caught by the outer loop, which goes into a proper sleep and retry loop
                     django_connection.ensure_connection()
-                    logger.warning(f'Error in events bulk_create, will try indiviually, error: {str(exc)}')
-                    # if an exception occurs, we should re-attempt to save the
-                    # events one-by-one, because something in the list is
-                    # broken/stale
+                    logger.warning(f'Error in events {self.ingest_engine.name} insert, will isolate failing events, error: {str(exc)}')
+                    # if an exception occurs, something in the list is broken/stale;
+                    # bisect the batch to find the bad events, and only re-attempt
+                    # to save those one-by-one
                     metrics_events_batch_save_errors += 1
+                    isolated_events, events[:] = self.insert_isolating_failures(cls, events)
+                    metrics_bulk_events_saved += len(isolated_events)
+                    saved_events.extend(isolated_events)
                     for e in events.copy():
                         try:
                             e.save()
@@ -203,6 +299,7 @@ class CallbackBrokerWorker(BaseWorker):
                                 logger.info(f'Database Error Saving individual Event uuid={e.uuid} try={retry_count}, error: {str(exc_indv)}')
 
                 metrics_duration_to_save = time.perf_counter() - metrics_duration_to_save
+                metrics_total_duration_to_save += metrics_duration_to_save
                 for e in saved_events:
                     if not getattr(e, '_skip_websocket_message', False):
                         metrics_events_broadcast += 1
@@ -212,10 +309,20 @@ class CallbackBrokerWorker(BaseWorker):
             self.last_flush = time.time()
             # only update metrics if we saved events
             if (metrics_bulk_events_saved + metrics_singular_events_saved) > 0:
+                self.flush_policy.record_insert(metrics_bulk_events_saved + metrics_singular_events_saved, metrics_total_duration_to_save)
+                self.sample_queue_size()
+                self.subsystem_metrics.inc(f'callback_receiver_flushes_{flush_reason}', 1)
+                self.subsystem_metrics.set('callback_receiver_flush_batch_size', self.flush_policy.batch_size)
+                self.subsystem_metrics.set('callback_receiver_flush_interval_seconds', self.flush_policy.interval)
                 self.subsystem_metrics.inc('callback_receiver_batch_events_errors', metrics_events_batch_save_errors)
-                self.subsystem_metrics.inc('callback_receiver_events_insert_db_seconds', metrics_duration_to_save)
+                self.subsystem_metrics.inc('callback_receiver_events_insert_db_seconds', metrics_total_duration_to_save)
                 self.subsystem_metrics.inc('callback_receiver_events_insert_db', metrics_bulk_events_saved + metrics_singular_events_saved)
                 self.subsystem_metrics.observe('callback_receiver_batch_events_insert_db', metrics_bulk_events_saved)
+                self.subsystem_metrics.inc(f'callback_receiver_events_insert_db_seconds_{self.ingest_engine.name}', metrics_total_duration_to_save)
+                self.subsystem_metrics.inc(
+                    f'callback_receiver_events_insert_db_{self.ingest_engine.name}', metrics_bulk_events_saved + metrics_singular_events_saved
+                )
+                self.subsystem_metrics.observe(f'callback_receiver_batch_events_insert_db_{self.ingest_engine.name}', metrics_bulk_events_saved)
                 self.subsystem_metrics.inc('callback_receiver_events_in_memory', -(metrics_bulk_events_saved + metrics_singular_events_saved))
                 self.subsystem_metrics.inc('callback_receiver_events_broadcast', metrics_events_broadcast)
                 self.subsystem_metrics.set(
@@ -226,59 +333,120 @@ class CallbackBrokerWorker(BaseWorker):
             if self.subsystem_metrics.should_pipe_execute() is True:
                 self.subsystem_metrics.pipe_execute()
 
-    def perform_work(self, body):
-        try:
-            flush = body.get('event') == 'FLUSH'
-            if flush:
-                self.last_event = ''
-            if not flush:
-                job_identifier = 'unknown job'
-                for cls in (JobEvent, AdHocCommandEvent, ProjectUpdateEvent, InventoryUpdateEvent, SystemJobEvent):
-                    if cls.JOB_REFERENCE in body:
-                        job_identifier = body[cls.JOB_REFERENCE]
-                        break
+    def insert_isolating_failures(self, cls, events):
+        """
+        Re-attempt a batch insert that failed by recursively splitting it in
+        half, so that the rows which cannot be saved are isolated in
+        O(log n) round trips per bad row instead of saving every event of the
+        batch individually.
+
+        Returns a tuple of (saved events, events which failed on their own).
+        """
+        if len(events) <= 1:
+            return [], list(events)
+        saved, failed = [], []
+        middle = len(events) // 2
+        for chunk in (events[:middle], events[middle:]):
+            try:
+                self.ingest_engine.insert(cls, chunk)
+                saved.extend(chunk)
+            except Exception:
+                django_connection.ensure_connection()
+                chunk_saved, chunk_failed = self.insert_isolating_failures(cls, chunk)
+                saved.extend(chunk_saved)
+                failed.extend(chunk_failed)
+        return saved, failed
 
-                self.last_event = f'\n\t- {cls.__name__} for #{job_identifier} ({body.get("event", "")} {body.get("uuid", "")})'  # noqa
+    def buffer_event(self, body):
+        """
+        Turn a decoded callback message into an event in the in-memory buffer.
 
-                notification_trigger_event = bool(body.get('event') == cls.WRAPUP_EVENT)
+        Returns False for EOF messages, which are never persisted.
+        """
+        job_identifier = 'unknown job'
+        for cls in (JobEvent, AdHocCommandEvent, ProjectUpdateEvent, InventoryUpdateEvent, SystemJobEvent):
+            if cls.JOB_REFERENCE in body:
+                job_identifier = body[cls.JOB_REFERENCE]
+                break
 
-                if body.get('event') == 'EOF':
-                    try:
-                        if 'guid' in body:
-                            set_guid(body['guid'])
-                        final_counter = body.get('final_counter', 0)
-                        logger.info('Starting EOF event processing for Job {}'.format(job_identifier))
-                        # EOF events are sent when stdout for the running task is
-                        # closed. don't actually persist them to the database; we
-                        # just use them to report `summary` websocket events as an
-                        # approximation for when a job is "done"
-                        emit_channel_notification('jobs-summary', dict(group_name='jobs', unified_job_id=job_identifier, final_counter=final_counter))
-
-                        if notification_trigger_event:
-                            job_stats_wrapup(job_identifier)
-                    except Exception:
-                        logger.exception('Worker failed to perform EOF tasks: Job {}'.format(job_identifier))
-                    finally:
-                        self.subsystem_metrics.inc('callback_receiver_events_in_memory', -1)
-                        set_guid('')
-                    return
+        self.last_event = f'\n\t- {cls.__name__} for #{job_identifier} ({body.get("event", "")} {body.get("uuid", "")})'  # noqa
+
+        notification_trigger_event = bool(body.get('event') == cls.WRAPUP_EVENT)
+
+        if body.get('event') == 'EOF':
+            try:
+                if 'guid' in body:
+                    set_guid(body['guid'])
+                final_counter = body.get('final_counter', 0)
+                logger.info('Starting EOF event processing for Job {}'.format(job_identifier))
+                # EOF events are sent when stdout for the running task is
+                # closed. don't actually persist them to the database; we
+                # just use them to report `summary` websocket events as an
+                # approximation for when a job is "done"
+                emit_channel_notification('jobs-summary', dict(group_name='jobs', unified_job_id=job_identifier, final_counter=final_counter))
+
+                if notification_trigger_event:
+                    job_stats_wrapup(job_identifier)
+                if cls is JobEvent:
+                    self.finished_jobs.append((job_identifier, final_counter))
+            except Exception:
+                logger.exception('Worker failed to perform EOF tasks: Job {}'.format(job_identifier))
+            finally:
+                self.subsystem_metrics.inc('callback_receiver_events_in_memory', -1)
+                set_guid('')
+            return False
 
-                skip_websocket_message = body.pop('skip_websocket_message', False)
+        skip_websocket_message = body.pop('skip_websocket_message', False)
 
-                event = cls.create_from_data(**body)
+        event = cls.create_from_data(**body)
 
-                if skip_websocket_message:  # if this event sends websocket messages, fire them off on flush
-                    event._skip_websocket_message = True
+        if skip_websocket_message:  # if this event sends websocket messages, fire them off on flush
+            event._skip_websocket_message = True
 
-                if notification_trigger_event:  # if this is an Ansible stats event, ensure notifications on flush
-                    event._notification_trigger_event = True
+        if notification_trigger_event:  # if this is an Ansible stats event, ensure notifications on flush
+            event._notification_trigger_event = True
 
-                self.buff.setdefault(cls, []).append(event)
+        self.buff.setdefault(cls, []).append(event)
+        return True
+
+    def save_children_summaries(self):
+        """
+        Queues the children summary of the events of each finished job, once
+        all of its events are saved.
+        """
+        if any(self.buff.values()):
+            return  # retried along with the flush
+        from awx.main.tasks.system import save_job_events_children_summary  # circular import
+
+        while self.finished_jobs:
+            job_id, final_counter = self.finished_jobs.pop(0)
+            save_job_events_children_summary.apply_async([job_id, final_counter])
+
+    def perform_work(self, body):
+        try:
+            if isinstance(body, list):
+                # a batch of messages drained from valkey by a single read();
+                # buffer all of them, then consider flushing once
+                flush = False
+                for event_body in body:
+                    try:
+                        self.buffer_event(event_body)
+                    except Exception:
+                        logger.exception(f'Callback Task Processor Raised Unexpected Exception processing event data:\n{event_body}')
+            else:
+                flush = body.get('event') == 'FLUSH'
+                if flush:
+                    self.last_event = ''
+                elif not self.buffer_event(body) and not self.finished_jobs:
+                    return
+            # the events of finished jobs are saved right away, for their children summary
+            flush = flush or bool(self.finished_jobs)
 
             retries = 0
             while retries <= self.MAX_RETRIES:
                 try:
                     self.flush(force=flush)
+                    self.save_children_summaries()
                     break
                 except Exception as exc:
                     # Aside form bugs, exceptions here are assumed to be due to database flake
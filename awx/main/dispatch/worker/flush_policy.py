@@ -0,0 +1,106 @@
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('awx.main.commands.run_callback_receiver')
+
+
+class FixedFlushPolicy:
+    """
+    Flush buffered events every JOB_EVENT_BUFFER_SECONDS, or as soon as any
+    buffer reaches JOB_EVENT_BUFFER_MAX_EVENTS.
+    """
+
+    name = 'fixed'
+    # whether the worker samples its queue depth for record_queue_size after every flush
+    samples_queue_size = False
+
+    def __init__(self):
+        self.batch_size = settings.JOB_EVENT_BUFFER_MAX_EVENTS
+        self.interval = settings.JOB_EVENT_BUFFER_SECONDS
+        self.memory_ceiling = settings.JOB_EVENT_BUFFER_MAX_IN_MEMORY
+
+    def should_flush(self, buff, last_flush):
+        """
+        Returns the reason buffered events should be flushed now, or None
+        """
+        sizes = [len(events) for events in buff.values()]
+        if sum(sizes) >= self.memory_ceiling:
+            return 'memory'
+        if any(size >= self.batch_size for size in sizes):
+            return 'size'
+        if (time.time() - last_flush) > self.interval:
+            return 'interval'
+        return None
+
+    def record_queue_size(self, queue_size):
+        pass
+
+    def record_insert(self, count, seconds):
+        pass
+
+
+class AdaptiveFlushPolicy(FixedFlushPolicy):
+    """
+    Size batches and flush intervals from the state of the callback receiver.
+
+    When events are backing up in the valkey queue, batches grow (up to
+    JOB_EVENT_BUFFER_MAX_EVENTS) so the backlog is drained in fewer, larger
+    writes; the batch is capped so that, at the recently observed per-event
+    insert latency, a single write does not stall the worker for longer than
+    JOB_EVENT_BUFFER_SECONDS.  When the queue is empty, the buffer is flushed
+    after JOB_EVENT_BUFFER_MIN_SECONDS so stdout shows up promptly.
+
+    JOB_EVENT_BUFFER_MAX_IN_MEMORY is a hard ceiling on the number of events
+    held in memory across all buffers.
+    """
+
+    name = 'adaptive'
+    samples_queue_size = True
+
+    # weight of the most recent insert in the moving average of insert latency
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self):
+        super(AdaptiveFlushPolicy, self).__init__()
+        self.min_batch_size = min(settings.JOB_EVENT_BUFFER_MIN_EVENTS, settings.JOB_EVENT_BUFFER_MAX_EVENTS)
+        self.max_batch_size = min(settings.JOB_EVENT_BUFFER_MAX_EVENTS, self.memory_ceiling)
+        self.min_interval = min(settings.JOB_EVENT_BUFFER_MIN_SECONDS, settings.JOB_EVENT_BUFFER_SECONDS)
+        self.max_interval = settings.JOB_EVENT_BUFFER_SECONDS
+        self.queue_size = 0
+        self.seconds_per_event = None
+        self.batch_size = self.min_batch_size
+        self.interval = self.min_interval
+
+    def record_queue_size(self, queue_size):
+        self.queue_size = queue_size
+        self.adjust()
+
+    def record_insert(self, count, seconds):
+        if count <= 0:
+            return
+        latency = seconds / count
+        if self.seconds_per_event is None:
+            self.seconds_per_event = latency
+        else:
+            self.seconds_per_event += self.LATENCY_SMOOTHING * (latency - self.seconds_per_event)
+        self.adjust()
+
+    def adjust(self):
+        batch_size = max(self.queue_size, self.min_batch_size)
+        if self.seconds_per_event:
+            batch_size = min(batch_size, int(self.max_interval / self.seconds_per_event))
+        self.batch_size = max(self.min_batch_size, min(batch_size, self.max_batch_size))
+        self.interval = self.max_interval if self.queue_size else self.min_interval
+
+
+FLUSH_POLICIES = {policy.name: policy for policy in (FixedFlushPolicy, AdaptiveFlushPolicy)}
+
+
+def get_flush_policy(name):
+    try:
+        return FLUSH_POLICIES[name]()
+    except KeyError:
+        logger.error(f'Unknown JOB_EVENT_FLUSH_POLICY {name}, falling back to {FixedFlushPolicy.name}')
+        return FixedFlushPolicy()
@@ -0,0 +1,90 @@
+import logging
+
+from django.db import connection, transaction
+
+from psycopg import sql
+
+logger = logging.getLogger('awx.main.commands.run_callback_receiver')
+
+
+class BulkCreateIngestEngine:
+    """
+    Persists a batch of buffered events with a single Django bulk_create().
+    """
+
+    name = 'bulk_create'
+
+    def insert(self, cls, events):
+        cls.objects.bulk_create(events)
+
+
+class CopyIngestEngine(BulkCreateIngestEngine):
+    """
+    Streams a batch of buffered events into the (partitioned) event table
+    with PostgreSQL `COPY ... FROM STDIN`.
+
+    COPY does not hand back generated primary keys, and the callback receiver
+    needs them to broadcast events over websockets, so ids are reserved from
+    the table's sequence up front and written explicitly.
+    """
+
+    name = 'copy'
+
+    def __init__(self):
+        self._id_defaults = {}
+
+    def _id_default(self, cursor, table):
+        # the partitioned event tables were created with LIKE ... INCLUDING ALL,
+        # so the sequence is not "owned" by the column and
+        # pg_get_serial_sequence() can't be used to find it
+        if table not in self._id_defaults:
+            cursor.execute(
+                'SELECT pg_get_expr(d.adbin, d.adrelid) FROM pg_attrdef d '
+                'JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum '
+                'WHERE d.adrelid = %s::regclass AND a.attname = %s',
+                [table, 'id'],
+            )
+            self._id_defaults[table] = cursor.fetchone()[0]
+        return self._id_defaults[table]
+
+    def _reserve_ids(self, cursor, table, count):
+        cursor.execute(sql.SQL('SELECT {} FROM generate_series(1, %s)').format(sql.SQL(self._id_default(cursor, table))), [count])
+        return [row[0] for row in cursor.fetchall()]
+
+    def insert(self, cls, events):
+        if connection.vendor != 'postgresql':
+            return super(CopyIngestEngine, self).insert(cls, events)
+
+        table = cls._meta.db_table
+        fields = cls._meta.concrete_fields
+        copy_sql = sql.SQL('COPY {} ({}) FROM STDIN').format(
+            sql.Identifier(table),
+            sql.SQL(', ').join(sql.Identifier(f.column) for f in fields),
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                new_ids = iter(self._reserve_ids(cursor, table, sum(1 for e in events if e.pk is None)))
+                ids = [e.pk if e.pk is not None else next(new_ids) for e in events]
+                with cursor.copy(copy_sql) as copy:
+                    for pk, e in zip(ids, events):
+                        row = []
+                        for f in fields:
+                            value = pk if f.primary_key else getattr(e, f.attname)
+                            row.append(f.get_db_prep_save(value, connection))
+                        copy.write_row(row)
+        # only hand out the reserved ids once the rows are committed, so that
+        # a failed batch can be retried as unsaved events
+        for pk, e in zip(ids, events):
+            e.pk = pk
+            e._state.adding = False
+
+
+INGEST_ENGINES = {engine.name: engine for engine in (BulkCreateIngestEngine, CopyIngestEngine)}
+
+
+def get_ingest_engine(name):
+    try:
+        return INGEST_ENGINES[name]()
+    except KeyError:
+        logger.error(f'Unknown JOB_EVENT_INGEST_ENGINE {name}, falling back to {BulkCreateIngestEngine.name}')
+        return BulkCreateIngestEngine()
@@ -43,6 +43,7 @@ from rest_framework import serializers
 # AWX
 from awx.main.utils.filters import SmartFilter
 from awx.main.utils.encryption import encrypt_value, decrypt_value, get_encryption_key
+from awx.main.utils.json_codec import PreEncodedJSON
 from awx.main.validators import validate_ssh_private_key
 from awx.main.constants import ENV_BLOCKLIST
 from awx.main import utils
@@ -99,6 +100,13 @@ class JSONBlob(JSONField):
         return value
 
     def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, PreEncodedJSON):
+            # the callback receiver hands over event_data along with the JSON
+            # it was decoded from, so there is no need to encode it again
+            dumped_value = value.encoded.decode('utf-8')
+            if "\x00" in dumped_value:
+                dumped_value = dumped_value.replace("\x00", '')
+            return dumped_value
         if not prepared:
             value = self.get_prep_value(value)
         try:
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from awx.main.models import AdHocCommand, InventoryUpdate, Job, ProjectUpdate, SystemJob, WorkflowJob
+from awx.main.scheduler.dependency_graph import DependencyGraph
+
+
+def sample_task(id, templates):
+    """An unsaved task of a random type, pointing at one of templates projects, inventories and templates"""
+    kind = random.random()
+    ref = random.randrange(1, templates + 1)
+    if kind < 0.7:
+        return Job(id=id, job_template_id=ref, project_id=ref, inventory_id=ref, allow_simultaneous=random.random() < 0.5)
+    elif kind < 0.8:
+        return ProjectUpdate(id=id, project_id=ref)
+    elif kind < 0.9:
+        return InventoryUpdate(id=id, inventory_id=ref, inventory_source_id=ref)
+    elif kind < 0.95:
+        return WorkflowJob(id=id, workflow_job_template_id=templates + ref, allow_simultaneous=False)
+    elif kind < 0.99:
+        return AdHocCommand(id=id, inventory_id=ref)
+    return SystemJob(id=id)
+
+
+class Command(BaseCommand):
+    help = 'Measure how long the task manager spends checking pending tasks against running tasks in the DependencyGraph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending', dest='pending', type=int, default=10000, help='Number of pending tasks to check')
+        parser.add_argument('--running', dest='running', type=int, default=2000, help='Number of running tasks in the graph')
+        parser.add_argument('--templates', dest='templates', type=int, default=500, help='Number of distinct templates, projects and inventories')
+        parser.add_argument('--cycles', dest='cycles', type=int, default=5, help='Number of task manager cycles to time')
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        running = [sample_task(i, options['templates']) for i in range(options['running'])]
+        pending = [sample_task(options['running'] + i, options['templates']) for i in range(options['pending'])]
+
+        build, check, blocked = [], [], 0
+        for _ in range(options['cycles']):
+            started = time.perf_counter()
+            graph = DependencyGraph()
+            graph.add_jobs(running)
+            built = time.perf_counter()
+            blocked = 0
+            for task in pending:
+                blocked_by = graph.task_blocked_by(task)
+                if blocked_by:
+                    graph.explain(blocked_by)
+                    blocked += 1
+                else:
+                    # as the task manager does when it starts a task
+                    graph.add_job(task)
+            check.append(time.perf_counter() - built)
+            build.append(built - started)
+
+        self.stdout.write(f'{len(running)} running, {len(pending)} pending ({blocked} blocked), best of {options["cycles"]} cycles')
+        self.stdout.write(f'add running tasks:   {min(build) * 1000:8.2f} ms')
+        self.stdout.write(f'check pending tasks: {min(check) * 1000:8.2f} ms ({min(check) / max(len(pending), 1) * 1e6:.2f} us per task)')
@@ -0,0 +1,80 @@
+import json
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from awx.main.models import JobEvent
+from awx.main.utils.json_codec import JSON_CODECS, get_json_codec
+
+
+def sample_event(counter, hosts):
+    res = {
+        'changed': counter % 3 == 0,
+        'msg': 'All items completed',
+        'results': [{'item': f'package-{i}', 'changed': i % 2 == 0, 'rc': 0, 'stdout': 'ok ' * 20} for i in range(hosts)],
+        'invocation': {'module_args': {'name': 'httpd', 'state': 'present', 'update_cache': True}},
+    }
+    return {
+        'uuid': str(uuid4()),
+        'counter': counter,
+        'stdout': '\x1b[0;33mchanged: [host-{0}] => (item=package-{0})\x1b[0m'.format(counter),
+        'start_line': counter,
+        'end_line': counter + 1,
+        'runner_ident': str(uuid4()),
+        'event': 'runner_on_ok',
+        'job_id': 1,
+        'created': '2026-01-01T00:00:00.000000',
+        'parent_uuid': str(uuid4()),
+        'event_data': {
+            'playbook': 'site.yml',
+            'play': 'Configure web servers',
+            'task': 'Install packages',
+            'task_action': 'ansible.builtin.package',
+            'host': f'host-{counter}',
+            'res': res,
+            'guid': str(uuid4()),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure callback event throughput (events/sec) of each JSON codec, from publishing an event to preparing it for the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', dest='events', type=int, default=20000, help='Number of events to encode and decode per codec')
+        parser.add_argument('--items', dest='items', type=int, default=10, help='Number of loop items in the res of each event, to vary event size')
+
+    def time_pipeline(self, events, publish, receive, store):
+        started = time.perf_counter()
+        messages = [publish(e) for e in events]
+        published = time.perf_counter()
+        bodies = [receive(m) for m in messages]
+        received = time.perf_counter()
+        for body in bodies:
+            store(body['event_data'])
+        stored = time.perf_counter()
+        return published - started, received - published, stored - received
+
+    def handle(self, *args, **options):
+        events = [sample_event(i, options['items']) for i in range(options['events'])]
+        field = JobEvent._meta.get_field('event_data')
+
+        def prep(event_data):
+            return field.get_db_prep_value(event_data, connection)
+
+        pipelines = []
+        for name in JSON_CODECS:
+            codec = get_json_codec(name)
+            if codec.name != name:
+                self.stdout.write(f'{name} is not installed, skipping')
+                continue
+            pipelines.append((name, codec.encode_event, codec.decode_event, prep))
+
+        self.stdout.write(f'{len(events)} events, {len(json.dumps(events[0]))} bytes each')
+        self.stdout.write('{:<12} {:>12} {:>12} {:>12} {:>12}'.format('codec', 'publish/s', 'receive/s', 'store/s', 'total/s'))
+        for name, publish, receive, store in pipelines:
+            timings = self.time_pipeline(events, publish, receive, store)
+            rates = [len(events) / t for t in timings] + [len(events) / sum(timings)]
+            self.stdout.write('{:<12} {:>12.0f} {:>12.0f} {:>12.0f} {:>12.0f}'.format(name, *rates))
@@ -0,0 +1,76 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from awx.main.models import Role
+
+ENGINES = ('iterative', 'closure')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how long rebuilding role ancestors takes with each ROLE_ANCESTRY_REBUILD_ENGINE, on a generated role graph. '
+        'Everything is done in a transaction which is rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', dest='roles', type=int, default=100000, help='Number of roles in the graph')
+        parser.add_argument('--layers', dest='layers', type=int, default=6, help='Number of layers the roles are spread over')
+        parser.add_argument('--parents', dest='parents', type=int, default=3, help='Maximum number of parents (in the layer above) of a role')
+        parser.add_argument('--top-roles', dest='top_roles', type=int, default=200, help='Number of roles in the first layer given a new parent')
+
+    def build_graph(self, options):
+        """Roles in layers, where each role below the first has 1 to --parents parents in the layer above it"""
+        per_layer = max(options['roles'] // options['layers'], 1)
+        layers = []
+        for _ in range(options['layers']):
+            layers.append([role.id for role in Role.objects.bulk_create([Role(role_field='read_role') for _ in range(per_layer)], batch_size=5000)])
+        edges = []
+        for above, layer in zip(layers, layers[1:]):
+            for role_id in layer:
+                for parent_id in random.sample(above, min(random.randint(1, options['parents']), len(above))):
+                    edges.append(Role.parents.through(from_role_id=role_id, to_role_id=parent_id))
+        Role.parents.through.objects.bulk_create(edges, batch_size=5000)
+        return layers, len(edges)
+
+    def time_engines(self, rebuild):
+        timings = {}
+        for engine in ENGINES:
+            sid = transaction.savepoint()
+            with override_settings(ROLE_ANCESTRY_REBUILD_ENGINE=engine):
+                started = time.perf_counter()
+                rebuild()
+                timings[engine] = time.perf_counter() - started
+            transaction.savepoint_rollback(sid)
+        return timings
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        with transaction.atomic():
+            layers, edge_ct = self.build_graph(options)
+            roles = sum(len(layer) for layer in layers)
+            self.stdout.write(f'{roles} roles in {len(layers)} layers, {edge_ct} parent relations')
+
+            results = [('build all ancestors', self.time_engines(lambda: Role.rebuild_role_ancestor_list(layers[0], [])))]
+            with override_settings(ROLE_ANCESTRY_REBUILD_ENGINE='closure'):
+                Role.rebuild_role_ancestor_list(layers[0], [])
+
+            # a new parent of many roles high up in the graph, like a team given roles on an organization
+            new_parent = Role.objects.create(role_field='member_role')
+            top_roles = layers[0][: options['top_roles']]
+            Role.parents.through.objects.bulk_create([Role.parents.through(from_role_id=role_id, to_role_id=new_parent.id) for role_id in top_roles])
+            results.append(('add a parent to top roles', self.time_engines(lambda: Role.rebuild_role_ancestor_list(top_roles, []))))
+            with override_settings(ROLE_ANCESTRY_REBUILD_ENGINE='closure'):
+                Role.rebuild_role_ancestor_list(top_roles, [])
+
+            Role.parents.through.objects.filter(to_role_id=new_parent.id).delete()
+            results.append(('remove it again', self.time_engines(lambda: Role.rebuild_role_ancestor_list([], top_roles))))
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'{"":28} ' + ' '.join(f'{engine:>12}' for engine in ENGINES))
+        for name, timings in results:
+            self.stdout.write(f'{name:28} ' + ' '.join(f'{timings[engine] * 1000:10.1f}ms' for engine in ENGINES))
@@ -16,7 +16,17 @@ from django.db.models.signals import pre_save, post_save, pre_delete, post_delet
 from django.utils.timezone import now
 
 # AWX
-from awx.main.models import Job, AdHocCommand, ProjectUpdate, InventoryUpdate, SystemJob, WorkflowJob, Notification
+from awx.main.models import (
+    Job,
+    AdHocCommand,
+    ProjectUpdate,
+    InventoryUpdate,
+    SystemJob,
+    WorkflowJob,
+    Notification,
+    UnifiedJobStdoutArchive,
+    UnifiedJobStdoutArchiveChunk,
+)
 from awx.main.utils import unified_job_class_to_event_table_name
 
 
@@ -199,6 +209,7 @@ class Command(BaseCommand):
         parser.add_argument('--management-jobs', default=False, action='store_true', dest='only_management_jobs', help='Remove management jobs')
         parser.add_argument('--notifications', dest='only_notifications', action='store_true', default=False, help='Remove notifications')
         parser.add_argument('--workflow-jobs', default=False, action='store_true', dest='only_workflow_jobs', help='Remove workflow jobs')
+        parser.add_argument('--stdout-archives', default=False, action='store_true', dest='only_stdout_archives', help='Remove compressed stdout archives')
 
     def init_logging(self):
         log_levels = dict(enumerate([logging.ERROR, logging.INFO, logging.DEBUG, 0]))
@@ -462,6 +473,21 @@ class Command(BaseCommand):
         skipped += Notification.objects.filter(created__gte=self.cutoff).count()
         return skipped, deleted
 
+    def cleanup_stdout_archives(self):
+        # an archive is a copy of the stdout in the events of its job, which
+        # serves stdout again once the archive is gone; the archive row is
+        # kept, marked expired, so that reading the job does not archive it again
+        archives = UnifiedJobStdoutArchive.objects.filter(created__lt=self.cutoff, expired=False)
+        deleted = archives.count()
+        action_text = 'would delete' if self.dry_run else 'deleting'
+        self.logger.info('%s %d stdout archives', action_text, deleted)
+        if not self.dry_run:
+            UnifiedJobStdoutArchiveChunk.objects.filter(archive__in=archives).delete()
+            archives.update(expired=True, line_count=0, size=0)
+
+        skipped = UnifiedJobStdoutArchive.objects.filter(created__gte=self.cutoff, expired=False).count()
+        return skipped, deleted
+
     def handle(self, *args, **options):
         self.verbosity = int(options.get('verbosity', 1))
         self.init_logging()
@@ -473,7 +499,16 @@ class Command(BaseCommand):
         except OverflowError:
             raise CommandError('--days specified is too large. Try something less than 99999 (about 270 years).')
 
-        model_names = ('jobs', 'ad_hoc_commands', 'project_updates', 'inventory_updates', 'management_jobs', 'workflow_jobs', 'notifications')
+        model_names = (
+            'jobs',
+            'ad_hoc_commands',
+            'project_updates',
+            'inventory_updates',
+            'management_jobs',
+            'workflow_jobs',
+            'notifications',
+            'stdout_archives',
+        )
         models_to_cleanup = set()
         for m in model_names:
             if options.get('only_%s' % m, False):
@@ -508,6 +543,8 @@ class Command(BaseCommand):
         if not self.dry_run:
             with transaction.atomic():
                 for m in models_to_cleanup:
+                    if m == 'stdout_archives':
+                        continue  # archived stdout files, not a unified job model
                     unified_job_class_name = m[:-1].title().replace('Management', 'System').replace('_', '')
                     unified_job_class = apps.get_model('main', unified_job_class_name)
                     try:
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from awx.main.utils.profiling import load_cycle_profiles
+
+
+class Command(BaseCommand):
+    """
+    Summarize the task manager runs recorded with AWX_TASK_MANAGER_PROFILE enabled
+    """
+
+    help = 'Summarize the last profiled runs of the task, dependency and workflow managers, phase by phase.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--last', dest='last', type=int, default=10, help='Number of most recent runs to summarize (default=10)')
+        parser.add_argument(
+            '--manager',
+            dest='managers',
+            action='append',
+            choices=['task_manager', 'dependency_manager', 'workflow_manager'],
+            help='Only summarize this manager, may be given more than once (default=all)',
+        )
+        parser.add_argument('--dir', dest='dest', default=None, help='Directory the profiles were written to (default=AWX_TASK_MANAGER_PROFILE_DIR)')
+
+    def summarize(self, name, runs):
+        self.stdout.write(f'{name}: {len(runs)} run(s)')
+        if not runs:
+            return
+        seconds = [run['seconds'] for run in runs]
+        queries = [run['queries'] for run in runs]
+        self.stdout.write(
+            f'  total: {sum(seconds) / len(runs):.3f}s mean, {max(seconds):.3f}s max, '
+            f'{sum(queries) / len(runs):.0f} queries mean, {max(queries)} queries max'
+        )
+        phases = {}
+        for run in runs:
+            for phase, data in run['phases'].items():
+                totals = phases.setdefault(phase, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'queries': 0, 'query_seconds': 0.0})
+                totals['calls'] += data['calls']
+                totals['seconds'] += data['seconds']
+                totals['max_seconds'] = max(totals['max_seconds'], data['seconds'])
+                totals['queries'] += data['queries']
+                totals['query_seconds'] += data['query_seconds']
+        self.stdout.write('  {:<32} {:>8} {:>10} {:>10} {:>10} {:>12}'.format('phase (per run)', 'calls', 'mean s', 'max s', 'queries', 'query s'))
+        for phase, totals in sorted(phases.items(), key=lambda item: -item[1]['seconds']):
+            self.stdout.write(
+                '  {:<32} {:>8.1f} {:>10.3f} {:>10.3f} {:>10.1f} {:>12.3f}'.format(
+                    phase,
+                    totals['calls'] / len(runs),
+                    totals['seconds'] / len(runs),
+                    totals['max_seconds'],
+                    totals['queries'] / len(runs),
+                    totals['query_seconds'] / len(runs),
+                )
+            )
+
+    def handle(self, *args, **options):
+        dest = options['dest'] or settings.AWX_TASK_MANAGER_PROFILE_DIR
+        if not settings.AWX_TASK_MANAGER_PROFILE:
+            self.stdout.write('AWX_TASK_MANAGER_PROFILE is disabled, only runs recorded while it was enabled are shown')
+        for name in options['managers'] or ['task_manager', 'dependency_manager', 'workflow_manager']:
+            self.summarize(name, load_cycle_profiles(dest, name, last=options['last']))
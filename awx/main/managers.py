@@ -123,6 +123,15 @@ class HostManager(models.Manager.from_queryset(HostLatestSummaryQuerySet)):
             .count()
         )
 
+    def smart_filter_matches(self, smart_inventory):
+        """Return every host matched by the host_filter of a smart inventory,
+        before the hosts by the same name are narrowed down to one.
+        """
+        q = SmartFilter.query_from_string(smart_inventory.host_filter)
+        if smart_inventory.organization_id:
+            q = q.filter(inventory__organization=smart_inventory.organization_id)
+        return q
+
     def get_queryset(self):
         """When the parent instance of the host query set has a `kind=smart` and a `host_filter`
         set. Use the `host_filter` to generate the queryset for the hosts.
@@ -131,9 +140,7 @@ class HostManager(models.Manager.from_queryset(HostLatestSummaryQuerySet)):
 
         if hasattr(self, 'instance') and hasattr(self.instance, 'host_filter') and hasattr(self.instance, 'kind'):
             if self.instance.kind == 'smart' and self.instance.host_filter is not None:
-                q = SmartFilter.query_from_string(self.instance.host_filter)
-                if self.instance.organization_id:
-                    q = q.filter(inventory__organization=self.instance.organization_id)
+                q = self.smart_filter_matches(self.instance)
                 # If we are using host_filters, disable the core_filters, this allows
                 # us to access all of the available Host entries, not just the ones associated
                 # with a specific FK/relation.
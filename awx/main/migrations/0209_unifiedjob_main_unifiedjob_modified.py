@@ -0,0 +1,17 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0208_alter_job_skip_tags_alter_jobtemplate_skip_tags'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unifiedjob',
+            index=models.Index(fields=['modified'], name='main_unifiedjob_modified'),
+        ),
+    ]
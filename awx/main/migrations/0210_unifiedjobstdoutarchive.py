@@ -0,0 +1,58 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0209_unifiedjob_main_unifiedjob_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnifiedJobStdoutArchive',
+            fields=[
+                (
+                    'unified_job',
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='stdout_archive',
+                        serialize=False,
+                        to='main.unifiedjob',
+                    ),
+                ),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('line_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('size', models.BigIntegerField(default=0, editable=False, help_text='Uncompressed size of the archived stdout.')),
+                (
+                    'expired',
+                    models.BooleanField(
+                        default=False,
+                        editable=False,
+                        help_text='The chunks of this archive were removed by cleanup_jobs, so the stdout of its job is read from the events.',
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UnifiedJobStdoutArchiveChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_line', models.PositiveIntegerField(editable=False)),
+                ('end_line', models.PositiveIntegerField(editable=False)),
+                ('data', models.BinaryField(editable=False)),
+                (
+                    'archive',
+                    models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='main.unifiedjobstdoutarchive'),
+                ),
+            ],
+            options={
+                'indexes': [models.Index(fields=['archive', 'start_line'], name='main_stdoutchunk_start_line')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0210_unifiedjobstdoutarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobEventsChildrenSummary',
+            fields=[
+                (
+                    'job',
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='events_children_summary',
+                        serialize=False,
+                        to='main.job',
+                    ),
+                ),
+                ('is_tree', models.BooleanField(default=True, editable=False)),
+                ('children', models.JSONField(default=list, editable=False)),
+                ('meta_event_parents', models.JSONField(default=list, editable=False)),
+            ],
+        ),
+    ]
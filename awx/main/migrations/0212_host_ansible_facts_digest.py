@@ -0,0 +1,24 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0211_jobeventschildrensummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='ansible_facts_digest',
+            field=models.CharField(
+                blank=True,
+                default='',
+                editable=False,
+                help_text='SHA-256 digest of ansible_facts, used to detect unchanged facts without loading them.',
+                max_length=64,
+            ),
+        ),
+    ]
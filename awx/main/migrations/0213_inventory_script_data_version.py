@@ -0,0 +1,24 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0212_host_ansible_facts_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='script_data_version',
+            field=models.UUIDField(
+                default=uuid.uuid4,
+                editable=False,
+                help_text='Changes whenever the hosts, groups or variables of this inventory change, used to version its cached script data.',
+            ),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.16 on 2026-10-18 12:00
+
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from ._sqlite_helper import dbawaremigrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0213_inventory_script_data_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleAccessState',
+            fields=[
+                (
+                    'user',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                ('version', models.UUIDField(default=uuid.uuid4, editable=False)),
+            ],
+            options={
+                'db_table': 'main_rbac_access_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='AccessibleObjectSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role_field', models.TextField()),
+                ('content_types', models.TextField()),
+                ('version', models.UUIDField()),
+                (
+                    'user',
+                    models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            options={
+                'db_table': 'main_rbac_accessible_object_sets',
+                'constraints': [
+                    models.UniqueConstraint(fields=('user', 'role_field', 'content_types', 'version'), name='main_rbac_accessible_object_set_uniq')
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='AccessibleObjectEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                (
+                    'object_set',
+                    models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.accessibleobjectset'),
+                ),
+            ],
+            options={
+                'db_table': 'main_rbac_accessible_objects',
+                'indexes': [models.Index(fields=['object_set', 'object_id'], name='main_rbac_a_object__556afa_idx')],
+            },
+        ),
+        # the sets are rebuilt from role ancestors on demand, so they are not worth writing to the WAL
+        dbawaremigrations.RunSQL(
+            [
+                'ALTER TABLE main_rbac_accessible_objects SET UNLOGGED;',
+                'ALTER TABLE main_rbac_accessible_object_sets SET UNLOGGED;',
+            ],
+            reverse_sql=[
+                'ALTER TABLE main_rbac_accessible_object_sets SET LOGGED;',
+                'ALTER TABLE main_rbac_accessible_objects SET LOGGED;',
+            ],
+            sqlite_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -10,7 +10,13 @@ from ansible_base.lib.utils.models import prevent_search
 
 # AWX
 from awx.main.models.base import BaseModel, PrimordialModel, accepts_json, CLOUD_INVENTORY_SOURCES, VERBOSITY_CHOICES  # noqa
-from awx.main.models.unified_jobs import UnifiedJob, UnifiedJobTemplate, StdoutMaxBytesExceeded  # noqa
+from awx.main.models.unified_jobs import (  # noqa
+    UnifiedJob,
+    UnifiedJobTemplate,
+    UnifiedJobStdoutArchive,
+    UnifiedJobStdoutArchiveChunk,
+    StdoutMaxBytesExceeded,
+)
 from awx.main.models.organization import Organization, Profile, Team, UserSessionMembership  # noqa
 from awx.main.models.credential import Credential, CredentialType, CredentialInputSource, ManagedCredentialType, build_safe_env  # noqa
 from awx.main.models.projects import Project, ProjectUpdate  # noqa
@@ -39,6 +45,7 @@ from awx.main.models.events import (  # noqa
     AdHocCommandEvent,
     InventoryUpdateEvent,
     JobEvent,
+    JobEventsChildrenSummary,
     ProjectUpdateEvent,
     SystemJobEvent,
     UnpartitionedAdHocCommandEvent,
@@ -59,6 +66,7 @@ from awx.main.models.ha import (  # noqa
 )
 from awx.main.models.rbac import (  # noqa
     Role,
+    AccessibleObjectSet,
     batch_role_ancestor_rebuilding,
     role_summary_fields_generator,
     ROLE_SINGLETON_SYSTEM_ADMINISTRATOR,
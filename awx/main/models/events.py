@@ -8,7 +8,7 @@ import time
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models, DatabaseError
+from django.db import models, transaction, DatabaseError, IntegrityError
 from django.db.models.functions import Cast
 from django.utils.dateparse import parse_datetime
 from django.utils.text import Truncator
@@ -23,12 +23,13 @@ from awx.main.managers import DeferJobCreatedManager
 from awx.main.constants import MINIMAL_EVENTS
 from awx.main.models.base import CreatedModifiedModel
 from awx.main.utils import ignore_inventory_computed_fields, camelcase_to_underscore
+from awx.main.utils.json_codec import PreEncodedJSON
 
 analytics_logger = logging.getLogger('awx.analytics.job_events')
 
 logger = logging.getLogger('awx.main.models.events')
 
-__all__ = ['JobEvent', 'ProjectUpdateEvent', 'AdHocCommandEvent', 'InventoryUpdateEvent', 'SystemJobEvent']
+__all__ = ['JobEvent', 'JobEventsChildrenSummary', 'ProjectUpdateEvent', 'AdHocCommandEvent', 'InventoryUpdateEvent', 'SystemJobEvent']
 
 
 def sanitize_event_keys(kwargs, valid_keys):
@@ -41,6 +42,9 @@ def sanitize_event_keys(kwargs, valid_keys):
     for key in ['play', 'role', 'task', 'playbook']:
         if isinstance(kwargs.get('event_data', {}).get(key), str):
             if len(kwargs['event_data'][key]) > 1024:
+                if isinstance(kwargs['event_data'], PreEncodedJSON):
+                    # the pre-encoded JSON will no longer match
+                    kwargs['event_data'] = dict(kwargs['event_data'])
                 kwargs['event_data'][key] = Truncator(kwargs['event_data'][key]).chars(1024)
 
 
@@ -620,6 +624,155 @@ class UnpartitionedJobEvent(JobEvent):
 UnpartitionedJobEvent._meta.db_table = '_unpartitioned_' + JobEvent._meta.db_table  # noqa
 
 
+class JobEventsChildrenSummary(models.Model):
+    """
+    The tree summary of the events of a job, as served by the
+    job_events/children_summary endpoint, computed once all of its events are
+    saved.
+    """
+
+    class Meta:
+        app_label = 'main'
+
+    META_EVENTS = ('debug', 'verbose', 'warning', 'error', 'system_warning', 'deprecated')
+
+    job = models.OneToOneField(
+        'Job',
+        related_name='events_children_summary',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        editable=False,
+    )
+    is_tree = models.BooleanField(
+        default=True,
+        editable=False,
+    )
+    # [counter, row number, number of children] of each event with children
+    children = models.JSONField(
+        default=list,
+        editable=False,
+    )
+    # [counter, parent uuid] of each meta event which was assigned a parent
+    meta_event_parents = models.JSONField(
+        default=list,
+        editable=False,
+    )
+
+    @classmethod
+    def create_for_job(cls, job):
+        """
+        Computes and saves the summary of a job whose event processing is
+        finished.
+        """
+        events = job.get_event_queryset().order_by('counter').values_list('counter', 'uuid', 'parent_uuid', 'event')
+        summary = cls(job=job, **cls.compute(list(events.iterator())))
+        try:
+            with transaction.atomic():
+                summary.save(force_insert=True)
+        except IntegrityError:
+            pass  # computed by a concurrent request
+        return summary
+
+    @classmethod
+    def compute(cls, events):
+        """
+        Tallies the children (including children of children, etc.) of each
+        of the (counter, uuid, parent_uuid, event) rows, in counter order.
+        """
+        if not events:
+            return dict(is_tree=True, children=[], meta_event_parents=[])
+
+        is_meta = [event in cls.META_EVENTS for counter, uuid, parent_uuid, event in events]
+        # index of the first non meta event at or after each position
+        next_non_meta = [len(events) - 1] * len(events)
+        following = len(events) - 1
+        for i in range(len(events) - 1, -1, -1):
+            if not is_meta[i]:
+                following = i
+            next_non_meta[i] = following
+
+        # key is uuid, value is [counter, row number, number of children]
+        tally = {}
+        # key is uuid, value is parent uuid. Used as a quick lookup
+        parents = {}
+        for i, (counter, uuid, parent_uuid, event) in enumerate(events):
+            tally[uuid] = [counter, 0, 0]
+            parents[uuid] = parent_uuid
+        meta_event_parents = []
+
+        # collapsible tree view in the UI only makes sense for tree-like
+        # hierarchy. If ansible is ran with a strategy like free or host_pinned, then
+        # events can be out of sequential order, and no longer follow a tree structure
+        # E1
+        #  E2
+        # E3
+        #  E4  <- parent is E3
+        #  E5  <- parent is E1
+        # in the above, there is no clear way to collapse E1, because E5 comes after
+        # E3, which occurs after E1. Thus the tree view should be disabled.
+
+        # mark the last seen uuid at a given level (0-3)
+        # if a parent uuid is not in this list, then we know the events are not tree-like
+        level_current_uuid = [None, None, None, None]
+
+        prev_non_meta_event = events[0]
+        for i, (counter, uuid, parent_uuid, event) in enumerate(events):
+            if not is_meta[i]:
+                prev_non_meta_event = events[i]
+            if not uuid:
+                continue
+
+            if not is_meta[i]:
+                level = JobEvent.LEVEL_FOR_EVENT[event]
+                level_current_uuid[level] = uuid
+                # if setting level 1, for example, set levels 2 and 3 back to None
+                for u in range(level + 1, len(level_current_uuid)):
+                    level_current_uuid[u] = None
+
+            puuid = parent_uuid
+            if puuid and puuid not in level_current_uuid:
+                # improper tree detected, so bail out early
+                return dict(is_tree=False, children=[], meta_event_parents=[])
+
+            # if event is verbose (or debug, etc), we need to "assign" it a
+            # parent. The verbose event is assigned the parent uuid of the
+            # higher level of the previous and the next non-verbose event.
+            # e.g.
+            # E1
+            #  E2
+            # verbose
+            # verbose <- we are on this event currently
+            #    E4
+            # We'll compare E2 and E4, and the verbose event
+            # will be assigned the parent uuid of E4 (higher event level)
+            if is_meta[i]:
+                event_level_before = JobEvent.LEVEL_FOR_EVENT[prev_non_meta_event[3]]
+                next_non_meta_event = events[next_non_meta[i]]
+                event_level_after = JobEvent.LEVEL_FOR_EVENT[next_non_meta_event[3]]
+                if event_level_after and event_level_after > event_level_before:
+                    puuid = next_non_meta_event[2]
+                else:
+                    puuid = prev_non_meta_event[2]
+                if puuid:
+                    meta_event_parents.append([counter, puuid])
+            tally[uuid][1] = i
+            # now traverse up the parent, grandparent, etc. events and tally those
+            while puuid:
+                tally[puuid][2] += 1
+                puuid = parents.get(puuid, None)
+
+        children = sorted(entry for entry in tally.values() if entry[2] != 0)
+        return dict(is_tree=True, children=children, meta_event_parents=meta_event_parents)
+
+    @property
+    def children_summary(self):
+        return {counter: {"rowNumber": row, "numChildren": num_children} for counter, row, num_children in self.children}
+
+    @property
+    def meta_event_nested_uuid(self):
+        return {counter: uuid for counter, uuid in self.meta_event_parents}
+
+
 class ProjectUpdateEvent(BasePlaybookEvent):
     VALID_KEYS = BasePlaybookEvent.VALID_KEYS + ['project_update_id', 'workflow_job_id', 'job_created']
     JOB_REFERENCE = 'project_update_id'
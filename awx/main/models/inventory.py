@@ -10,7 +10,11 @@ import time
 import logging
 import re
 import copy
+import itertools
 import os.path
+import json
+import threading
+import uuid
 from urllib.parse import urljoin
 
 import yaml
@@ -21,6 +25,7 @@ from django.db import models, connection
 from django.utils.translation import gettext_lazy as _
 from django.db import transaction
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import resolve
 from django.utils.timezone import now
 from django.db.models import Q, Subquery, OuterRef
@@ -54,6 +59,7 @@ from awx.main.models.notifications import (
 )
 from awx.main.models.credential.injectors import _openstack_data
 from awx.main.utils import _inventory_updates
+from awx.main.utils.common import get_memoize_cache
 from awx.main.utils.safe_yaml import sanitize_jinja
 from awx.main.utils.execution_environments import to_container_path, get_control_plane_execution_environment
 from awx.main.utils.licensing import server_product_name
@@ -62,6 +68,31 @@ __all__ = ['Inventory', 'Host', 'Group', 'InventorySource', 'InventoryUpdate', '
 
 logger = logging.getLogger('awx.main.models.inventory')
 
+_script_data_invalidations = threading.local()
+
+# rows of inventory script source read, and cached, at a time
+SCRIPT_SOURCE_CHUNK_SIZE = 1000
+# characters of inventory script JSON yielded at a time
+SCRIPT_DATA_JSON_CHUNK_SIZE = 65536
+
+
+class _RowsByGroup:
+    """
+    Takes the (group id, value) rows of a group membership query, ordered
+    like the groups they are merged with, one group at a time
+    """
+
+    def __init__(self, rows):
+        self.grouped = itertools.groupby(rows, key=lambda row: row[0])
+        self.current = next(self.grouped, None)
+
+    def take(self, group_id):
+        if self.current is None or self.current[0] != group_id:
+            return []
+        values = [row[1] for row in self.current[1]]
+        self.current = next(self.grouped, None)
+        return values
+
 
 class InventoryConstructedInventoryMembership(models.Model):
     constructed_inventory = models.ForeignKey('Inventory', on_delete=models.CASCADE, related_name='constructed_inventory_memberships')
@@ -194,6 +225,11 @@ class Inventory(CommonModelNameNotUnique, ResourceMixin, RelatedJobsMixin):
         editable=False,
         help_text=_('Flag indicating the inventory is being deleted.'),
     )
+    script_data_version = models.UUIDField(
+        default=uuid.uuid4,
+        editable=False,
+        help_text=_('Changes whenever the hosts, groups or variables of this inventory change, used to version its cached script data.'),
+    )
     labels = models.ManyToManyField(
         "Label",
         blank=True,
@@ -309,88 +345,216 @@ class Inventory(CommonModelNameNotUnique, ResourceMixin, RelatedJobsMixin):
             host_queryset = host_queryset[offset::slice_count]
         return host_queryset
 
-    def get_script_data(self, hostvars=False, towervars=False, show_all=False, slice_number=1, slice_count=1, slice_pinned_hosts=None):
-        hosts_kw = dict()
-        if not show_all:
-            hosts_kw['enabled'] = True
-        fetch_fields = ['name', 'id', 'variables', 'inventory_id']
-        if towervars:
-            fetch_fields.append('enabled')
-        host_queryset = self.hosts.filter(**hosts_kw).order_by('name').only(*fetch_fields)
-        hosts = self.get_sliced_hosts(host_queryset, slice_number, slice_count, pinned_hosts=slice_pinned_hosts)
-
-        data = dict()
-        all_group = data.setdefault('all', dict())
-        all_hostnames = set(host.name for host in hosts)
+    @classmethod
+    def invalidate_script_data(cls, inventory_id):
+        """
+        Give an inventory a new script_data_version, so script data cached for
+        the old version is no longer used.  Within a transaction this is done
+        once, unless script data was read since.
+        """
+        pending = _script_data_invalidations.__dict__.setdefault('pending', {})
+        if connection.in_atomic_block and pending.get(inventory_id) is connection.run_on_commit:
+            return
+        cls.objects.filter(pk=inventory_id).update(script_data_version=uuid.uuid4())
+        if connection.in_atomic_block:
+            # run_on_commit is replaced when the transaction, or a savepoint, rolls back
+            pending[inventory_id] = connection.run_on_commit
+            connection.on_commit(lambda: pending.pop(inventory_id, None))
+
+    def _build_script_source(self, section):
+        """
+        Yields a section of the script source of the inventory in chunks of
+        SCRIPT_SOURCE_CHUNK_SIZE rows, reading them with server-side cursors.
+        The 'hosts' section has [name, id, enabled, variables] for every host
+        ordered by name, the 'groups' section has [name, variables, host names,
+        child group names] for every group ordered by name.
+        """
+        if section == 'hosts':
+            hosts = self.hosts.order_by('name', 'id').only('name', 'id', 'variables', 'inventory_id', 'enabled')
+            rows = ([host.name, host.id, host.enabled, host.variables_dict] for host in hosts.iterator(chunk_size=SCRIPT_SOURCE_CHUNK_SIZE))
+        elif self.kind == 'smart':
+            return
+        else:
+            # memberships are read in the order of the groups, so each group takes its own as it goes
+            group_hosts = _RowsByGroup(
+                Group.hosts.through.objects.filter(group__inventory_id=self.id, host__inventory_id=self.id)
+                .order_by('group__name', 'group_id')
+                .values_list('group_id', 'host__name')
+                .iterator(chunk_size=SCRIPT_SOURCE_CHUNK_SIZE)
+            )
+            group_children = _RowsByGroup(
+                Group.parents.through.objects.filter(from_group__inventory_id=self.id, to_group__inventory_id=self.id)
+                .order_by('to_group__name', 'to_group_id')
+                .values_list('to_group_id', 'from_group__name')
+                .iterator(chunk_size=SCRIPT_SOURCE_CHUNK_SIZE)
+            )
+            groups = self.groups.order_by('name', 'id').only('name', 'id', 'variables', 'inventory_id')
+            rows = (
+                [group.name, group.variables_dict, group_hosts.take(group.id), group_children.take(group.id)]
+                for group in groups.iterator(chunk_size=SCRIPT_SOURCE_CHUNK_SIZE)
+            )
+        while True:
+            chunk = list(itertools.islice(rows, SCRIPT_SOURCE_CHUNK_SIZE))
+            if not chunk:
+                return
+            yield chunk
 
+    def iter_script_source(self, section):
+        """
+        Yields the chunks of a section of the script source, from the cache
+        when they were stored for the current script_data_version.  Smart
+        inventories are not cached, their hosts change with other inventories.
+        """
+        timeout = settings.INVENTORY_SCRIPT_DATA_CACHE_TIMEOUT
+        if not timeout or self.kind == 'smart':
+            yield from self._build_script_source(section)
+            return
+        # reading script data means later changes in this transaction must invalidate it again
+        getattr(_script_data_invalidations, 'pending', {}).pop(self.id, None)
+        version = Inventory.objects.filter(pk=self.pk).values_list('script_data_version', flat=True).first()
+        key = 'awx-inventory-script-data-{}-{}-{}'.format(self.pk, version, section)
+        cache = get_memoize_cache()
+
+        yielded = 0
+        chunk_count = cache.get(key)
+        if chunk_count is not None:
+            for index in range(chunk_count):
+                serialized = cache.get('{}-{}'.format(key, index))
+                if serialized is None:
+                    break  # evicted, build the section again
+                yield json.loads(serialized)
+                yielded += 1
+            else:
+                return
+
+        chunk_count = 0
+        for index, chunk in enumerate(self._build_script_source(section)):
+            cache.set('{}-{}'.format(key, index), json.dumps(chunk, cls=DjangoJSONEncoder), timeout)
+            chunk_count += 1
+            if index >= yielded:
+                yield chunk
+        cache.set(key, chunk_count, timeout)
+
+    def _iter_script_hosts(self, show_all=False, slice_number=1, slice_count=1, slice_pinned_hosts=None):
+        """
+        Yields the script source rows of the hosts in the script data, in the
+        same slice get_sliced_hosts returns for them
+        """
+        sliced = slice_count > 1 and slice_number > 0
+        offset = slice_number - 1
+        pinned_hosts = set(slice_pinned_hosts or [])
+        index = -1
+        for chunk in self.iter_script_source('hosts'):
+            for host in chunk:
+                if not (show_all or host[2]):
+                    continue
+                if sliced and host[0] not in pinned_hosts:
+                    # pinned hosts are in every slice, the others are dealt round robin
+                    index += 1
+                    if index < offset or (index - offset) % slice_count:
+                        continue
+                yield host
+
+    def _iter_script_data(self, hostvars=False, towervars=False, show_all=False, slice_number=1, slice_count=1, slice_pinned_hosts=None):
+        """
+        Yields the script data of the inventory piece by piece: ('group',
+        name, info) for the groups with any content, the all group last, then
+        ('hostvars', name, variables) for every host if hostvars is set.
+        Only host names are held in memory, so this is how large inventories
+        are written out.
+        """
+        host_params = dict(show_all=show_all, slice_number=slice_number, slice_count=slice_count, slice_pinned_hosts=slice_pinned_hosts)
+        host_names = [host[0] for host in self._iter_script_hosts(**host_params)]
+
+        all_group = dict()
         if self.variables_dict:
             all_group['vars'] = self.variables_dict
 
         if self.kind == 'smart':
-            all_group['hosts'] = [host.name for host in hosts]
+            all_group['hosts'] = host_names
         else:
+            all_hostnames = set(host_names)
             # Keep track of hosts that are members of a group
             grouped_hosts = set([])
-
-            # Build in-memory mapping of groups and their hosts.
-            group_hosts_qs = Group.hosts.through.objects.filter(group__inventory_id=self.id, host__inventory_id=self.id).values_list(
-                'group_id', 'host_id', 'host__name'
-            )
-            group_hosts_map = {}
-            for group_id, host_id, host_name in group_hosts_qs:
-                if host_name not in all_hostnames:
-                    continue  # host might not be in current shard
-                group_hostnames = group_hosts_map.setdefault(group_id, [])
-                group_hostnames.append(host_name)
-                grouped_hosts.add(host_name)
-
-            # Build in-memory mapping of groups and their children.
-            group_parents_qs = Group.parents.through.objects.filter(
-                from_group__inventory_id=self.id,
-                to_group__inventory_id=self.id,
-            ).values_list('from_group_id', 'from_group__name', 'to_group_id')
-            group_children_map = {}
-            for from_group_id, from_group_name, to_group_id in group_parents_qs:
-                group_children = group_children_map.setdefault(to_group_id, [])
-                group_children.append(from_group_name)
-
-            # Add ungrouped hosts to all group
-            all_group['hosts'] = [host.name for host in hosts if host.name not in grouped_hosts]
-
-            # Now use in-memory maps to build up group info.
             all_group_names = []
-            for group in self.groups.only('name', 'id', 'variables', 'inventory_id'):
-                group_info = dict()
-                if group.id in group_hosts_map:
-                    group_info['hosts'] = group_hosts_map[group.id]
-                if group.id in group_children_map:
-                    group_info['children'] = group_children_map[group.id]
-                group_vars = group.variables_dict
-                if group_vars:
-                    group_info['vars'] = group_vars
-                if group_info:
-                    data[group.name] = group_info
-                all_group_names.append(group.name)
-
-            # add all groups as children of all group, includes empty groups
-            if all_group_names:
-                all_group['children'] = all_group_names
+            for chunk in self.iter_script_source('groups'):
+                for group_name, group_vars, group_hostnames, group_children in chunk:
+                    group_info = dict()
+                    # host might not be in current shard
+                    group_hostnames = [host_name for host_name in group_hostnames if host_name in all_hostnames]
+                    if group_hostnames:
+                        group_info['hosts'] = group_hostnames
+                        grouped_hosts.update(group_hostnames)
+                    if group_children:
+                        group_info['children'] = group_children
+                    if group_vars:
+                        group_info['vars'] = group_vars
+                    if group_info:
+                        if group_name == 'all':
+                            all_group = None  # a group named all with content replaces the all group
+                        yield ('group', group_name, group_info)
+                    all_group_names.append(group_name)
+
+            if all_group is not None:
+                # Add ungrouped hosts to all group
+                all_group['hosts'] = [host_name for host_name in host_names if host_name not in grouped_hosts]
+                # add all groups as children of all group, includes empty groups
+                if all_group_names:
+                    all_group['children'] = all_group_names
+        if all_group is not None:
+            yield ('group', 'all', all_group)
 
         if hostvars:
-            data.setdefault('_meta', dict())
-            data['_meta'].setdefault('hostvars', dict())
-            for host in hosts:
-                data['_meta']['hostvars'][host.name] = host.variables_dict
+            for host_name, host_id, host_enabled, host_vars in self._iter_script_hosts(**host_params):
                 if towervars:
                     for prefix in ('host', 'tower'):
-                        tower_dict = {
-                            f'remote_{prefix}_enabled': str(host.enabled).lower(),
-                            f'remote_{prefix}_id': host.id,
-                        }
-                        data['_meta']['hostvars'][host.name].update(tower_dict)
+                        host_vars[f'remote_{prefix}_enabled'] = str(host_enabled).lower()
+                        host_vars[f'remote_{prefix}_id'] = host_id
+                yield ('hostvars', host_name, host_vars)
 
+    def get_script_data(self, hostvars=False, towervars=False, show_all=False, slice_number=1, slice_count=1, slice_pinned_hosts=None):
+        data = dict(all=dict())
+        all_hostvars = dict()
+        for kind, name, value in self._iter_script_data(hostvars, towervars, show_all, slice_number, slice_count, slice_pinned_hosts):
+            if kind == 'group':
+                data[name] = value
+            else:
+                all_hostvars[name] = value
+        if hostvars:
+            data['_meta'] = dict(hostvars=all_hostvars)
         return data
 
+    def iter_script_data_json(self, host_map=None, **script_params):
+        """
+        Yields the JSON of get_script_data in chunks of about
+        SCRIPT_DATA_JSON_CHUNK_SIZE characters, without holding all of it in
+        memory.  Host ids are added to host_map, if given, by host name.
+        """
+        encoder = DjangoJSONEncoder()
+        buffer, buffered = ['{'], 1
+        separator = ''
+        in_hostvars = False
+        for kind, name, value in self._iter_script_data(**script_params):
+            if kind == 'hostvars':
+                if not in_hostvars:
+                    buffer.append(separator + '"_meta": {"hostvars": {')
+                    separator, in_hostvars = '', True
+                if host_map is not None:
+                    host_map[name] = value.get('remote_tower_id', '')
+            piece = separator + encoder.encode(name) + ': ' + encoder.encode(value)
+            separator = ', '
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= SCRIPT_DATA_JSON_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, buffered = [], 0
+        if in_hostvars:
+            buffer.append('}}')
+        elif script_params.get('hostvars'):
+            buffer.append(separator + '"_meta": {"hostvars": {}}')
+        buffer.append('}')
+        yield ''.join(buffer)
+
     def update_computed_fields(self):
         """
         Update model fields that are computed from database relationships.
@@ -440,7 +604,8 @@ class Inventory(CommonModelNameNotUnique, ResourceMixin, RelatedJobsMixin):
             tasks = self.jobs.filter(status="pending")
             for t in tasks:
                 t.task_impact = t._get_task_impact()
-            UnifiedJob.objects.bulk_update(tasks, ['task_impact'])
+                t.modified = now()
+            UnifiedJob.objects.bulk_update(tasks, ['task_impact', 'modified'])
         logger.debug("Finished updating inventory computed fields, pk={0}, in {1:.3f} seconds".format(self.pk, time.time() - start_time))
 
     def websocket_emit_status(self, status):
@@ -473,7 +638,8 @@ class Inventory(CommonModelNameNotUnique, ResourceMixin, RelatedJobsMixin):
             def on_commit():
                 from awx.main.tasks.system import update_host_smart_inventory_memberships
 
-                update_host_smart_inventory_memberships.delay()
+                # only this inventory's host_filter may have changed
+                update_host_smart_inventory_memberships.delay(inventory_id=self.pk)
 
             connection.on_commit(on_commit)
 
@@ -490,6 +656,11 @@ class Inventory(CommonModelNameNotUnique, ResourceMixin, RelatedJobsMixin):
 
     def save(self, *args, **kwargs):
         self._update_host_smart_inventory_memeberships()
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is None or {'variables', 'kind', 'host_filter'} & set(update_fields):
+            self.script_data_version = uuid.uuid4()
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['script_data_version']
         super(Inventory, self).save(*args, **kwargs)
         if self.kind == 'smart' and 'host_filter' in kwargs.get('update_fields', ['host_filter']) and connection.vendor != 'sqlite':
             # Minimal update of host_count for smart inventory host filter changes
@@ -590,6 +761,13 @@ class Host(CommonModelNameNotUnique, RelatedJobsMixin):
         default=dict,
         help_text=_('Arbitrary JSON structure of most recent ansible_facts, per-host.'),
     )
+    ansible_facts_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_('SHA-256 digest of ansible_facts, used to detect unchanged facts without loading them.'),
+    )
     ansible_facts_modified = models.DateTimeField(
         default=None,
         editable=False,
@@ -658,11 +836,15 @@ class Host(CommonModelNameNotUnique, RelatedJobsMixin):
 
     def _update_host_smart_inventory_memeberships(self):
         if settings.AWX_REBUILD_SMART_MEMBERSHIP:
+            # smart inventories keep one host per name, so a change can only affect hosts by this name, or the old one
+            host_names = {self.name}
+            if self.pk:
+                host_names.update(Host.objects.filter(pk=self.pk).values_list('name', flat=True))
 
             def on_commit():
                 from awx.main.tasks.system import update_host_smart_inventory_memberships
 
-                update_host_smart_inventory_memberships.delay()
+                update_host_smart_inventory_memberships.delay(host_names=sorted(host_names))
 
             connection.on_commit(on_commit)
 
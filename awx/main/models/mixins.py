@@ -7,6 +7,7 @@ import requests
 
 # Django
 from django.apps import apps
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models.query import QuerySet
@@ -16,7 +17,7 @@ from django.utils.translation import gettext_lazy as _
 from ansible_base.lib.utils.models import prevent_search
 
 # AWX
-from awx.main.models.rbac import Role, RoleAncestorEntry
+from awx.main.models.rbac import AccessibleObjectEntry, AccessibleObjectSet, Role, RoleAncestorEntry
 from awx.main.utils import parse_yaml_or_json, get_licenser, polymorphic
 from awx.main.utils.execution_environments import get_default_execution_environment
 from awx.main.utils.encryption import decrypt_value, get_encryption_key, is_encrypted
@@ -68,8 +69,15 @@ class ResourceMixin(models.Model):
 
         if content_types is None:
             ct_kwarg = dict(content_type_id=ContentType.objects.get_for_model(cls).id)
+            content_type_ids = [ct_kwarg['content_type_id']]
         else:
             ct_kwarg = dict(content_type_id__in=content_types)
+            content_type_ids = list(content_types)
+
+        if settings.RBAC_ACCESSIBLE_OBJECTS_CACHE and accessor._meta.model_name == 'user' and accessor.pk is not None and content_type_ids:
+            object_set_id = AccessibleObjectSet.lookup(accessor, role_field, content_type_ids)
+            if object_set_id is not None:
+                return AccessibleObjectEntry.objects.filter(object_set_id=object_set_id).values_list('object_id')
 
         return RoleAncestorEntry.objects.filter(ancestor__in=ancestor_roles, role_field=role_field, **ct_kwarg).values_list('object_id').distinct()
 
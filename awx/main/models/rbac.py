@@ -6,9 +6,12 @@ import logging
 import threading
 import contextlib
 import re
+import uuid
 
 # Django
+from django.conf import settings
 from django.db import models, transaction, connection
+from django.db.models import Subquery
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.utils.translation import gettext_lazy as _
@@ -18,6 +21,7 @@ from awx.api.versioning import reverse
 
 __all__ = [
     'Role',
+    'AccessibleObjectSet',
     'batch_role_ancestor_rebuilding',
     'ROLE_SINGLETON_SYSTEM_ADMINISTRATOR',
     'ROLE_SINGLETON_SYSTEM_AUDITOR',
@@ -77,6 +81,9 @@ role_descriptions = {
 
 tls = threading.local()  # thread local storage
 
+# roles whose ancestors are computed and written at once by the 'closure' role ancestry rebuild
+ROLE_ANCESTRY_CLOSURE_BATCH_SIZE = 10000
+
 
 def check_singleton(func):
     """
@@ -291,6 +298,11 @@ class Role(models.Model):
             getattr(tls, 'removals').update(set(removals))
             return
 
+        if settings.ROLE_ANCESTRY_REBUILD_ENGINE == 'closure':
+            with transaction.atomic(), AccessibleObjectSet.invalidating_ancestry_changes(set(additions) | set(removals)):
+                Role._rebuild_role_ancestor_closure(set(additions) | set(removals))
+            return
+
         cursor = connection.cursor()
         loop_ct = 0
 
@@ -310,7 +322,7 @@ class Role(models.Model):
             for i in range(0, len(role_ids), 40000):
                 yield role_ids[i : i + 40000]
 
-        with transaction.atomic():
+        with transaction.atomic(), AccessibleObjectSet.invalidating_ancestry_changes(set(additions) | set(removals)):
             while len(additions) > 0 or len(removals) > 0:
                 if loop_ct > 100:
                     raise Exception('Role ancestry rebuilding error: infinite loop detected')
@@ -392,6 +404,113 @@ class Role(models.Model):
                     new_removals.update([row[0] for row in cursor.fetchall()])
                 removals = list(new_removals)
 
+    @staticmethod
+    def _rebuild_role_ancestor_closure(role_ids):
+        """
+        The set based counterpart of the loop in rebuild_role_ancestor_list.
+
+        Every role whose ancestors may have changed, role_ids and all roles
+        below them, is found with one recursive query.  Then, for batches of
+        ROLE_ANCESTRY_CLOSURE_BATCH_SIZE of those roles, the full list of
+        ancestors is computed with another recursive query, and the entries
+        which should no longer be there are deleted and the missing ones
+        inserted, with one statement each.  Both go through temporary tables.
+
+        The ancestors of a role are found by walking up the role parents, but
+        only as far as the roles being rebuilt: the stored ancestors of any
+        other role are already correct, and are taken as they are.
+        """
+        sql_params = {
+            'ancestors_table': Role.ancestors.through._meta.db_table,
+            'parents_table': Role.parents.through._meta.db_table,
+            'roles_table': Role._meta.db_table,
+            'rebuild_roles_table': 'main_rbac_rebuild_roles',
+            'rebuild_ancestors_table': 'main_rbac_rebuild_ancestors',
+        }
+
+        role_ids = sorted(role_ids)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE IF NOT EXISTS %(rebuild_roles_table)s (id integer PRIMARY KEY)' % sql_params)
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS %(rebuild_ancestors_table)s '
+                '(descendent_id integer, ancestor_id integer, PRIMARY KEY (descendent_id, ancestor_id))' % sql_params
+            )
+            cursor.execute('DELETE FROM %(rebuild_roles_table)s' % sql_params)
+            for i in range(0, len(role_ids), ROLE_ANCESTRY_CLOSURE_BATCH_SIZE):
+                sql_params['ids'] = ','.join(str(x) for x in role_ids[i : i + ROLE_ANCESTRY_CLOSURE_BATCH_SIZE])
+                cursor.execute('''
+                    WITH RECURSIVE descendents(id) AS (
+                          SELECT id FROM %(roles_table)s WHERE id IN (%(ids)s)
+
+                           UNION
+
+                          SELECT parents.from_role_id
+                            FROM descendents
+                                 INNER JOIN %(parents_table)s as parents
+                                         ON (parents.to_role_id = descendents.id)
+                    )
+                    INSERT INTO %(rebuild_roles_table)s (id)
+                    SELECT id FROM descendents
+                     WHERE NOT EXISTS (SELECT 1 FROM %(rebuild_roles_table)s WHERE %(rebuild_roles_table)s.id = descendents.id)
+                ''' % sql_params)
+
+            cursor.execute('SELECT id FROM %(rebuild_roles_table)s ORDER BY id' % sql_params)
+            rebuild_ids = [row[0] for row in cursor.fetchall()]
+            for i in range(0, len(rebuild_ids), ROLE_ANCESTRY_CLOSURE_BATCH_SIZE):
+                sql_params['ids'] = ','.join(str(x) for x in rebuild_ids[i : i + ROLE_ANCESTRY_CLOSURE_BATCH_SIZE])
+                # UNION ends the recursion at loops in the role graph.  walk is 0 for
+                # the ancestors taken from the ancestors table, which are not walked up from
+                cursor.execute('''
+                    WITH RECURSIVE closure(descendent_id, ancestor_id, walk) AS (
+                          SELECT id, id, 1 FROM %(roles_table)s WHERE id IN (%(ids)s)
+
+                           UNION
+
+                          SELECT closure.descendent_id,
+                                 COALESCE(ancestors.ancestor_id, parents.to_role_id),
+                                 CASE WHEN ancestors.ancestor_id IS NULL THEN 1 ELSE 0 END
+                            FROM closure
+                                 INNER JOIN %(parents_table)s as parents
+                                         ON (parents.from_role_id = closure.ancestor_id)
+                                 LEFT OUTER JOIN %(ancestors_table)s as ancestors
+                                         ON (ancestors.descendent_id = parents.to_role_id
+                                             AND parents.to_role_id NOT IN (SELECT id FROM %(rebuild_roles_table)s))
+                           WHERE closure.walk = 1
+                    )
+                    INSERT INTO %(rebuild_ancestors_table)s (descendent_id, ancestor_id)
+                    SELECT DISTINCT descendent_id, ancestor_id FROM closure
+                ''' % sql_params)
+                cursor.execute('ANALYZE %(rebuild_ancestors_table)s' % sql_params)
+
+                cursor.execute('''
+                    DELETE FROM %(ancestors_table)s
+                    WHERE descendent_id IN (%(ids)s)
+                          AND NOT EXISTS (
+                              SELECT 1
+                                FROM %(rebuild_ancestors_table)s as closure
+                               WHERE closure.descendent_id = %(ancestors_table)s.descendent_id
+                                     AND closure.ancestor_id = %(ancestors_table)s.ancestor_id
+                          )
+                ''' % sql_params)
+                cursor.execute('''
+                    INSERT INTO %(ancestors_table)s (descendent_id, ancestor_id, role_field, content_type_id, object_id)
+                    SELECT closure.descendent_id,
+                           closure.ancestor_id,
+                           roles.role_field,
+                           COALESCE(roles.content_type_id, 0) content_type_id,
+                           COALESCE(roles.object_id, 0) object_id
+                      FROM %(rebuild_ancestors_table)s as closure
+                           INNER JOIN %(roles_table)s as roles
+                                   ON (roles.id = closure.descendent_id)
+                     WHERE NOT EXISTS (
+                        SELECT 1 FROM %(ancestors_table)s
+                         WHERE %(ancestors_table)s.descendent_id = closure.descendent_id
+                               AND %(ancestors_table)s.ancestor_id = closure.ancestor_id
+                     )
+                ''' % sql_params)
+                cursor.execute('DELETE FROM %(rebuild_ancestors_table)s' % sql_params)
+            cursor.execute('DELETE FROM %(rebuild_roles_table)s' % sql_params)
+
     @staticmethod
     def visible_roles(user):
         return Role.filter_visible_roles(user, Role.objects.all())
@@ -446,6 +565,255 @@ class RoleAncestorEntry(models.Model):
     object_id = models.PositiveIntegerField(null=False)
 
 
+class RoleAccessState(models.Model):
+    """
+    Its version changes after every transaction which changed the objects the
+    user has roles on, through role membership or role ancestry, see
+    AccessibleObjectSet.invalidate
+    """
+
+    class Meta:
+        app_label = 'main'
+        db_table = 'main_rbac_access_state'
+
+    user = models.OneToOneField('auth.User', primary_key=True, on_delete=models.CASCADE, related_name='+')
+    version = models.UUIDField(default=uuid.uuid4, editable=False)
+
+
+class AccessibleObjectSet(models.Model):
+    """
+    The ids of the objects of some content types which a user has a role field
+    on, materialized from the role ancestors of the user's roles.  A set is used
+    for as long as the RoleAccessState version of the user it was built at is
+    current.
+    """
+
+    class Meta:
+        app_label = 'main'
+        db_table = 'main_rbac_accessible_object_sets'
+        constraints = [models.UniqueConstraint(fields=["user", "role_field", "content_types", "version"], name="main_rbac_accessible_object_set_uniq")]
+
+    user = models.ForeignKey('auth.User', null=False, on_delete=models.CASCADE, related_name='+', db_index=False)
+    role_field = models.TextField(null=False)
+    content_types = models.TextField(null=False)  # sorted, comma separated content type ids
+    version = models.UUIDField(null=False)
+
+    @staticmethod
+    def _pending_bump():
+        bump = getattr(tls, 'accessible_objects_bump', None)
+        if bump is not None and connection.in_atomic_block and any(func is bump for _, func, _ in connection.run_on_commit):
+            return bump
+        return None
+
+    @staticmethod
+    def invalidated_in_transaction(user_id):
+        bump = AccessibleObjectSet._pending_bump()
+        return bump is not None and user_id in bump.user_ids
+
+    @staticmethod
+    def invalidate(user_ids):
+        """
+        Gives the RoleAccessState of each of user_ids a new version once the
+        current transaction commits, so that no set of theirs built before is
+        used again.  Until then, the transaction itself does not use their sets.
+        """
+        user_ids = set(user_ids)
+        if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE or not user_ids:
+            return
+        pending = AccessibleObjectSet._pending_bump()
+        if pending is not None:
+            pending.user_ids.update(user_ids)
+            return
+
+        def bump():
+            if getattr(tls, 'accessible_objects_bump', None) is bump:
+                tls.accessible_objects_bump = None
+            user_ids = sorted(bump.user_ids)
+            version = uuid.uuid4()
+            sql_params = {
+                'state_table': RoleAccessState._meta.db_table,
+                'users_table': RoleAccessState._meta.get_field('user').related_model._meta.db_table,
+                'ids': ','.join(['%s'] * len(user_ids)),
+            }
+            with transaction.atomic():
+                # locked in user order, so that transactions bumping the same users do not deadlock
+                previous_versions = list(
+                    RoleAccessState.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id').values_list('version', flat=True)
+                )
+                with connection.cursor() as cursor:
+                    # users deleted since are skipped
+                    cursor.execute(
+                        '''
+                        INSERT INTO %(state_table)s (user_id, version)
+                        SELECT id, %%s FROM %(users_table)s WHERE id IN (%(ids)s)
+                        ON CONFLICT (user_id) DO UPDATE SET version = EXCLUDED.version
+                    ''' % sql_params,
+                        [RoleAccessState._meta.get_field('version').get_db_prep_value(version, connection), *user_ids],
+                    )
+                # sets of the previous versions may still be read by requests that looked them up just before
+                AccessibleObjectSet.objects.filter(user_id__in=user_ids).exclude(version__in=previous_versions + [version]).delete()
+
+        bump.user_ids = user_ids
+        tls.accessible_objects_bump = bump
+        connection.on_commit(bump)
+
+    @staticmethod
+    def invalidate_roles(role_ids):
+        """
+        Invalidates the sets of the members of role_ids, whose descendents changed.
+        """
+        if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE or not role_ids:
+            return
+        role_ids = sorted(role_ids)
+        user_ids = set()
+        for i in range(0, len(role_ids), ROLE_ANCESTRY_CLOSURE_BATCH_SIZE):
+            ids = role_ids[i : i + ROLE_ANCESTRY_CLOSURE_BATCH_SIZE]
+            user_ids.update(Role.members.through.objects.filter(role_id__in=ids).values_list('user_id', flat=True))
+        AccessibleObjectSet.invalidate(user_ids)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def invalidating_ancestry_changes(role_ids):
+        """
+        Invalidates the sets of the members of every role which, while in the
+        context, became or stopped being an ancestor of one of role_ids.  The
+        roles below role_ids can only gain or lose those same ancestors.
+        """
+        if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE:
+            yield
+            return
+
+        role_ids = sorted(role_ids)
+
+        def ancestor_entries():
+            entries = set()
+            for i in range(0, len(role_ids), ROLE_ANCESTRY_CLOSURE_BATCH_SIZE):
+                ids = role_ids[i : i + ROLE_ANCESTRY_CLOSURE_BATCH_SIZE]
+                entries.update(RoleAncestorEntry.objects.filter(descendent_id__in=ids).values_list('descendent_id', 'ancestor_id'))
+            return entries
+
+        before = ancestor_entries()
+        yield
+        AccessibleObjectSet.invalidate_roles({ancestor_id for descendent_id, ancestor_id in before ^ ancestor_entries()})
+
+    @staticmethod
+    def clear():
+        """
+        Deletes all sets.  Role access changes are not tracked while
+        RBAC_ACCESSIBLE_OBJECTS_CACHE is off, so sets built before must not be
+        used once it is on again.
+        """
+        AccessibleObjectSet.objects.all().delete()
+
+    @classmethod
+    def lookup(cls, user, role_field, content_type_ids):
+        """
+        Returns the id of the current set of objects of content_type_ids which
+        user has role_field on, or None if the current transaction changed the
+        roles of user or the set is not built yet.
+
+        A missing set is built by the build_accessible_object_set task, queued
+        once the current transaction commits, so that requests only read sets.
+        """
+        if cls.invalidated_in_transaction(user.id):
+            return None
+        content_types = ','.join(str(ct_id) for ct_id in sorted(content_type_ids))
+        object_set_id = (
+            cls.objects.filter(
+                user=user,
+                role_field=role_field,
+                content_types=content_types,
+                version=Subquery(RoleAccessState.objects.filter(user=user).values('version')[:1]),
+            )
+            .order_by()
+            .values_list('id', flat=True)
+            .first()
+        )
+        if object_set_id is not None:
+            return object_set_id
+
+        key = (user.id, role_field, content_types)
+        if not connection.in_atomic_block or not any(getattr(func, 'accessible_object_set', None) == key for _, func, _ in connection.run_on_commit):
+
+            def build():
+                from awx.main.tasks.system import build_accessible_object_set  # circular import
+
+                build.accessible_object_set = None
+                build_accessible_object_set.delay(user.id, role_field, sorted(content_type_ids))
+
+            build.accessible_object_set = key
+            connection.on_commit(build, robust=True)
+        return None
+
+    @classmethod
+    def build(cls, user_id, role_field, content_type_ids):
+        """
+        Builds the set of objects of content_type_ids which the user has
+        role_field on, for the current RoleAccessState version of the user,
+        unless it is built already.  Returns the id of the set, or None if the
+        user does not exist.
+        """
+        content_types = ','.join(str(ct_id) for ct_id in sorted(content_type_ids))
+        version_field = RoleAccessState._meta.get_field('version')
+        sql_params = {
+            'sets_table': cls._meta.db_table,
+            'state_table': RoleAccessState._meta.db_table,
+            'users_table': RoleAccessState._meta.get_field('user').related_model._meta.db_table,
+            'entries_table': AccessibleObjectEntry._meta.db_table,
+            'ancestors_table': RoleAncestorEntry._meta.db_table,
+            'members_table': Role.members.through._meta.db_table,
+            'content_types': ','.join(['%s'] * len(content_type_ids)),
+        }
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO %(state_table)s (user_id, version) SELECT id, %%s FROM %(users_table)s WHERE id = %%s ON CONFLICT (user_id) DO NOTHING'
+                    % sql_params,
+                    [version_field.get_db_prep_value(uuid.uuid4(), connection), user_id],
+                )
+            # a set built while the version changes is built for the version before, and not used
+            version = RoleAccessState.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+            if version is None:
+                return None
+            with connection.cursor() as cursor:
+                # a transaction building the same set at the same time makes this wait for it, and then use its set
+                cursor.execute(
+                    'INSERT INTO %(sets_table)s (user_id, role_field, content_types, version) VALUES (%%s, %%s, %%s, %%s) '
+                    'ON CONFLICT (user_id, role_field, content_types, version) DO NOTHING RETURNING id' % sql_params,
+                    [user_id, role_field, content_types, version_field.get_db_prep_value(version, connection)],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                object_sets = cls.objects.filter(user_id=user_id, role_field=role_field, content_types=content_types, version=version)
+                return object_sets.values_list('id', flat=True).first()
+            object_set_id = row[0]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    '''
+                    INSERT INTO %(entries_table)s (object_set_id, object_id)
+                    SELECT DISTINCT %%s, ancestors.object_id
+                      FROM %(ancestors_table)s as ancestors
+                           INNER JOIN %(members_table)s as members
+                                   ON (members.role_id = ancestors.ancestor_id)
+                     WHERE members.user_id = %%s
+                           AND ancestors.role_field = %%s
+                           AND ancestors.content_type_id IN (%(content_types)s)
+                ''' % sql_params,
+                    [object_set_id, user_id, role_field, *content_type_ids],
+                )
+        return object_set_id
+
+
+class AccessibleObjectEntry(models.Model):
+    class Meta:
+        app_label = 'main'
+        db_table = 'main_rbac_accessible_objects'
+        indexes = [models.Index(fields=["object_set", "object_id"])]
+
+    object_set = models.ForeignKey(AccessibleObjectSet, null=False, on_delete=models.CASCADE, related_name='+', db_index=False)
+    object_id = models.PositiveIntegerField(null=False)
+
+
 def role_summary_fields_generator(content_object, role_field):
     global role_descriptions
     global role_names
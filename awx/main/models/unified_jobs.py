@@ -3,20 +3,19 @@
 
 # Python
 from io import StringIO
+import bisect
 import datetime
 import decimal
+import gzip
 import json
 import logging
-import os
 import re
 import socket
-import subprocess
-import tempfile
 from collections import OrderedDict
 
 # Django
 from django.conf import settings
-from django.db import models, connection
+from django.db import models, connection, transaction
 from django.core.exceptions import NON_FIELD_ERRORS
 from django.utils.translation import gettext_lazy as _
 from django.utils.timezone import now
@@ -52,6 +51,7 @@ from awx.main.utils.common import (
     ScheduleTaskManager,
     get_event_partition_epoch,
     get_capacity_type,
+    get_memoize_cache,
 )
 from awx.main.utils.encryption import encrypt_dict, decrypt_field
 from awx.main.utils import polymorphic
@@ -526,6 +526,111 @@ class UnifiedJobDeprecatedStdout(models.Model):
     )
 
 
+class UnifiedJobStdoutArchive(models.Model):
+    """
+    The stdout of a finished job, copied out of its events into gzip
+    compressed, line-indexed chunks once event processing has finished, so
+    it can be served without reading the event tables again.
+    """
+
+    class Meta:
+        app_label = 'main'
+
+    unified_job = models.OneToOneField(
+        'UnifiedJob',
+        related_name='stdout_archive',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        editable=False,
+    )
+    created = models.DateTimeField(
+        default=now,
+        editable=False,
+        db_index=True,
+    )
+    line_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    size = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Uncompressed size of the archived stdout."),
+    )
+    expired = models.BooleanField(
+        default=False,
+        editable=False,
+        help_text=_("The chunks of this archive were removed by cleanup_jobs, so the stdout of its job is read from the events."),
+    )
+
+
+class UnifiedJobStdoutArchiveChunk(models.Model):
+    """
+    A run of consecutive events of an archived job, stored as the gzip
+    compressed JSON list of their [start_line, stdout] pairs.
+    """
+
+    class Meta:
+        app_label = 'main'
+        indexes = [models.Index(fields=['archive', 'start_line'], name='main_stdoutchunk_start_line')]
+
+    archive = models.ForeignKey(
+        UnifiedJobStdoutArchive,
+        related_name='chunks',
+        on_delete=models.CASCADE,
+        editable=False,
+    )
+    start_line = models.PositiveIntegerField(
+        editable=False,
+    )
+    end_line = models.PositiveIntegerField(
+        editable=False,
+    )
+    data = models.BinaryField(
+        editable=False,
+    )
+
+    @staticmethod
+    def compress(rows):
+        return gzip.compress(json.dumps(rows).encode('utf-8'))
+
+    def rows(self):
+        return json.loads(gzip.decompress(self.data))
+
+
+COPY_TEXT_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+def unescape_copy_text(text):
+    """
+    Reverses the backslash escaping of COPY ... TO STDOUT text output, and
+    turns the CRLF line endings of ansible stdout into plain newlines.
+    """
+    text = re.sub(r'\\(.)', lambda m: COPY_TEXT_ESCAPES.get(m.group(1), m.group(1)), text, flags=re.DOTALL)
+    return text.replace('\r\n', '\n')
+
+
+def stdout_rows_to_text(rows):
+    """
+    Joins (start_line, stdout) rows of events into text, the way the COPY in
+    UnifiedJob._event_stdout_stream does.
+    """
+    return ''.join(stdout.replace('\r\n', '\n') + '\n' for start_line, stdout in rows)
+
+
+def stdout_lines(stdout):
+    """
+    Splits the stdout of an event into the lines it covers, counted once the
+    CRLF line endings are turned into plain newlines, so that line numbers
+    match the text of unescape_copy_text and stdout_rows_to_text.
+    """
+    stdout = stdout.replace('\r\n', '\n')
+    lines = stdout.split('\n')
+    if stdout.endswith('\n'):
+        lines.pop()
+    return lines
+
+
 class StdoutMaxBytesExceeded(Exception):
     def __init__(self, total, supported):
         self.total = total
@@ -558,6 +663,9 @@ class UnifiedJob(
     class Meta:
         app_label = 'main'
         ordering = ('id',)
+        indexes = [
+            models.Index(fields=['modified'], name='main_unifiedjob_modified'),
+        ]
 
     old_pk = models.PositiveIntegerField(
         null=True,
@@ -908,6 +1016,14 @@ class UnifiedJob(
             self.canceled_on = now()
             if 'canceled_on' not in update_fields:
                 update_fields.append('canceled_on')
+
+        # Always move modified forward on a status change, even when the caller
+        # passed along the old value (see update_model); the incremental task
+        # manager finds the tasks which changed since its last run by it.
+        if self.status != status_before:
+            self.modified = now()
+            if update_fields and 'modified' not in update_fields:
+                update_fields.append('modified')
         # Okay; we're done. Perform the actual save.
         result = super(UnifiedJob, self).save(*args, **kwargs)
 
@@ -1086,28 +1202,11 @@ class UnifiedJob(
 
         If the size of the file is greater than
         `settings.STDOUT_MAX_BYTES_DISPLAY`, a StdoutMaxBytesExceeded exception
-        will be raised.
+        will be raised.  Downloads of the entire stdout should use
+        `result_stdout_raw_stream` instead, which does not hold it in memory.
         """
         max_supported = settings.STDOUT_MAX_BYTES_DISPLAY
 
-        if enforce_max_bytes:
-            # If enforce_max_bytes is True, we're not grabbing the whole file,
-            # just the first <settings.STDOUT_MAX_BYTES_DISPLAY> bytes;
-            # in this scenario, it's probably safe to use a StringIO.
-            fd = StringIO()
-        else:
-            # If enforce_max_bytes = False, that means they're downloading
-            # the entire file.  To avoid ballooning memory, let's write the
-            # stdout content to a temporary disk location
-            if not os.path.exists(settings.JOBOUTPUT_ROOT):
-                os.makedirs(settings.JOBOUTPUT_ROOT)
-            fd = tempfile.NamedTemporaryFile(
-                mode='w', prefix='{}-{}-'.format(self.model_to_str(), self.pk), suffix='.out', dir=settings.JOBOUTPUT_ROOT, encoding='utf-8'
-            )
-            from awx.main.tasks.system import purge_old_stdout_files  # circular import
-
-            purge_old_stdout_files.apply_async()
-
         # Before the addition of event-based stdout, older versions of
         # awx stored stdout as raw text blobs in a certain database column
         # (`main_unifiedjob.result_stdout_text`)
@@ -1117,64 +1216,143 @@ class UnifiedJob(
         if legacy_stdout_text:
             if enforce_max_bytes and len(legacy_stdout_text) > max_supported:
                 raise StdoutMaxBytesExceeded(len(legacy_stdout_text), max_supported)
-            fd.write(legacy_stdout_text)
-            if hasattr(fd, 'name'):
-                fd.flush()
-                return open(fd.name, 'r', encoding='utf-8')
-            else:
-                # we just wrote to this StringIO, so rewind it
-                fd.seek(0)
-                return fd
+            return StringIO(legacy_stdout_text)
+
+        archive = self.get_stdout_archive()
+        if archive is not None:
+            if enforce_max_bytes and archive.size > max_supported:
+                raise StdoutMaxBytesExceeded(archive.size, max_supported)
+            return StringIO(''.join(self._archive_stdout_stream(archive)))
+
+        if enforce_max_bytes:
+            # detect the length of all stdout for this UnifiedJob, and
+            # if it exceeds settings.STDOUT_MAX_BYTES_DISPLAY bytes,
+            # don't bother actually fetching the data
+            total = self.get_event_queryset().aggregate(total=models.Sum(models.Func(models.F('stdout'), function='LENGTH')))['total'] or 0
+            if total > max_supported:
+                raise StdoutMaxBytesExceeded(total, max_supported)
+        return StringIO(''.join(self._event_stdout_stream()))
+
+    def _event_stdout_stream(self):
+        # Note: the code in this method _intentionally_ does not use the
+        # Django ORM because of the potential size (many MB+) of
+        # `main_jobevent.stdout`; we *do not* want to generate queries
+        # here that construct model objects by fetching large gobs of
+        # data (and potentially ballooning memory usage); instead, we
+        # just want to stream concatenated values of a certain column
+        # (`stdout`) directly to the caller
+        tbl = self._meta.db_table + 'event'
+        where_parts = [
+            sql.SQL('{} = {}').format(sql.Identifier(self.event_parent_key), sql.Literal(self.id)),
+            sql.SQL("stdout != ''"),
+        ]
+        if self.has_unpartitioned_events:
+            tbl = '_unpartitioned_' + tbl
         else:
-            # Note: the code in this block _intentionally_ does not use the
-            # Django ORM because of the potential size (many MB+) of
-            # `main_jobevent.stdout`; we *do not* want to generate queries
-            # here that construct model objects by fetching large gobs of
-            # data (and potentially ballooning memory usage); instead, we
-            # just want to write concatenated values of a certain column
-            # (`stdout`) directly to a file
-
-            with connection.cursor() as cursor:
-                if enforce_max_bytes:
-                    # detect the length of all stdout for this UnifiedJob, and
-                    # if it exceeds settings.STDOUT_MAX_BYTES_DISPLAY bytes,
-                    # don't bother actually fetching the data
-                    total = self.get_event_queryset().aggregate(total=models.Sum(models.Func(models.F('stdout'), function='LENGTH')))['total'] or 0
-                    if total > max_supported:
-                        raise StdoutMaxBytesExceeded(total, max_supported)
-
-                tbl = self._meta.db_table + 'event'
-                where_parts = [
-                    sql.SQL('{} = {}').format(sql.Identifier(self.event_parent_key), sql.Literal(self.id)),
-                    sql.SQL("stdout != ''"),
-                ]
-                if self.has_unpartitioned_events:
-                    tbl = '_unpartitioned_' + tbl
-                else:
-                    where_parts.insert(0, sql.SQL('job_created = {}').format(sql.Literal(self.created)))
+            where_parts.insert(0, sql.SQL('job_created = {}').format(sql.Literal(self.created)))
+
+        copy_sql = sql.SQL('COPY (SELECT stdout FROM {} WHERE {} ORDER BY start_line) TO STDOUT').format(
+            sql.Identifier(tbl),
+            sql.SQL(' AND ').join(where_parts),
+        )
+        with connection.cursor() as cursor:
+            with cursor.copy(copy_sql) as copy:
+                # COPY terminates every row with a newline (newlines within
+                # stdout are escaped), so only whole rows are decoded; this
+                # never splits a multibyte character or an escape sequence
+                pending = b''
+                while data := copy.read():
+                    rows, newline, pending = (pending + bytes(data)).rpartition(b'\n')
+                    if newline:
+                        yield unescape_copy_text(smart_str(rows + newline))
+                if pending:
+                    yield unescape_copy_text(smart_str(pending))
+
+    def get_stdout_archive(self):
+        """
+        Returns the UnifiedJobStdoutArchive of this job, or None if it has not
+        been written yet; in that case, writing it is queued once all events
+        of the job are saved.
+        """
+        if not settings.STDOUT_ARCHIVE_ENABLED:
+            return None
+        try:
+            archive = self.stdout_archive
+        except UnifiedJobStdoutArchive.DoesNotExist:
+            pass
+        else:
+            # an expired archive stays expired, it is not written again
+            return None if archive.expired else archive
+        # check at most once a minute per job whether it can be archived
+        if self.status not in ACTIVE_STATES and get_memoize_cache().add('awx-stdout-archive-queued-{}'.format(self.pk), True, 60):
+            if self.event_processing_finished:
+                from awx.main.tasks.system import archive_job_stdout  # circular import
+
+                archive_job_stdout.apply_async([self.pk])
+        return None
 
-                copy_sql = sql.SQL('COPY (SELECT stdout FROM {} WHERE {} ORDER BY start_line) TO STDOUT').format(
-                    sql.Identifier(tbl),
-                    sql.SQL(' AND ').join(where_parts),
+    def archive_stdout(self):
+        """
+        Copies the event-based stdout of this finished job into a
+        UnifiedJobStdoutArchive, in chunks of about STDOUT_ARCHIVE_CHUNK_BYTES.
+        """
+        event_qs = self.get_event_queryset()
+        with transaction.atomic():
+            archive, created = UnifiedJobStdoutArchive.objects.get_or_create(unified_job=self)
+            if not created:
+                return archive
+
+            def make_chunk(rows):
+                return UnifiedJobStdoutArchiveChunk(
+                    archive=archive,
+                    start_line=rows[0][0],
+                    # the end_line of some events may not have been saved
+                    end_line=max(max(end_line, start_line + len(stdout_lines(stdout))) for start_line, end_line, stdout in rows),
+                    data=UnifiedJobStdoutArchiveChunk.compress([(start_line, stdout) for start_line, end_line, stdout in rows]),
                 )
-                # psycopg3's copy writes bytes, but callers of this
-                # function assume a str-based fd will be returned; decode
-                # .write() calls on the fly to maintain this interface
-                with cursor.copy(copy_sql) as copy:
-                    while data := copy.read():
-                        fd.write(smart_str(bytes(data)))
-
-                if hasattr(fd, 'name'):
-                    # If we're dealing with a physical file, use `sed` to clean
-                    # up escaped line sequences
-                    fd.flush()
-                    subprocess.Popen("sed -i 's/\\\\r\\\\n/\\n/g' {}".format(fd.name), shell=True).wait()
-                    return open(fd.name, 'r', encoding='utf-8')
-                else:
-                    # If we're dealing with an in-memory string buffer, use
-                    # string.replace()
-                    fd = StringIO(fd.getvalue().replace('\\r\\n', '\n'))
-                    return fd
+
+            chunks, rows, rows_bytes = [], [], 0
+            archive.line_count = event_qs.aggregate(end=models.Max('end_line'))['end'] or 0
+            for row in event_qs.exclude(stdout='').order_by('start_line').values_list('start_line', 'end_line', 'stdout').iterator():
+                rows.append(row)
+                rows_bytes += len(row[2])
+                archive.size += len(row[2])
+                if rows_bytes >= settings.STDOUT_ARCHIVE_CHUNK_BYTES:
+                    chunks.append(make_chunk(rows))
+                    rows, rows_bytes = [], 0
+                if len(chunks) >= 100:
+                    archive.line_count = max([archive.line_count] + [chunk.end_line for chunk in chunks])
+                    UnifiedJobStdoutArchiveChunk.objects.bulk_create(chunks)
+                    chunks = []
+            if rows:
+                chunks.append(make_chunk(rows))
+            archive.line_count = max([archive.line_count] + [chunk.end_line for chunk in chunks])
+            UnifiedJobStdoutArchiveChunk.objects.bulk_create(chunks)
+            archive.save(update_fields=['line_count', 'size'])
+        return archive
+
+    def _archive_stdout_stream(self, archive):
+        for chunk in archive.chunks.order_by('start_line').iterator():
+            yield stdout_rows_to_text(chunk.rows())
+
+    def result_stdout_raw_stream(self, redact_sensitive=False, escape_ascii=False):
+        """
+        Yields all stdout for the UnifiedJob as a series of str chunks, with
+        no size limit; chunks are redacted and stripped of ANSI sequences as
+        they are read, so the entire stdout is never held at once.
+        """
+        legacy_stdout_text = self.result_stdout_text
+        if legacy_stdout_text:
+            chunks = [legacy_stdout_text]
+        else:
+            archive = self.get_stdout_archive()
+            chunks = self._event_stdout_stream() if archive is None else self._archive_stdout_stream(archive)
+        for chunk in chunks:
+            if redact_sensitive:
+                chunk = UriCleaner.remove_sensitive(chunk)
+            if escape_ascii:
+                chunk = self._escape_ascii(chunk)
+            yield chunk
 
     def _escape_ascii(self, content):
         # Remove ANSI escape sequences used to embed event data.
@@ -1199,25 +1377,151 @@ class UnifiedJob(
     def result_stdout(self):
         return self._result_stdout_raw(escape_ascii=True)
 
-    def _result_stdout_raw_limited(self, start_line=0, end_line=None, redact_sensitive=True, escape_ascii=False):
-        return_buffer = StringIO()
+    @property
+    def stdout_line_index_key(self):
+        return 'awx-stdout-line-index-{}'.format(self.pk)
+
+    def get_stdout_line_index(self):
+        """
+        Returns (absolute_end, checkpoints) for the event-based stdout of this
+        job, where checkpoints is a list of (start_line, counter) pairs taken
+        every STDOUT_LINE_INDEX_INTERVAL events.  Once all events of a finished
+        job are saved the index is built once and cached; until then only
+        absolute_end is computed, and checkpoints is empty.
+        """
+        cache = get_memoize_cache()
+        index = cache.get(self.stdout_line_index_key)
+        if index is not None:
+            return index
+        event_qs = self.get_event_queryset()
+        if not self.event_processing_finished:
+            return (event_qs.aggregate(end=models.Max('end_line'))['end'] or 0, [])
+
+        absolute_end, checkpoints = 0, []
+        interval = max(settings.STDOUT_LINE_INDEX_INTERVAL, 1)
+        rows = event_qs.order_by('counter').values_list('counter', 'start_line', 'end_line')
+        for i, (counter, start_line, end_line) in enumerate(rows.iterator()):
+            # checkpoints must be ordered by both line and counter to be searchable
+            if i % interval == 0 and (not checkpoints or start_line >= checkpoints[-1][0]):
+                checkpoints.append((start_line, counter))
+            absolute_end = max(absolute_end, end_line)
+        index = (absolute_end, checkpoints)
+        cache.set(self.stdout_line_index_key, index, settings.STDOUT_LINE_INDEX_CACHE_TIMEOUT)
+        return index
+
+    def _event_stdout_range(self, start_line, end_line):
+        """
+        Reads lines [start_line, end_line) of the event-based stdout, fetching
+        only the events whose start_line/end_line overlap the range.
+        """
+        absolute_end, checkpoints = self.get_stdout_line_index()
+        start_line, end_line = self._resolve_line_range(start_line, end_line, absolute_end)
+
+        event_qs = self.get_event_queryset().exclude(stdout='')
+        if start_line > 0:
+            # an event saved without its end_line may reach into the range, so it is always read
+            event_qs = event_qs.filter(models.Q(end_line__gt=start_line) | models.Q(end_line__lte=models.F('start_line')))
         if end_line is not None:
-            end_line = int(end_line)
+            event_qs = event_qs.filter(start_line__lt=end_line)
+        if checkpoints:
+            # narrow the scan to a counter range, which is indexed
+            starts = [checkpoint[0] for checkpoint in checkpoints]
+            lower = bisect.bisect_right(starts, start_line) - 1
+            if lower > 0:
+                event_qs = event_qs.filter(counter__gte=checkpoints[lower][1])
+            if end_line is not None:
+                upper = bisect.bisect_left(starts, end_line)
+                if upper < len(checkpoints):
+                    event_qs = event_qs.filter(counter__lt=checkpoints[upper][1])
+
+        rows = event_qs.order_by('start_line').values_list('start_line', 'stdout').iterator()
+        return self._stdout_rows_range(
+            rows,
+            start_line,
+            end_line,
+            absolute_end,
+            lambda: event_qs.aggregate(total=models.Sum(models.Func(models.F('stdout'), function='LENGTH')))['total'] or 0,
+        )
+
+    def _archive_stdout_range(self, archive, start_line, end_line):
+        absolute_end = archive.line_count
+        start_line, end_line = self._resolve_line_range(start_line, end_line, absolute_end)
+        chunks = archive.chunks.filter(end_line__gt=start_line)
+        if end_line is not None:
+            chunks = chunks.filter(start_line__lt=end_line)
+        chunks = list(chunks.order_by('start_line'))
+        rows = (row for chunk in chunks for row in chunk.rows())
+        return self._stdout_rows_range(
+            rows,
+            start_line,
+            end_line,
+            absolute_end,
+            lambda: sum(len(stdout) for chunk in chunks for row_start, stdout in chunk.rows()),
+        )
+
+    @staticmethod
+    def _resolve_line_range(start_line, end_line, absolute_end):
+        if start_line < 0:
+            return max(absolute_end + start_line, 0), None
+        if end_line is not None and end_line < 0:
+            end_line = max(absolute_end + end_line, 0)
+        return start_line, end_line
+
+    @staticmethod
+    def _stdout_rows_range(rows, start_line, end_line, absolute_end, range_bytes):
+        """
+        Cuts lines [start_line, end_line) out of (start_line, stdout) rows of
+        events, in start_line order; range_bytes is only called to report the
+        size of the range when it exceeds STDOUT_MAX_BYTES_DISPLAY.
+        """
+        max_supported = settings.STDOUT_MAX_BYTES_DISPLAY
+        return_buffer = StringIO()
+        total = 0
+        for event_start, stdout in rows:
+            total += len(stdout)
+            if total > max_supported:
+                raise StdoutMaxBytesExceeded(range_bytes(), max_supported)
+            lines = stdout_lines(stdout)
+            # the end_line of some events may not have been saved
+            absolute_end = max(absolute_end, event_start + len(lines))
+            for lineno, line in enumerate(lines, event_start):
+                if lineno >= start_line and (end_line is None or lineno < end_line):
+                    return_buffer.write(line + '\n')
+
+        if end_line is None:
+            end_actual = absolute_end
+        else:
+            end_actual = min(end_line, absolute_end)
+        return return_buffer.getvalue(), start_line, end_actual, absolute_end
+
+    def _legacy_stdout_range(self, start_line, end_line):
         stdout_lines = self.result_stdout_raw_handle().readlines()
         absolute_end = len(stdout_lines)
-        for line in stdout_lines[int(start_line) : end_line]:
-            return_buffer.write(line)
-        if int(start_line) < 0:
-            start_actual = len(stdout_lines) + int(start_line)
+        return_buffer = ''.join(stdout_lines[start_line:end_line])
+        if start_line < 0:
+            start_actual = len(stdout_lines) + start_line
             end_actual = len(stdout_lines)
         else:
-            start_actual = int(start_line)
+            start_actual = start_line
             if end_line is not None:
-                end_actual = min(int(end_line), len(stdout_lines))
+                end_actual = min(end_line, len(stdout_lines))
             else:
                 end_actual = len(stdout_lines)
+        return return_buffer, start_actual, end_actual, absolute_end
+
+    def _result_stdout_raw_limited(self, start_line=0, end_line=None, redact_sensitive=True, escape_ascii=False):
+        start_line = int(start_line)
+        if end_line is not None:
+            end_line = int(end_line)
+        if self.result_stdout_text:
+            return_buffer, start_actual, end_actual, absolute_end = self._legacy_stdout_range(start_line, end_line)
+        else:
+            archive = self.get_stdout_archive()
+            if archive is not None:
+                return_buffer, start_actual, end_actual, absolute_end = self._archive_stdout_range(archive, start_line, end_line)
+            else:
+                return_buffer, start_actual, end_actual, absolute_end = self._event_stdout_range(start_line, end_line)
 
-        return_buffer = return_buffer.getvalue()
         if redact_sensitive:
             return_buffer = UriCleaner.remove_sensitive(return_buffer)
         if escape_ascii:
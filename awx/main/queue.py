@@ -2,24 +2,40 @@
 # All Rights Reserved.
 
 # Python
-import json
 import logging
 import valkey
 
 # Django
 from django.conf import settings
 
-__all__ = ['CallbackQueueDispatcher']
+# AWX
+from awx.main.utils.json_codec import AnsibleJSONEncoder, get_json_codec  # noqa
 
+__all__ = ['CallbackQueueDispatcher', 'callback_queue_for_job', 'callback_queue_shards']
 
-# use a custom JSON serializer so we can properly handle !unsafe and !vault
-# objects that may exist in events emitted by the callback plugin
-# see: https://github.com/ansible/ansible/pull/38759
-class AnsibleJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if getattr(o, 'yaml_tag', None) == '!vault':
-            return o.data
-        return super(AnsibleJSONEncoder, self).default(o)
+# the keys of a callback event which identify the unified job it belongs to,
+# see JOB_REFERENCE on the event models
+JOB_REFERENCE_KEYS = ('job_id', 'ad_hoc_command_id', 'project_update_id', 'inventory_update_id', 'system_job_id')
+
+
+def callback_queue_shards():
+    """
+    Returns the names of all valkey lists callback events are published to
+    """
+    if settings.CALLBACK_QUEUE_SHARDS <= 1:
+        return [settings.CALLBACK_QUEUE]
+    return [f'{settings.CALLBACK_QUEUE}_{i}' for i in range(settings.CALLBACK_QUEUE_SHARDS)]
+
+
+def callback_queue_for_job(job_id):
+    """
+    Returns the valkey list that events for the given unified job are
+    published to; all events of a job go to the same shard, so that a single
+    callback receiver worker processes them in order
+    """
+    if settings.CALLBACK_QUEUE_SHARDS <= 1 or job_id is None:
+        return settings.CALLBACK_QUEUE
+    return f'{settings.CALLBACK_QUEUE}_{int(job_id) % settings.CALLBACK_QUEUE_SHARDS}'
 
 
 class CallbackQueueDispatcher(object):
@@ -27,6 +43,13 @@ class CallbackQueueDispatcher(object):
         self.queue = getattr(settings, 'CALLBACK_QUEUE', '')
         self.logger = logging.getLogger('awx.main.queue.CallbackQueueDispatcher')
         self.connection = valkey.Valkey.from_url(settings.BROKER_URL)
+        self.json_codec = get_json_codec()
+
+    def queue_for(self, obj):
+        for key in JOB_REFERENCE_KEYS:
+            if obj.get(key):
+                return callback_queue_for_job(obj[key])
+        return self.queue
 
     def dispatch(self, obj):
-        self.connection.rpush(self.queue, json.dumps(obj, cls=AnsibleJSONEncoder))
+        self.connection.rpush(self.queue_for(obj), self.json_codec.encode_event(obj))
@@ -61,6 +61,45 @@ class WorkflowDAG(SimpleDAG):
             self.add_edge(wfn_by_id[from_id], wfn_by_id[to_id], 'condition_nodes')
             self.edge_conditions[(from_id, to_id)] = (trigger or 'success', artifact_key, operator or 'eq', expected_value)
 
+    def refresh_nodes(self, workflow_job):
+        """
+        Bring the nodes of a graph built by an earlier workflow manager run up
+        to date with one query. The edges of a workflow job never change, so
+        only the node state the scheduler acts on is read again. Returns False
+        if the workflow job has different nodes now, and the graph has to be
+        built again.
+        """
+        rows = list(
+            WorkflowJobNode.objects.filter(workflow_job_id=workflow_job.id).values_list(
+                'id', 'job_id', 'job__status', 'do_not_run', 'retry_attempts', 'unified_job_template_id', 'ancestor_artifacts'
+            )
+        )
+        nodes_by_id = {node['node_object'].id: node['node_object'] for node in self.nodes}
+        if len(rows) != len(nodes_by_id):
+            return False
+        job_field = WorkflowJobNode._meta.get_field('job')
+        ujt_field = WorkflowJobNode._meta.get_field('unified_job_template')
+        for node_id, job_id, job_status, do_not_run, retry_attempts, ujt_id, ancestor_artifacts in rows:
+            obj = nodes_by_id.get(node_id)
+            if obj is None:
+                return False
+            # the job is kept while it is in the same state, otherwise it is
+            # loaded again (as its concrete type) the next time it is used
+            if job_field.is_cached(obj) and (obj.job_id != job_id or (obj.job is not None and obj.job.status != job_status)):
+                job_field.delete_cached_value(obj)
+            obj.job_id = job_id
+            # templates can be edited while the workflow runs, so spawned jobs
+            # are always created from a freshly loaded one
+            if ujt_field.is_cached(obj):
+                ujt_field.delete_cached_value(obj)
+            obj.unified_job_template_id = ujt_id
+            obj.do_not_run = do_not_run
+            obj.retry_attempts = retry_attempts
+            obj.ancestor_artifacts = ancestor_artifacts
+            obj.workflow_job = workflow_job
+        self._artifacts_cache = dict()
+        return True
+
     def _get_node_artifacts(self, obj):
         """Artifacts visible on a finished parent node: its accumulated
         ancestor_artifacts plus whatever its own job produced via set_stats.
@@ -349,3 +388,44 @@ class WorkflowDAG(SimpleDAG):
                             nodes_marked_do_not_run.append(node)
 
         return [n['node_object'] for n in nodes_marked_do_not_run]
+
+
+class WorkflowDAGCache:
+    """
+    The graphs of the running workflow jobs seen by the workflow manager in
+    this process, so they are not built again from the database on every run.
+
+    A graph is reused only after its nodes were refreshed from the database
+    (see WorkflowDAG.refresh_nodes), so it stays correct even if other
+    workers (or other nodes) ran the workflow manager in the meantime.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # workflow job id -> (workflow job created timestamp, graph)
+        self.dags = {}
+
+    def get(self, workflow_job):
+        """Returns the graph of workflow_job, and whether it had to be built"""
+        entry = self.dags.get(workflow_job.id)
+        if entry is not None:
+            created, dag = entry
+            if created == workflow_job.created and dag.refresh_nodes(workflow_job):
+                return dag, False
+        dag = WorkflowDAG(workflow_job)
+        self.dags[workflow_job.id] = (workflow_job.created, dag)
+        return dag, True
+
+    def evict(self, workflow_job_id):
+        self.dags.pop(workflow_job_id, None)
+
+    def retain(self, workflow_job_ids):
+        """Drop the graphs of workflow jobs which are no longer running"""
+        for workflow_job_id in set(self.dags) - set(workflow_job_ids):
+            del self.dags[workflow_job_id]
+
+
+# each dispatcher worker which runs the workflow manager keeps its own graphs
+workflow_dag_cache = WorkflowDAGCache()
@@ -0,0 +1,83 @@
+import logging
+import time
+
+logger = logging.getLogger('awx.main.scheduler')
+
+
+class TaskSnapshot:
+    """
+    The pending, waiting and running tasks seen by the last task manager cycle
+    in this process.
+
+    With TASK_MANAGER_INCREMENTAL enabled, the next cycle only reads back the
+    tasks whose `modified` timestamp moved since the snapshot was taken (plus
+    the tasks which depend on them), instead of every active task.  All tasks
+    are read again every TASK_MANAGER_FULL_RECONCILE_INTERVAL seconds, or
+    whenever the snapshot was invalidated.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.tasks = {}
+        # id of a dependency -> ids of the tasks which depend on it
+        self.dependents = {}
+        self.watermark = None
+        self.last_full_sync = None
+
+    def needs_full_sync(self, interval):
+        if self.watermark is None or self.last_full_sync is None:
+            return True
+        return (time.monotonic() - self.last_full_sync) >= interval
+
+    def _add(self, task):
+        self.tasks[task.id] = task
+        for dep in task.dependent_jobs.all():
+            self.dependents.setdefault(dep.id, set()).add(task.id)
+
+    def _remove(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return
+        for dep in task.dependent_jobs.all():
+            ids = self.dependents.get(dep.id)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del self.dependents[dep.id]
+
+    def replace(self, tasks, watermark):
+        """Take a new snapshot of all active tasks"""
+        self.clear()
+        for task in tasks:
+            self._add(task)
+        self.watermark = watermark
+        self.last_full_sync = time.monotonic()
+
+    def affected_by(self, changed_ids):
+        """Return the ids of tasks which need to be read again because they, or a task they depend on, changed"""
+        affected = set(changed_ids)
+        for changed_id in changed_ids:
+            affected.update(self.dependents.get(changed_id, ()))
+        return affected
+
+    def apply(self, reloaded_ids, reloaded_tasks, watermark):
+        """
+        Replace the tasks in reloaded_ids with their fresh copies in
+        reloaded_tasks; tasks which were not read back are no longer active
+        """
+        for task_id in reloaded_ids:
+            self._remove(task_id)
+        for task in reloaded_tasks:
+            self._add(task)
+        self.watermark = watermark
+
+    def get_tasks(self):
+        return sorted(self.tasks.values(), key=lambda t: t.created)
+
+
+# each dispatcher worker which runs the task manager keeps its own snapshot;
+# because deltas are read from the database, a snapshot stays correct even if
+# other workers (or other nodes) ran the task manager in the meantime
+task_snapshot = TaskSnapshot()
@@ -0,0 +1,118 @@
+import heapq
+import logging
+
+logger = logging.getLogger('awx.main.scheduler')
+
+
+class WorstFitPlacement:
+    """
+    Place a task on the instance with the most remaining capacity, among those
+    on the one running the fewest jobs, and among those on the one listed
+    first in the group.  This spreads load by capacity, and picks the same
+    instance as fit_task_to_most_remaining_capacity_instance.
+    """
+
+    name = 'worst_fit'
+    # if the instance with the most remaining capacity is too small, all are
+    exhaustive = False
+
+    @staticmethod
+    def key(remaining, instance):
+        return (-remaining, instance.jobs_running)
+
+
+class BestFitPlacement:
+    """
+    Place a task on the instance with the least remaining capacity which still
+    fits it, packing small tasks together and keeping large instances free for
+    large tasks.  A placement pops the k instances too small for the task
+    before the one it lands on, and pushes them back, so it costs O(k log n).
+    """
+
+    name = 'best_fit'
+    exhaustive = True
+
+    @staticmethod
+    def key(remaining, instance):
+        return (remaining, instance.jobs_running)
+
+
+class SpreadPlacement:
+    """
+    Place a task on the instance running the fewest jobs which fits it, and
+    among those on the one with the most remaining capacity.  Like best_fit, a
+    placement skipping k instances too small for the task costs O(k log n).
+    """
+
+    name = 'spread'
+    exhaustive = True
+
+    @staticmethod
+    def key(remaining, instance):
+        return (instance.jobs_running, -remaining)
+
+
+PLACEMENT_STRATEGIES = {strategy.name: strategy for strategy in (WorstFitPlacement, BestFitPlacement, SpreadPlacement)}
+
+
+def get_placement_strategy(name):
+    try:
+        return PLACEMENT_STRATEGIES[name]()
+    except KeyError:
+        logger.error(f'Unknown TASK_MANAGER_PLACEMENT_STRATEGY {name}, falling back to {WorstFitPlacement.name}')
+        return WorstFitPlacement()
+
+
+class CapacityHeap:
+    """
+    The instances of an instance group, ordered by a placement strategy.
+
+    TaskManagerInstance pushes a fresh entry onto every heap it belongs to
+    when it consumes capacity; older entries for that instance are dropped
+    as they surface.  A placement costs O(log n) for worst_fit, which only
+    looks at the top instance, and O(k log n) for the exhaustive strategies,
+    which pop and push back the k instances without room for the task.
+    """
+
+    def __init__(self, instances, strategy, remaining):
+        self.strategy = strategy
+        self.remaining = remaining
+        self.positions = {}
+        self.heap = []
+        for position, instance in enumerate(instances):
+            self.positions[instance.hostname] = position
+            self.heap.append(self._entry(instance))
+            instance.capacity_heaps.append(self)
+        heapq.heapify(self.heap)
+
+    def _entry(self, instance):
+        # position breaks ties in favour of the instance listed first in the group
+        return (self.strategy.key(self.remaining(instance), instance), self.positions[instance.hostname], instance.version, instance)
+
+    def push(self, instance):
+        heapq.heappush(self.heap, self._entry(instance))
+
+    def _pop_current(self):
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[2] == entry[3].version:
+                return entry
+        return None
+
+    def find(self, impact):
+        """Return the first instance, in strategy order, with room for impact, or None"""
+        popped = []
+        found = None
+        while True:
+            entry = self._pop_current()
+            if entry is None:
+                break
+            popped.append(entry)
+            if self.remaining(entry[3]) - impact >= 0:
+                found = entry[3]
+                break
+            if not self.strategy.exhaustive:
+                break
+        for entry in popped:
+            heapq.heappush(self.heap, entry)
+        return found
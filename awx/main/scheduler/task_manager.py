@@ -2,6 +2,7 @@
 # All Rights Reserved
 
 # Python
+import contextlib
 from datetime import timedelta
 import logging
 import uuid
@@ -12,6 +13,7 @@ import signal
 
 # Django
 from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from django.utils.translation import gettext_lazy as _, gettext_noop
 from django.utils.timezone import now as tz_now
 from django.conf import settings
@@ -27,13 +29,14 @@ from awx.main.models import (
     InventoryUpdate,
     Job,
     Project,
+    ProjectUpdate,
     UnifiedJob,
     WorkflowApproval,
     WorkflowJob,
     WorkflowJobNode,
     WorkflowJobTemplate,
 )
-from awx.main.scheduler.dag_workflow import WorkflowDAG
+from awx.main.scheduler.dag_workflow import WorkflowDAG, workflow_dag_cache
 from awx.main.utils.pglock import advisory_lock
 from awx.main.utils import (
     ScheduleTaskManager,
@@ -43,9 +46,11 @@ from awx.main.utils.common import task_manager_bulk_reschedule, is_testing
 from awx.main.signals import disable_activity_stream
 from awx.main.constants import ACTIVE_STATES
 from awx.main.scheduler.dependency_graph import DependencyGraph
+from awx.main.scheduler.incremental import task_snapshot
 from awx.main.scheduler.task_manager_models import TaskManagerModels
 import awx.main.analytics.subsystem_metrics as s_metrics
 from awx.main.utils import decrypt_field
+from awx.main.utils.profiling import AWXCycleProfiler
 
 logger = logging.getLogger('awx.main.scheduler')
 
@@ -53,7 +58,11 @@ logger = logging.getLogger('awx.main.scheduler')
 def timeit(func):
     def inner(*args, **kwargs):
         t_now = time.perf_counter()
-        result = func(*args, **kwargs)
+        if args[0].profiler is None:
+            result = func(*args, **kwargs)
+        else:
+            with args[0].profiler.phase(func.__name__):
+                result = func(*args, **kwargs)
         dur = time.perf_counter() - t_now
         args[0].subsystem_metrics.inc(f"{args[0].prefix}_{func.__name__}_seconds", dur)
         return result
@@ -69,6 +78,7 @@ class TaskBase:
         # is called later.
         self.subsystem_metrics = s_metrics.DispatcherMetrics(auto_pipe_execute=False)
         self.start_time = time.time()
+        self.profiler = None
 
         # We want to avoid calling settings in loops, so cache these settings at init time
         self.start_task_limit = settings.START_TASK_LIMIT
@@ -87,17 +97,19 @@ class TaskBase:
             return True
         return False
 
-    @timeit
-    def get_tasks(self, filter_args):
+    def get_task_queryset(self, filter_args):
         wf_approval_ctype_id = ContentType.objects.get_for_model(WorkflowApproval).id
-        qs = (
+        return (
             UnifiedJob.objects.filter(**filter_args)
             .exclude(launch_type='sync')
             .exclude(polymorphic_ctype_id=wf_approval_ctype_id)
             .order_by('created')
             .prefetch_related('dependent_jobs')
         )
-        self.all_tasks = [t for t in qs]
+
+    @timeit
+    def get_tasks(self, filter_args):
+        self.all_tasks = [t for t in self.get_task_queryset(filter_args)]
 
     def record_aggregate_metrics(self, *args):
         if not is_testing():
@@ -131,6 +143,19 @@ class TaskBase:
                 data[k[len(self.prefix) + 1 :]] = metric.current_value
         return data
 
+    @contextlib.contextmanager
+    def profile_cycle(self):
+        """With AWX_TASK_MANAGER_PROFILE, profile the phases of this run, see AWXCycleProfiler"""
+        if not settings.AWX_TASK_MANAGER_PROFILE:
+            yield
+            return
+        self.profiler = AWXCycleProfiler(self.prefix, dest=settings.AWX_TASK_MANAGER_PROFILE_DIR, keep=settings.AWX_TASK_MANAGER_PROFILE_KEEP)
+        try:
+            with self.profiler.profile():
+                yield
+        finally:
+            self.profiler = None
+
     def schedule(self):
         # Always be able to restore the original signal handler if we finish
         original_sigusr1 = signal.getsignal(signal.SIGUSR1)
@@ -146,7 +171,8 @@ class TaskBase:
                     # if sigusr1 due to timeout, still record metrics
                     signal.signal(signal.SIGUSR1, self.record_aggregate_metrics_and_exit)
                     try:
-                        self._schedule()
+                        with self.profile_cycle():
+                            self._schedule()
                     finally:
                         # Reset the signal handler back to the default just in case anything
                         # else uses the same signal for other purposes
@@ -176,7 +202,12 @@ class WorkflowManager(TaskBase):
                 ScheduleWorkflowManager().schedule()
                 # Do not process any more workflow jobs. Stop here.
                 break
-            dag = WorkflowDAG(workflow_job)
+            if settings.WORKFLOW_MANAGER_DAG_CACHE:
+                dag, built = workflow_dag_cache.get(workflow_job)
+                if built:
+                    self.subsystem_metrics.inc(f"{self.prefix}_dags_built", 1)
+            else:
+                dag = WorkflowDAG(workflow_job)
             status_changed = False
             if workflow_job.cancel_flag:
                 workflow_job.workflow_nodes.filter(do_not_run=False, job__isnull=True).update(do_not_run=True)
@@ -210,6 +241,7 @@ class WorkflowManager(TaskBase):
                     status_changed = True
 
             if status_changed:
+                workflow_dag_cache.evict(workflow_job.id)
                 if workflow_job.spawned_by_workflow:
                     ScheduleWorkflowManager().schedule()
                 workflow_job.websocket_emit_status(workflow_job.status)
@@ -233,7 +265,8 @@ class WorkflowManager(TaskBase):
                     spawn_node.job = job
                     if is_retry:
                         spawn_node.retry_attempts += 1
-                    spawn_node.save()
+                    # the node may come from a cached graph, only write what changed so other fields are not reverted
+                    spawn_node.save(update_fields=['job', 'retry_attempts'])
                     if isinstance(job, WorkflowApproval):
                         job.render_context_message(spawn_node.ancestor_artifacts)
                     if is_retry:
@@ -312,9 +345,16 @@ class WorkflowManager(TaskBase):
 
     @timeit
     def _schedule(self):
-        self.get_tasks(dict(status__in=["running"], dependencies_processed=True))
-        if len(self.all_tasks) > 0:
-            self.spawn_workflow_graph_jobs()
+        try:
+            self.get_tasks(dict(status__in=["running"], dependencies_processed=True))
+            workflow_dag_cache.retain([wf.id for wf in self.all_tasks])
+            if len(self.all_tasks) > 0:
+                self.spawn_workflow_graph_jobs()
+        except Exception:
+            # nodes in the cached graphs may have been changed in memory by a
+            # transaction which is about to be rolled back
+            workflow_dag_cache.clear()
+            raise
 
 
 class DependencyManager(TaskBase):
@@ -322,10 +362,22 @@ class DependencyManager(TaskBase):
         super().__init__(prefix="dependency_manager")
         self.all_projects = {}
         self.all_inventory_sources = {}
+        # the sources of pending inventory updates, by inventory source id
+        self.inventory_update_sources = {}
+        # the latest update of each project and inventory source, by their id;
+        # replaced by the updates this manager creates, so that every task
+        # which needs an update of the same resource shares one
+        self.latest_project_updates = {}
+        self.latest_inventory_updates = {}
 
     def cache_projects_and_sources(self, task_list):
+        """
+        Load everything needed to generate dependencies for task_list in a fixed
+        number of queries, no matter how many tasks share a project or inventory
+        """
         project_ids = set()
         inventory_ids = set()
+        inventory_source_ids = set()
         for task in task_list:
             if isinstance(task, Job):
                 if task.project_id:
@@ -333,15 +385,29 @@ class DependencyManager(TaskBase):
                 if task.inventory_id:
                     inventory_ids.add(task.inventory_id)
             elif isinstance(task, InventoryUpdate):
-                if task.inventory_source and task.inventory_source.source_project_id:
-                    project_ids.add(task.inventory_source.source_project_id)
+                inventory_source_ids.add(task.inventory_source_id)
 
-        for proj in Project.objects.filter(id__in=project_ids, scm_update_on_launch=True):
-            self.all_projects[proj.id] = proj
+        self.inventory_update_sources.update(InventorySource.objects.in_bulk(inventory_source_ids))
+        for invsrc in self.inventory_update_sources.values():
+            if invsrc.source_project_id:
+                project_ids.add(invsrc.source_project_id)
 
-        for invsrc in InventorySource.objects.filter(inventory_id__in=inventory_ids, update_on_launch=True):
+        latest_project_update = ProjectUpdate.objects.filter(project=OuterRef('pk'), job_type='check').order_by('-created').values('id')[:1]
+        for proj in Project.objects.filter(id__in=project_ids, scm_update_on_launch=True).annotate(latest_update_id=Subquery(latest_project_update)):
+            self.all_projects[proj.id] = proj
+        latest_ids = [proj.latest_update_id for proj in self.all_projects.values() if proj.latest_update_id]
+        for update in ProjectUpdate.objects.filter(id__in=latest_ids):
+            self.latest_project_updates[update.project_id] = update
+
+        latest_inventory_update = InventoryUpdate.objects.filter(inventory_source=OuterRef('pk')).order_by('-created').values('id')[:1]
+        for invsrc in InventorySource.objects.filter(inventory_id__in=inventory_ids, update_on_launch=True).annotate(
+            latest_update_id=Subquery(latest_inventory_update)
+        ):
             self.all_inventory_sources.setdefault(invsrc.inventory_id, [])
             self.all_inventory_sources[invsrc.inventory_id].append(invsrc)
+        latest_ids = [invsrc.latest_update_id for sources in self.all_inventory_sources.values() for invsrc in sources if invsrc.latest_update_id]
+        for update in InventoryUpdate.objects.filter(id__in=latest_ids):
+            self.latest_inventory_updates[update.inventory_source_id] = update
 
     @staticmethod
     def should_update_again(update, cache_timeout):
@@ -361,15 +427,22 @@ class DependencyManager(TaskBase):
     def get_or_create_project_update(self, project_id):
         project = self.all_projects.get(project_id, None)
         if project is not None:
-            latest_project_update = project.project_updates.filter(job_type='check').order_by("-created").first()
+            latest_project_update = self.latest_project_updates.get(project_id)
             if self.should_update_again(latest_project_update, project.scm_update_cache_timeout):
-                project_task = project.create_project_update(_eager_fields=dict(launch_type='dependency'))
-                project_task.signal_start()
-                return [project_task]
-            else:
-                return [latest_project_update]
+                latest_project_update = project.create_project_update(_eager_fields=dict(launch_type='dependency'))
+                latest_project_update.signal_start()
+                self.latest_project_updates[project_id] = latest_project_update
+            return [latest_project_update]
         return []
 
+    def get_or_create_inventory_update(self, inventory_source):
+        latest_inventory_update = self.latest_inventory_updates.get(inventory_source.id)
+        if self.should_update_again(latest_inventory_update, inventory_source.update_cache_timeout):
+            latest_inventory_update = inventory_source.create_inventory_update(_eager_fields=dict(launch_type='dependency'))
+            latest_inventory_update.signal_start()
+            self.latest_inventory_updates[inventory_source.id] = latest_inventory_update
+        return latest_inventory_update
+
     def gen_dep_for_job(self, task):
         dependencies = self.get_or_create_project_update(task.project_id)
 
@@ -381,26 +454,21 @@ class DependencyManager(TaskBase):
         for inventory_source in self.all_inventory_sources.get(task.inventory_id, []):
             if "inventory_sources_already_updated" in start_args and inventory_source.id in start_args['inventory_sources_already_updated']:
                 continue
-            latest_inventory_update = inventory_source.inventory_updates.order_by("-created").first()
-            if self.should_update_again(latest_inventory_update, inventory_source.update_cache_timeout):
-                inventory_task = inventory_source.create_inventory_update(_eager_fields=dict(launch_type='dependency'))
-                inventory_task.signal_start()
-                dependencies.append(inventory_task)
-            else:
-                dependencies.append(latest_inventory_update)
+            dependencies.append(self.get_or_create_inventory_update(inventory_source))
 
         return dependencies
 
     def gen_dep_for_inventory_update(self, inventory_task):
         if inventory_task.source == "scm":
-            invsrc = inventory_task.inventory_source
+            invsrc = self.inventory_update_sources.get(inventory_task.inventory_source_id)
             if invsrc:
                 return self.get_or_create_project_update(invsrc.source_project_id)
         return []
 
     @timeit
     def generate_dependencies(self, undeped_tasks):
-        dependencies = []
+        dependencies = {}
+        links = []
         self.cache_projects_and_sources(undeped_tasks)
         for task in undeped_tasks:
             task.log_lifecycle("acknowledged")
@@ -411,14 +479,18 @@ class DependencyManager(TaskBase):
             else:
                 continue
             if job_deps:
-                dependencies += job_deps
-                with disable_activity_stream():
-                    task.dependent_jobs.add(*job_deps)
+                for dep in job_deps:
+                    dependencies[dep.id] = dep
+                    links.append(UnifiedJob.dependent_jobs.through(from_unifiedjob_id=task.id, to_unifiedjob_id=dep.id))
                 logger.debug(f'Linked {[dep.log_format for dep in job_deps]} as dependencies of {task.log_format}')
 
-        UnifiedJob.objects.filter(pk__in=[task.pk for task in undeped_tasks]).update(dependencies_processed=True)
+        # link all dependencies at once; bulk_create does not send m2m_changed,
+        # so there is no activity stream entry for these, as before
+        UnifiedJob.dependent_jobs.through.objects.bulk_create(links, ignore_conflicts=True)
+        # bump modified, so that an incremental task manager picks these tasks up
+        UnifiedJob.objects.filter(pk__in=[task.pk for task in undeped_tasks]).update(dependencies_processed=True, modified=tz_now())
 
-        return dependencies
+        return list(dependencies.values())
 
     @timeit
     def _schedule(self):
@@ -451,6 +523,29 @@ class TaskManager(TaskBase):
         self.time_delta_job_explanation = timedelta(seconds=30)
         super().__init__(prefix="task_manager")
 
+    @timeit
+    def get_tasks(self, filter_args):
+        if not settings.TASK_MANAGER_INCREMENTAL:
+            self.all_tasks = [t for t in self.get_task_queryset(filter_args)]
+            return
+
+        # taken before reading, so that anything which changes while we read
+        # is read again on the next cycle
+        watermark = tz_now()
+        if task_snapshot.needs_full_sync(settings.TASK_MANAGER_FULL_RECONCILE_INTERVAL):
+            task_snapshot.replace(self.get_task_queryset(filter_args), watermark)
+            self.subsystem_metrics.inc(f"{self.prefix}_full_reconciles", 1)
+        else:
+            # look back a little further than the last cycle, to catch changes from
+            # transactions which were still open (or clocks which were behind) then
+            since = task_snapshot.watermark - timedelta(seconds=settings.TASK_MANAGER_INCREMENTAL_OVERLAP)
+            changed_ids = UnifiedJob.objects.filter(modified__gte=since).values_list('id', flat=True)
+            reload_ids = task_snapshot.affected_by(changed_ids)
+            reloaded_tasks = self.get_task_queryset(dict(filter_args, id__in=reload_ids)) if reload_ids else []
+            task_snapshot.apply(reload_ids, reloaded_tasks, watermark)
+            self.subsystem_metrics.inc(f"{self.prefix}_tasks_reloaded", len(reload_ids))
+        self.all_tasks = task_snapshot.get_tasks()
+
     def after_lock_init(self):
         """
         Init AFTER we know this instance of the task manager will run because the lock is acquired.
@@ -579,7 +674,7 @@ class TaskManager(TaskBase):
             if blocked_by:
                 self.subsystem_metrics.inc(f"{self.prefix}_tasks_blocked", 1)
                 task.log_lifecycle("blocked", blocked_by=blocked_by)
-                job_explanation = gettext_noop(f"waiting for {blocked_by._meta.model_name}-{blocked_by.id} to finish")
+                job_explanation = self.dependency_graph.explain(blocked_by)
                 if task.job_explanation != job_explanation:
                     if task.created < (tz_now() - self.time_delta_job_explanation):
                         task.job_explanation = job_explanation
@@ -599,7 +694,7 @@ class TaskManager(TaskBase):
                 control_impact = task.task_impact + self.control_task_impact
             else:
                 control_impact = self.control_task_impact
-            control_instance = self.tm_models.instance_groups.fit_task_to_most_remaining_capacity_instance(
+            control_instance = self.tm_models.instance_groups.fit_task_to_instance(
                 task, instance_group_name=self.controlplane_ig.name, impact=control_impact, capacity_type='control'
             )
             if not control_instance:
@@ -631,7 +726,7 @@ class TaskManager(TaskBase):
 
                 # at this point we know the instance group is NOT a container group
                 # because if it was, it would have started the task and broke out of the loop.
-                execution_instance = self.tm_models.instance_groups.fit_task_to_most_remaining_capacity_instance(
+                execution_instance = self.tm_models.instance_groups.fit_task_to_instance(
                     task, instance_group_name=instance_group.name, add_hybrid_control_cost=True
                 ) or self.tm_models.instance_groups.find_largest_idle_instance(instance_group_name=instance_group.name, capacity_type=task.capacity_type)
 
@@ -662,8 +757,10 @@ class TaskManager(TaskBase):
             if not found_acceptable_queue:
                 self.task_needs_capacity(task, tasks_to_update_job_explanation)
         UnifiedJob.objects.bulk_update(tasks_to_update_job_explanation, ['job_explanation'])
+        self.subsystem_metrics.set(f"{self.prefix}_capacity_fragmentation", self.tm_models.instances.get_fragmentation())
 
     def task_needs_capacity(self, task, tasks_to_update_job_explanation):
+        self.subsystem_metrics.inc(f"{self.prefix}_tasks_skipped_capacity", 1)
         task.log_lifecycle("needs_capacity")
         job_explanation = gettext_noop("This job is not ready to start because there is not enough available capacity.")
         if task.job_explanation != job_explanation:
@@ -746,13 +843,19 @@ class TaskManager(TaskBase):
 
     @timeit
     def _schedule(self):
-        self.get_tasks(dict(status__in=["pending", "waiting", "running"], dependencies_processed=True))
-
-        self.after_lock_init()
-        self.reap_jobs_from_orphaned_instances()
-
-        if len(self.all_tasks) > 0:
-            self.process_tasks()
+        try:
+            self.get_tasks(dict(status__in=["pending", "waiting", "running"], dependencies_processed=True))
+
+            self.after_lock_init()
+            self.reap_jobs_from_orphaned_instances()
+
+            if len(self.all_tasks) > 0:
+                self.process_tasks()
+        except Exception:
+            # tasks in the snapshot may have been changed in memory by a
+            # transaction which is about to be rolled back
+            task_snapshot.clear()
+            raise
 
         for workflow_approval in self.get_expired_workflow_approvals():
             self.timeout_approval_node(workflow_approval)
@@ -8,6 +8,7 @@ from awx.main.models import (
     Instance,
     InstanceGroup,
 )
+from awx.main.scheduler.placement import CapacityHeap, get_placement_strategy
 
 logger = logging.getLogger('awx.main.scheduler')
 
@@ -22,11 +23,17 @@ class TaskManagerInstance:
         self.capacity = obj.capacity
         self.hostname = obj.hostname
         self.jobs_running = 0
+        # bumped whenever consumed capacity changes, see CapacityHeap
+        self.version = 0
+        self.capacity_heaps = []
 
     def consume_capacity(self, impact, job_impact=False):
         self.consumed_capacity += impact
         if job_impact:
             self.jobs_running += 1
+        self.version += 1
+        for heap in self.capacity_heaps:
+            heap.push(self)
 
     @property
     def remaining_capacity(self):
@@ -155,6 +162,17 @@ class TaskManagerInstances:
             count_as_job = control_instance != execution_instance
             self.instances_by_hostname[task.controller_node].consume_capacity(self.control_task_impact, job_impact=count_as_job)
 
+    def get_fragmentation(self):
+        """
+        How scattered the free capacity of execution instances is: 0 when it is
+        all on one instance, approaching 1 when it is spread thinly over many
+        """
+        free = [i.remaining_capacity for i in self.instances_by_hostname.values() if i.node_type in ('hybrid', 'execution') and i.capacity > 0]
+        total_free = sum(free)
+        if not total_free:
+            return 0.0
+        return 1 - max(free) / total_free
+
     def __getitem__(self, hostname):
         return self.instances_by_hostname.get(hostname)
 
@@ -172,6 +190,8 @@ class TaskManagerInstanceGroups:
         self.pk_ig_map = dict()
         self.control_task_impact = kwargs.get('control_task_impact', settings.AWX_CONTROL_NODE_TASK_IMPACT)
         self.controlplane_ig_name = kwargs.get('controlplane_ig_name', settings.DEFAULT_CONTROL_PLANE_QUEUE_NAME)
+        self.placement_strategy = get_placement_strategy(kwargs.get('placement_strategy', settings.TASK_MANAGER_PLACEMENT_STRATEGY))
+        self.capacity_heaps = dict()
 
         if instance_groups is not None:  # for testing
             self.instance_groups = {ig.name: TaskManagerInstanceGroup(ig, self.task_manager_instances, **kwargs) for ig in instance_groups}
@@ -231,6 +251,27 @@ class TaskManagerInstanceGroups:
                 most_remaining_capacity = would_be_remaining
         return instance_most_capacity
 
+    def fit_task_to_instance(self, task, instance_group_name, impact=None, capacity_type=None, add_hybrid_control_cost=False):
+        """
+        Like fit_task_to_most_remaining_capacity_instance, but picks the instance
+        with TASK_MANAGER_PLACEMENT_STRATEGY from a heap kept for the group
+        """
+        impact = impact if impact else task.task_impact
+        capacity_type = capacity_type if capacity_type else task.capacity_type
+        heap_key = (instance_group_name, capacity_type, add_hybrid_control_cost)
+        if heap_key not in self.capacity_heaps:
+            control_task_impact = self.control_task_impact
+
+            def remaining(i):
+                # hybrid nodes _always_ control their own tasks
+                if add_hybrid_control_cost and i.node_type == 'hybrid':
+                    return i.remaining_capacity - control_task_impact
+                return i.remaining_capacity
+
+            instances = [i for i in self.instance_groups[instance_group_name].instances if i.node_type in (capacity_type, 'hybrid')]
+            self.capacity_heaps[heap_key] = CapacityHeap(instances, self.placement_strategy, remaining)
+        return self.capacity_heaps[heap_key].find(impact)
+
     def find_largest_idle_instance(self, instance_group_name, capacity_type='execution'):
         largest_instance = None
         instances = self.instance_groups[instance_group_name].instances
@@ -267,6 +308,7 @@ class TaskManagerModels:
         # We want to avoid calls to settings over and over in loops, so cache this information here
         kwargs['control_task_impact'] = kwargs.get('control_task_impact', settings.AWX_CONTROL_NODE_TASK_IMPACT)
         kwargs['controlplane_ig_name'] = kwargs.get('controlplane_ig_name', settings.DEFAULT_CONTROL_PLANE_QUEUE_NAME)
+        kwargs['placement_strategy'] = kwargs.get('placement_strategy', settings.TASK_MANAGER_PLACEMENT_STRATEGY)
         self.instances = TaskManagerInstances(**kwargs)
         self.instance_groups = TaskManagerInstanceGroups(task_manager_instances=self.instances, **kwargs)
 
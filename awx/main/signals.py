@@ -11,6 +11,7 @@ import sys
 # Django
 from django.db import connection
 from django.conf import settings
+from django.core.signals import setting_changed
 from django.db.models.signals import (
     pre_save,
     post_save,
@@ -28,6 +29,7 @@ from awx.main.middleware import get_current_request, get_current_user, current_u
 
 # AWX
 from awx.main.models import (
+    AccessibleObjectSet,
     ActivityStream,
     ExecutionEnvironment,
     Group,
@@ -106,6 +108,13 @@ def emit_update_inventory_on_created_or_deleted(sender, **kwargs):
             connection.on_commit(lambda: update_inventory_computed_fields.delay(inventory.id))
 
 
+def invalidate_inventory_script_data(sender, instance, **kwargs):
+    if kwargs.get('action', 'post_').startswith('pre_'):
+        return
+    if instance.inventory_id:
+        Inventory.invalidate_script_data(instance.inventory_id)
+
+
 def rebuild_role_ancestor_list(reverse, model, instance, pk_set, action, **kwargs):
     'When a role parent is added or removed, update our role hierarchy list'
     if action == 'post_add':
@@ -121,6 +130,27 @@ def rebuild_role_ancestor_list(reverse, model, instance, pk_set, action, **kwarg
             model.rebuild_role_ancestor_list([], [instance.id])
 
 
+def invalidate_accessible_objects(sender, reverse, instance, pk_set, action, **kwargs):
+    'When role membership changes, the objects the users added or removed have roles on may change'
+    if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE:
+        return
+    if action in ['post_add', 'post_remove']:
+        AccessibleObjectSet.invalidate([instance.id] if reverse else pk_set)
+    elif action == 'pre_clear':
+        AccessibleObjectSet.invalidate([instance.id] if reverse else instance.members.values_list('id', flat=True))
+
+
+def invalidate_role_members_accessible_objects(sender, instance, **kwargs):
+    'When a role is deleted, its members lose the objects they had roles on through it'
+    AccessibleObjectSet.invalidate_roles([instance.id])
+
+
+@receiver(setting_changed)
+def clear_accessible_objects(sender, setting, **kwargs):
+    if setting == 'RBAC_ACCESSIBLE_OBJECTS_CACHE':
+        AccessibleObjectSet.clear()
+
+
 def sync_superuser_status_to_rbac(instance, **kwargs):
     'When the is_superuser flag is changed on a user, reflect that in the membership of the System Admnistrator role'
     update_fields = kwargs.get('update_fields', None)
@@ -226,7 +256,15 @@ def connect_computed_field_signals():
 connect_computed_field_signals()
 
 post_save.connect(save_related_job_templates, sender=Inventory)
+post_save.connect(invalidate_inventory_script_data, sender=Host)
+post_delete.connect(invalidate_inventory_script_data, sender=Host)
+post_save.connect(invalidate_inventory_script_data, sender=Group)
+post_delete.connect(invalidate_inventory_script_data, sender=Group)
+m2m_changed.connect(invalidate_inventory_script_data, Group.hosts.through)
+m2m_changed.connect(invalidate_inventory_script_data, Group.parents.through)
 m2m_changed.connect(rebuild_role_ancestor_list, Role.parents.through)
+m2m_changed.connect(invalidate_accessible_objects, Role.members.through)
+pre_delete.connect(invalidate_role_members_accessible_objects, sender=Role)
 m2m_changed.connect(rbac_activity_stream, Role.members.through)
 m2m_changed.connect(rbac_activity_stream, Role.parents.through)
 post_save.connect(sync_superuser_status_to_rbac, sender=User)
@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import hashlib
 import os
 import json
 import logging
+import time
 
 # Django
 from django.conf import settings
@@ -16,13 +19,80 @@ from awx.main.models import Host
 logger = logging.getLogger('awx.main.tasks.facts')
 system_tracking_logger = logging.getLogger('awx.analytics.system_tracking')
 
+# fact files are written and read by a thread pool, this many hosts at a time
+FACT_CACHE_BATCH_SIZE = 1000
 
-@log_excess_runtime(logger, debug_cutoff=0.01, msg='Inventory {inventory_id} host facts prepared for {written_ct} hosts, took {delta:.3f} s', add_log_data=True)
+
+def serialize_facts(ansible_facts):
+    # keys are sorted so equal facts always serialize, and hash, the same
+    return json.dumps(ansible_facts, sort_keys=True).encode('utf-8')
+
+
+def facts_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+EMPTY_FACTS_DIGEST = facts_digest(serialize_facts({}))
+
+
+def fact_cache_path(fact_cache_dir, host_name):
+    """
+    Returns the path of the fact file of a host, or None if the host name
+    does not name a file directly inside fact_cache_dir
+    """
+    if not host_name or os.sep in host_name or host_name in (os.curdir, os.pardir):
+        return None
+    return os.path.join(fact_cache_dir, host_name)
+
+
+def _write_facts(filepath, ansible_facts):
+    content = serialize_facts(ansible_facts)
+    try:
+        with open(filepath, 'wb') as f:
+            os.chmod(f.name, 0o600)
+            f.write(content)
+            f.flush()
+            return facts_digest(content), os.fstat(f.fileno()).st_mtime
+    except IOError:
+        return None
+
+
+def _read_facts(filepath, current_digest):
+    """
+    Returns (digest, ansible_facts) for a fact file, where ansible_facts is
+    None if the facts match current_digest, or None if the file could not
+    be parsed
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+    except IOError:
+        return None
+    if facts_digest(content) == current_digest:
+        return (current_digest, None)
+    try:
+        ansible_facts = json.loads(content)
+    except ValueError:
+        return None
+    digest = facts_digest(serialize_facts(ansible_facts))
+    if digest == current_digest:
+        return (current_digest, None)
+    return (digest, ansible_facts)
+
+
+@log_excess_runtime(
+    logger,
+    debug_cutoff=0.01,
+    msg='Inventory {inventory_id} host facts prepared for {written_ct} hosts, took {delta:.3f} s (writing files {write_time:.3f} s)',
+    add_log_data=True,
+)
 def start_fact_cache(hosts, artifacts_dir, timeout=None, inventory_id=None, log_data=None):
     log_data = log_data or {}
     log_data['inventory_id'] = inventory_id
     log_data['written_ct'] = 0
+    log_data['write_time'] = 0.0
     hosts_cached = []
+    facts_digests = {}
 
     # Create the fact_cache directory inside artifacts_dir
     fact_cache_dir = os.path.join(artifacts_dir, 'fact_cache')
@@ -32,24 +102,42 @@ def start_fact_cache(hosts, artifacts_dir, timeout=None, inventory_id=None, log_
         timeout = settings.ANSIBLE_FACT_CACHE_TIMEOUT
 
     last_write_time = None
-    for host in hosts:
-        hosts_cached.append(host.name)
-        if not host.ansible_facts_modified or (timeout and host.ansible_facts_modified < now() - datetime.timedelta(seconds=timeout)):
-            continue  # facts are expired - do not write them
-        filepath = os.path.join(fact_cache_dir, host.name)
-        if not os.path.realpath(filepath).startswith(fact_cache_dir):
-            logger.error(f'facts for host {smart_str(host.name)} could not be cached')
-            continue
-
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                os.chmod(f.name, 0o600)
-                json.dump(host.ansible_facts, f)
+    with ThreadPoolExecutor(max_workers=settings.ANSIBLE_FACT_CACHE_WORKERS) as pool:
+
+        def write_batch(batch):
+            nonlocal last_write_time
+            started = time.monotonic()
+            results = list(pool.map(_write_facts, [filepath for _, filepath in batch], [host.ansible_facts for host, _ in batch]))
+            log_data['write_time'] += time.monotonic() - started
+            hosts_to_update = []
+            for (host, _), written in zip(batch, results):
+                if written is None:
+                    logger.error(f'facts for host {smart_str(host.name)} could not be cached')
+                    continue
+                digest, last_write_time = written
+                facts_digests[host.name] = digest
                 log_data['written_ct'] += 1
-                last_write_time = os.path.getmtime(filepath)
-        except IOError:
-            logger.error(f'facts for host {smart_str(host.name)} could not be cached')
-            continue
+                if host.ansible_facts_digest != digest:
+                    # record the digest for hosts whose facts were saved before digests were kept
+                    host.ansible_facts_digest = digest
+                    hosts_to_update.append(host)
+            bulk_update_sorted_by_id(Host, hosts_to_update, fields=['ansible_facts_digest'])
+
+        batch = []
+        for host in hosts:
+            hosts_cached.append(host.name)
+            if not host.ansible_facts_modified or (timeout and host.ansible_facts_modified < now() - datetime.timedelta(seconds=timeout)):
+                continue  # facts are expired - do not write them
+            filepath = fact_cache_path(fact_cache_dir, host.name)
+            if filepath is None:
+                logger.error(f'facts for host {smart_str(host.name)} could not be cached')
+                continue
+            batch.append((host, filepath))
+            if len(batch) >= FACT_CACHE_BATCH_SIZE:
+                write_batch(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
 
     # Write summary file directly to the artifacts_dir
     if inventory_id is not None:
@@ -58,6 +146,7 @@ def start_fact_cache(hosts, artifacts_dir, timeout=None, inventory_id=None, log_
             'last_write_time': last_write_time,
             'hosts_cached': hosts_cached,
             'written_ct': log_data['written_ct'],
+            'facts_digests': facts_digests,
         }
         with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(summary_data, f, indent=2)
@@ -66,7 +155,10 @@ def start_fact_cache(hosts, artifacts_dir, timeout=None, inventory_id=None, log_
 @log_excess_runtime(
     logger,
     debug_cutoff=0.01,
-    msg='Inventory {inventory_id} host facts: updated {updated_ct}, cleared {cleared_ct}, unchanged {unmodified_ct}, took {delta:.3f} s',
+    msg=(
+        'Inventory {inventory_id} host facts: updated {updated_ct}, cleared {cleared_ct}, unchanged {unmodified_ct}, took {delta:.3f} s '
+        '(scanning files {scan_time:.3f} s, reading files {read_time:.3f} s, saving hosts {update_time:.3f} s)'
+    ),
     add_log_data=True,
 )
 def finish_fact_cache(artifacts_dir, job_id=None, inventory_id=None, log_data=None):
@@ -75,6 +167,9 @@ def finish_fact_cache(artifacts_dir, job_id=None, inventory_id=None, log_data=No
     log_data['updated_ct'] = 0
     log_data['unmodified_ct'] = 0
     log_data['cleared_ct'] = 0
+    log_data['scan_time'] = 0.0
+    log_data['read_time'] = 0.0
+    log_data['update_time'] = 0.0
     # The summary file is directly inside the artifacts dir
     summary_path = os.path.join(artifacts_dir, 'host_cache_summary.json')
     if not os.path.exists(summary_path):
@@ -90,31 +185,55 @@ def finish_fact_cache(artifacts_dir, job_id=None, inventory_id=None, log_data=No
         return
 
     host_names = summary.get('hosts_cached', [])
-    hosts_cached = Host.objects.filter(name__in=host_names).order_by('id').iterator()
+    facts_digests = summary.get('facts_digests', {})
+    # facts are compared by digest, so they are never loaded from the database
+    hosts_cached = Host.objects.filter(name__in=host_names).only('id', 'name', 'inventory_id', 'ansible_facts_digest').order_by('id').iterator()
     # Path where individual fact files were written
     fact_cache_dir = os.path.join(artifacts_dir, 'fact_cache')
+
+    # stat every fact file with one directory scan, instead of once per host
+    started = time.monotonic()
+    file_mtimes, links = {}, set()
+    try:
+        with os.scandir(fact_cache_dir) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    links.add(entry.name)
+                elif entry.is_file():
+                    file_mtimes[entry.name] = entry.stat().st_mtime
+    except FileNotFoundError:
+        pass
+    log_data['scan_time'] = time.monotonic() - started
+
     hosts_to_update = []
 
-    for host in hosts_cached:
-        filepath = os.path.join(fact_cache_dir, host.name)
-        if not os.path.realpath(filepath).startswith(fact_cache_dir):
-            logger.error(f'Invalid path for facts file: {filepath}')
-            continue
-
-        if os.path.exists(filepath):
-            # If the file changed since we wrote the last facts file, pre-playbook run...
-            modified = os.path.getmtime(filepath)
-            if not facts_write_time or modified >= facts_write_time:
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        ansible_facts = json.load(f)
-                except ValueError:
-                    continue
+    def save_hosts():
+        started = time.monotonic()
+        bulk_update_sorted_by_id(Host, hosts_to_update, fields=['ansible_facts', 'ansible_facts_digest', 'ansible_facts_modified'])
+        hosts_to_update.clear()
+        log_data['update_time'] += time.monotonic() - started
 
-                if ansible_facts != host.ansible_facts:
-                    host.ansible_facts = ansible_facts
-                    host.ansible_facts_modified = now()
-                    hosts_to_update.append(host)
+    def update_host(host, ansible_facts, digest):
+        host.ansible_facts = ansible_facts
+        host.ansible_facts_digest = digest
+        host.ansible_facts_modified = now()
+        hosts_to_update.append(host)
+        if len(hosts_to_update) >= 100:
+            save_hosts()
+
+    with ThreadPoolExecutor(max_workers=settings.ANSIBLE_FACT_CACHE_WORKERS) as pool:
+
+        def read_batch(batch):
+            started = time.monotonic()
+            current_digests = [host.ansible_facts_digest or facts_digests.get(host.name) for host, _ in batch]
+            results = list(pool.map(_read_facts, [filepath for _, filepath in batch], current_digests))
+            log_data['read_time'] += time.monotonic() - started
+            for (host, _), result in zip(batch, results):
+                if result is None:
+                    continue
+                digest, ansible_facts = result
+                if ansible_facts is not None:
+                    update_host(host, ansible_facts, digest)
                     logger.info(
                         f'New fact for inventory {smart_str(host.inventory.name)} host {smart_str(host.name)}',
                         extra=dict(
@@ -128,19 +247,33 @@ def finish_fact_cache(artifacts_dir, job_id=None, inventory_id=None, log_data=No
                     log_data['updated_ct'] += 1
                 else:
                     log_data['unmodified_ct'] += 1
-            else:
-                log_data['unmodified_ct'] += 1
-        else:
-            # if the file goes missing, ansible removed it (likely via clear_facts)
-            # if the file goes missing, but the host has not started facts, then we should not clear the facts
-            host.ansible_facts = {}
-            host.ansible_facts_modified = now()
-            hosts_to_update.append(host)
-            logger.info(f'Facts cleared for inventory {smart_str(host.inventory.name)} host {smart_str(host.name)}')
-            log_data['cleared_ct'] += 1
 
-        if len(hosts_to_update) >= 100:
-            bulk_update_sorted_by_id(Host, hosts_to_update, fields=['ansible_facts', 'ansible_facts_modified'])
-            hosts_to_update = []
+        batch = []
+        for host in hosts_cached:
+            filepath = fact_cache_path(fact_cache_dir, host.name)
+            if filepath is None or host.name in links:
+                logger.error(f'Invalid path for facts file: {os.path.join(fact_cache_dir, host.name)}')
+                continue
+
+            modified = file_mtimes.get(host.name)
+            if modified is None and host.ansible_facts_digest == EMPTY_FACTS_DIGEST:
+                log_data['unmodified_ct'] += 1
+            elif modified is None:
+                # if the file goes missing, ansible removed it (likely via clear_facts)
+                # if the file goes missing, but the host has not started facts, then we should not clear the facts
+                update_host(host, {}, EMPTY_FACTS_DIGEST)
+                logger.info(f'Facts cleared for inventory {smart_str(host.inventory.name)} host {smart_str(host.name)}')
+                log_data['cleared_ct'] += 1
+            elif facts_write_time and modified < facts_write_time:
+                # the file has not changed since the facts were written, pre-playbook run
+                log_data['unmodified_ct'] += 1
+            else:
+                batch.append((host, filepath))
+                if len(batch) >= FACT_CACHE_BATCH_SIZE:
+                    read_batch(batch)
+                    batch = []
+        if batch:
+            read_batch(batch)
 
-    bulk_update_sorted_by_id(Host, hosts_to_update, fields=['ansible_facts', 'ansible_facts_modified'])
+    if hosts_to_update:
+        save_hosts()
@@ -2,6 +2,7 @@
 from collections import OrderedDict
 import errno
 import functools
+import itertools
 import fcntl
 import json
 import logging
@@ -137,7 +138,10 @@ class BaseTask(object):
         file = Path(file_path)
         file.touch(mode=file_permissions, exist_ok=True)
         with open(file_path, 'w') as f:
-            f.write(data)
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                f.writelines(data)
         return file_path
 
     def get_path_to(self, *args):
@@ -314,12 +318,15 @@ class BaseTask(object):
         return env
 
     def write_inventory_file(self, inventory, private_data_dir, file_name, script_params):
-        script_data = inventory.get_script_data(**script_params)
-        for hostname, hv in script_data.get('_meta', {}).get('hostvars', {}).items():
-            # maintain a list of host_name --> host_id
-            # so we can associate emitted events to Host objects
-            self.runner_callback.host_map[hostname] = hv.get('remote_tower_id', '')
-        file_content = '#! /usr/bin/env python3\n# -*- coding: utf-8 -*-\nprint(%r)\n' % json.dumps(script_data)
+        # maintain a list of host_name --> host_id
+        # so we can associate emitted events to Host objects
+        script_data = inventory.iter_script_data_json(host_map=self.runner_callback.host_map, **script_params)
+        # the JSON is written as it is generated, as adjacent string literals the script prints joined
+        file_content = itertools.chain(
+            ['#! /usr/bin/env python3\n# -*- coding: utf-8 -*-\nprint(\n'],
+            ('%r\n' % chunk for chunk in script_data),
+            [')\n'],
+        )
         return self.write_private_data_file(private_data_dir, file_name, file_content, sub_dir='inventory', file_permissions=0o700)
 
     def build_inventory(self, instance, private_data_dir):
@@ -17,6 +17,7 @@ from datetime import datetime
 # Django
 from django.conf import settings
 from django.db import connection, transaction, DatabaseError, IntegrityError
+from django.db.models import Exists, OuterRef
 from django.db.models.fields.related import ForeignKey
 from django.utils.timezone import now, timedelta
 from django.utils.encoding import smart_str
@@ -46,8 +47,11 @@ from awx.main.models import (
     UnifiedJob,
     Notification,
     Inventory,
+    Host,
     SmartInventoryMembership,
     Job,
+    JobEventsChildrenSummary,
+    AccessibleObjectSet,
     convert_jsonfields,
 )
 from awx.main.constants import ACTIVE_STATES
@@ -87,6 +91,10 @@ def dispatch_startup():
     except Exception:
         logger.exception("Failed json field conversion, skipping.")
 
+    if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE:
+        # role access changes were not tracked since the sets were built
+        AccessibleObjectSet.clear()
+
     startup_logger.debug("Syncing Schedules")
     for sch in Schedule.objects.all():
         try:
@@ -367,12 +375,44 @@ def gather_analytics():
 
 
 @task(queue=get_task_queuename)
-def purge_old_stdout_files():
-    nowtime = time.time()
-    for f in os.listdir(settings.JOBOUTPUT_ROOT):
-        if os.path.getctime(os.path.join(settings.JOBOUTPUT_ROOT, f)) < nowtime - settings.LOCAL_STDOUT_EXPIRE_TIME:
-            os.unlink(os.path.join(settings.JOBOUTPUT_ROOT, f))
-            logger.debug("Removing {}".format(os.path.join(settings.JOBOUTPUT_ROOT, f)))
+def archive_job_stdout(job_id):
+    try:
+        job = UnifiedJob.objects.get(pk=job_id)
+    except UnifiedJob.DoesNotExist:
+        return
+    if job.result_stdout_text or not job.event_processing_finished:
+        return
+    archive = job.archive_stdout()
+    logger.debug(f'Archived {archive.line_count} lines of stdout for {job.log_format}')
+
+
+@task(queue=get_task_queuename)
+def save_job_events_children_summary(job_id, final_counter, retries=5):
+    try:
+        job = Job.objects.get(pk=job_id)
+    except Job.DoesNotExist:
+        return
+    if JobEventsChildrenSummary.objects.filter(job=job).exists():
+        return
+    # the job may still be finishing, so its emitted_events are not set yet; the
+    # EOF of its stdout tells how many events it sent instead
+    if job.get_event_queryset().count() != final_counter:
+        # unless the callback queues are sharded by job, other callback receiver
+        # workers may still buffer events of the job, so check again once they flushed
+        if retries > 0:
+            time.sleep(settings.JOB_EVENT_BUFFER_SECONDS)
+            save_job_events_children_summary(job_id, final_counter, retries=retries - 1)
+        # else events are missing, leave the summary to the endpoint, which waits for event processing to finish
+        return
+    JobEventsChildrenSummary.create_for_job(job)
+    logger.debug(f'Saved the children summary of the events of {job.log_format}')
+
+
+@task(queue=get_task_queuename)
+def build_accessible_object_set(user_id, role_field, content_type_ids):
+    if not settings.RBAC_ACCESSIBLE_OBJECTS_CACHE:
+        return
+    AccessibleObjectSet.build(user_id, role_field, content_type_ids)
 
 
 def _cleanup_images_and_files(**kwargs):
@@ -813,34 +853,51 @@ def update_inventory_computed_fields(inventory_id):
         logger.debug('Exiting duplicate update_inventory_computed_fields task.')
 
 
-def update_smart_memberships_for_inventory(smart_inventory):
-    current = set(SmartInventoryMembership.objects.filter(inventory=smart_inventory).values_list('host_id', flat=True))
-    new = set(smart_inventory.hosts.values_list('id', flat=True))
-    additions = new - current
-    removals = current - new
-    if additions or removals:
-        with transaction.atomic():
-            if removals:
-                SmartInventoryMembership.objects.filter(inventory=smart_inventory, host_id__in=removals).delete()
-            if additions:
-                add_for_inventory = [SmartInventoryMembership(inventory_id=smart_inventory.id, host_id=host_id) for host_id in additions]
-                SmartInventoryMembership.objects.bulk_create(add_for_inventory, ignore_conflicts=True)
-        logger.debug(
-            'Smart host membership cached for {}, {} additions, {} removals, {} total count.'.format(
-                smart_inventory.pk, len(additions), len(removals), len(new)
+def update_smart_memberships_for_inventory(smart_inventory, host_names=None):
+    """
+    Bring the memberships of a smart inventory in line with its host_filter,
+    with one DELETE and one INSERT ... SELECT statement.  With host_names only
+    the memberships of hosts by those names are rebuilt, which is all a change
+    to those hosts can affect.
+    """
+    matches = Host.objects.smart_filter_matches(smart_inventory)
+    # a smart inventory has the first matching host by each name, found with NOT EXISTS rather than DISTINCT ON so it works on any database
+    hosts = matches.exclude(Exists(matches.filter(name=OuterRef('name'), pk__lt=OuterRef('pk'))))
+    memberships = SmartInventoryMembership.objects.filter(inventory=smart_inventory)
+    if host_names is not None:
+        hosts = hosts.filter(name__in=host_names)
+        memberships = memberships.filter(host__name__in=host_names)
+    hosts_sql, hosts_params = hosts.order_by().values('id').query.sql_with_params()
+    table = SmartInventoryMembership._meta.db_table
+    with transaction.atomic():
+        removals, _ = memberships.exclude(Exists(hosts.filter(pk=OuterRef('host_id')))).delete()
+        with connection.cursor() as cursor:
+            # the WHERE keeps SQLite from reading ON CONFLICT as a join constraint
+            cursor.execute(
+                f'INSERT INTO {table} (inventory_id, host_id) SELECT %s, smart_hosts.id FROM ({hosts_sql}) AS smart_hosts WHERE true '
+                'ON CONFLICT (inventory_id, host_id) DO NOTHING',
+                [smart_inventory.id, *hosts_params],
             )
-        )
+            additions = cursor.rowcount
+    if additions or removals:
+        logger.debug('Smart host membership cached for {}, {} additions, {} removals.'.format(smart_inventory.pk, additions, removals))
         return True  # changed
     return False
 
 
 @task(queue=get_task_queuename)
-def update_host_smart_inventory_memberships():
+def update_host_smart_inventory_memberships(inventory_id=None, host_names=None):
+    """
+    Rebuild the memberships of one smart inventory, or of all of them.  With
+    host_names only the memberships of hosts by those names are rebuilt.
+    """
     smart_inventories = Inventory.objects.filter(kind='smart', host_filter__isnull=False, pending_deletion=False)
+    if inventory_id is not None:
+        smart_inventories = smart_inventories.filter(pk=inventory_id)
     changed_inventories = set([])
     for smart_inventory in smart_inventories:
         try:
-            changed = update_smart_memberships_for_inventory(smart_inventory)
+            changed = update_smart_memberships_for_inventory(smart_inventory, host_names=host_names)
             if changed:
                 changed_inventories.add(smart_inventory)
         except IntegrityError:
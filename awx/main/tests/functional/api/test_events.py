@@ -1,7 +1,7 @@
 import pytest
 
 from awx.api.versioning import reverse
-from awx.main.models import AdHocCommand, AdHocCommandEvent, JobEvent
+from awx.main.models import AdHocCommand, AdHocCommandEvent, JobEvent, JobEventsChildrenSummary
 
 
 @pytest.mark.django_db
@@ -86,6 +86,13 @@ def test_job_job_events_children_summary(get, organization_factory, job_template
     assert response.data["event_processing_finished"] == True
     assert response.data["is_tree"] == True
 
+    # the summary is computed once, later requests do not read the events
+    assert JobEventsChildrenSummary.objects.filter(job=job).exists()
+    job.get_event_queryset().delete()
+    response = get(url, user=objs.superusers.admin, expect=200)
+    assert response.data["children_summary"] == {1: {"rowNumber": 0, "numChildren": 4}, 2: {"rowNumber": 1, "numChildren": 2}}
+    assert response.data["meta_event_nested_uuid"] == {4: "uuid2"}
+
 
 @pytest.mark.django_db
 def test_job_job_events_children_summary_is_tree(get, organization_factory, job_template_factory):
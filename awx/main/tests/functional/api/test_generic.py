@@ -58,6 +58,14 @@ class TestDeleteViews:
         delete(reverse('api:inventory_source_hosts_list', kwargs={'pk': inventory_source.pk}), user=rando, expect=204)
         assert inventory_source.hosts.count() == 0
 
+    def test_sublist_delete_invalidates_script_data(self, inventory_source, host, group, admin_user, delete):
+        inventory_source.hosts.add(host)
+        inventory = inventory_source.inventory
+        assert inventory.get_script_data()[group.name]['hosts'] == [host.name]
+        delete(reverse('api:inventory_source_hosts_list', kwargs={'pk': inventory_source.pk}), user=admin_user, expect=204)
+        inventory.refresh_from_db()
+        assert group.name not in inventory.get_script_data()
+
     def test_destroy_permission_check(self, job_factory, system_auditor, delete):
         job = job_factory()
         resp = delete(job.get_absolute_url(), user=system_auditor)
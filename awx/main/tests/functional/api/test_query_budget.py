@@ -0,0 +1,238 @@
+import pytest
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, URLResolver
+from django.utils.timezone import now
+
+from awx.api.generics import ListAPIView, ParentMixin
+from awx.api.urls import urlpatterns as api_patterns
+from awx.api.versioning import reverse
+from awx.api.views import UnifiedJobList, UnifiedJobTemplateList
+from awx.main.models import (
+    AdHocCommand,
+    CredentialType,
+    ExecutionEnvironment,
+    HostMetric,
+    HostMetricSummaryMonthly,
+    Instance,
+    InstanceGroup,
+    Inventory,
+    InventorySource,
+    InventoryUpdate,
+    Job,
+    JobTemplate,
+    Label,
+    Notification,
+    Organization,
+    Project,
+    ProjectUpdate,
+    Schedule,
+    SystemJobTemplate,
+    Team,
+    UnifiedJob,
+    UnifiedJobTemplate,
+    User,
+    WorkflowApproval,
+    WorkflowJob,
+    WorkflowJobNode,
+    WorkflowJobTemplate,
+    WorkflowJobTemplateNode,
+)
+
+# queries an empty list may make, mostly settings, auth and the count
+EMPTY_LIST_BUDGET = 30
+
+# rows seeded in a list, as many as a query repeated for each of them takes to be an N+1 candidate
+SEEDED_ROWS = 10
+
+# make row i of each list, from the fixtures looked up by name with fixture()
+LIST_SEEDS = {
+    'ad_hoc_command_list': lambda i, fixture: AdHocCommand.objects.create(name='adhoc-{}'.format(i), inventory=fixture('inventory')),
+    'constructed_inventory_list': lambda i, fixture: Inventory.objects.create(
+        name='constructed-{}'.format(i), kind='constructed', organization=fixture('organization')
+    ),
+    'credential_list': lambda i, fixture: fixture('credentialtype_ssh').credentials.create(name='cred-{}'.format(i), organization=fixture('organization')),
+    'credential_type_list': lambda i, fixture: CredentialType.objects.create(name='type-{}'.format(i), kind='cloud', inputs={}),
+    'execution_environment_list': lambda i, fixture: ExecutionEnvironment.objects.create(name='ee-{}'.format(i), image='quay.io/ee:{}'.format(i)),
+    'group_list': lambda i, fixture: fixture('inventory').groups.create(name='group-{}'.format(i)),
+    'host_list': lambda i, fixture: fixture('inventory').hosts.create(name='host-{}'.format(i)),
+    'host_metric_list': lambda i, fixture: HostMetric.objects.create(hostname='host-{}'.format(i), last_automation=now()),
+    'host_metric_summary_monthly_list': lambda i, fixture: HostMetricSummaryMonthly.objects.create(date=date(2020, i + 1, 1)),
+    'instance_group_list': lambda i, fixture: InstanceGroup.objects.create(name='ig-{}'.format(i)),
+    'instance_list': lambda i, fixture: Instance.objects.create(hostname='instance-{}'.format(i)),
+    'inventory_list': lambda i, fixture: Inventory.objects.create(name='inv-{}'.format(i), organization=fixture('organization')),
+    'inventory_source_list': lambda i, fixture: InventorySource.objects.create(name='src-{}'.format(i), inventory=fixture('inventory'), source='ec2'),
+    'inventory_update_list': lambda i, fixture: InventoryUpdate.objects.create(
+        name='update-{}'.format(i), inventory_source=fixture('inventory_source'), source='ec2'
+    ),
+    'job_list': lambda i, fixture: Job.objects.create(
+        name='job-{}'.format(i), job_template=fixture('job_template'), inventory=fixture('inventory'), project=fixture('project')
+    ),
+    'job_template_list': lambda i, fixture: JobTemplate.objects.create(name='jt-{}'.format(i), inventory=fixture('inventory'), project=fixture('project')),
+    'label_list': lambda i, fixture: Label.objects.create(name='label-{}'.format(i), organization=fixture('organization')),
+    'notification_list': lambda i, fixture: Notification.objects.create(
+        notification_template=fixture('notification_template'), notification_type='webhook', subject='n-{}'.format(i)
+    ),
+    'notification_template_list': lambda i, fixture: fixture('notification_template').__class__.objects.create(
+        name='nt-{}'.format(i),
+        organization=fixture('organization'),
+        notification_type='webhook',
+        notification_configuration=fixture('notification_template').notification_configuration,
+    ),
+    'organization_list': lambda i, fixture: Organization.objects.create(name='org-{}'.format(i)),
+    'project_list': lambda i, fixture: Project.objects.create(name='proj-{}'.format(i), organization=fixture('organization')),
+    'project_update_list': lambda i, fixture: ProjectUpdate.objects.create(name='update-{}'.format(i), project=fixture('project')),
+    'schedule_list': lambda i, fixture: Schedule.objects.create(
+        name='schedule-{}'.format(i), unified_job_template=fixture('job_template'), rrule='DTSTART:20151117T050000Z RRULE:FREQ=DAILY;INTERVAL=1;COUNT=1'
+    ),
+    # not system_job_list, its rows include their stdout, which is read with PostgreSQL COPY
+    'system_job_template_list': lambda i, fixture: SystemJobTemplate.objects.create(name='system-jt-{}'.format(i), job_type='cleanup_jobs'),
+    'team_list': lambda i, fixture: Team.objects.create(name='team-{}'.format(i), organization=fixture('organization')),
+    'unified_job_list': lambda i, fixture: Job.objects.create(name='job-{}'.format(i), job_template=fixture('job_template')),
+    'unified_job_template_list': lambda i, fixture: JobTemplate.objects.create(
+        name='jt-{}'.format(i), inventory=fixture('inventory'), project=fixture('project')
+    ),
+    'user_list': lambda i, fixture: User.objects.create(username='user-{}'.format(i)),
+    'workflow_approval_list': lambda i, fixture: WorkflowApproval.objects.create(name='approval-{}'.format(i)),
+    'workflow_job_list': lambda i, fixture: WorkflowJob.objects.create(name='wj-{}'.format(i), workflow_job_template=fixture('workflow_job_template')),
+    'workflow_job_node_list': lambda i, fixture: WorkflowJobNode.objects.create(
+        workflow_job=fixture('workflow_job_factory')(), unified_job_template=fixture('job_template')
+    ),
+    'workflow_job_template_list': lambda i, fixture: WorkflowJobTemplate.objects.create(name='wfjt-{}'.format(i), organization=fixture('organization')),
+    'workflow_job_template_node_list': lambda i, fixture: WorkflowJobTemplateNode.objects.create(
+        workflow_job_template=fixture('workflow_job_template'), unified_job_template=fixture('job_template')
+    ),
+}
+
+# seeded lists whose queries still grow with their rows, pinned at what SEEDED_ROWS rows take so they can only go down
+PER_ROW_QUERIES = {
+    'constructed_inventory_list': 14,
+    'instance_group_list': 15,
+    'instance_list': 94,
+    'user_list': 67,
+    'workflow_job_node_list': 20,
+}
+
+
+@pytest.fixture(autouse=True)
+def settings_loaded_by_test():
+    # settings an earlier test left in memory could expire mid-test, and be read from the database
+    # again, as the cache behind them is cleared between tests; have the first request load them
+    settings._awx_conf_memoizedcache.clear()
+
+
+def warm_caches(url, user, get):
+    # start every count from the same caches: cleared, then loaded by one request, so
+    # that none an earlier test left behind goes cold between two counts
+    cache.clear()
+    settings._awx_conf_memoizedcache.clear()
+    ContentType.objects.clear_cache()
+    get(url, user, expect=200)
+
+
+def list_view_names():
+    names = set()
+    unprocessed = list(api_patterns)
+    while unprocessed:
+        pattern = unprocessed.pop()
+        if isinstance(pattern, URLResolver):
+            unprocessed.extend(pattern.url_patterns)
+            continue
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if pattern.name and view_class and issubclass(view_class, ListAPIView) and not issubclass(view_class, ParentMixin):
+            names.add(pattern.name)
+    return sorted(names)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('view_name', list_view_names())
+def test_list_query_budget(view_name, admin, get, assert_query_budget, request):
+    try:
+        url = reverse('api:{}'.format(view_name))
+    except NoReverseMatch:
+        pytest.skip('{} needs url arguments'.format(view_name))
+    seed = LIST_SEEDS.get(view_name)
+    if seed is None:
+        # lists of objects the system makes itself, or which need more setup than a row
+        assert_query_budget(url, admin, EMPTY_LIST_BUDGET)
+        return
+    seed(0, request.getfixturevalue)
+    warm_caches(url, admin, get)
+    one_row = int(assert_query_budget(url, admin, EMPTY_LIST_BUDGET)['X-API-Query-Count'])
+    for i in range(1, SEEDED_ROWS):
+        seed(i, request.getfixturevalue)
+    warm_caches(url, admin, get)
+    if view_name in PER_ROW_QUERIES:
+        pinned = PER_ROW_QUERIES[view_name]
+        response = assert_query_budget(url, admin, pinned, n_plus_one_threshold=pinned + 1)
+    else:
+        response = assert_query_budget(url, admin, one_row, n_plus_one_threshold=SEEDED_ROWS)
+    assert response.data['count'] >= SEEDED_ROWS
+
+
+@pytest.mark.django_db
+def test_query_profile_headers(organization, admin, assert_query_budget):
+    response = assert_query_budget(reverse('api:organization_list'), admin, EMPTY_LIST_BUDGET)
+    assert int(response['X-API-Query-Count']) > 0
+    assert response['X-API-Query-Time'].endswith('s')
+    assert 'OrganizationSerializer.' in response['X-API-Query-Sections']
+
+
+def list_queries(get, url, user):
+    with CaptureQueriesContext(connection) as queries:
+        get(url, user, expect=200)
+    return len(queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('view_name', sorted(LIST_SEEDS))
+def test_list_summary_fields_selected(view_name, get, admin, request):
+    url = reverse('api:{}'.format(view_name))
+    for i in range(SEEDED_ROWS):
+        LIST_SEEDS[view_name](i, request.getfixturevalue)
+    # warm up caches, like content types
+    list_queries(get, url, admin)
+    selected = list_queries(get, url, admin)
+    with mock.patch.object(ListAPIView, 'select_summary_related', lambda self, qs: qs):
+        unselected = list_queries(get, url, admin)
+    # joining the summarized objects never costs queries, and saves one per row where the access class does not join them already
+    assert selected <= unselected
+    if view_name in ('inventory_source_list', 'workflow_job_list'):
+        assert unselected - selected >= SEEDED_ROWS
+
+
+@pytest.mark.django_db
+def test_polymorphic_lists_not_selected(admin):
+    # django-polymorphic would load their rows again as subclasses without the joined objects
+    for view_class, model in ((UnifiedJobTemplateList, UnifiedJobTemplate), (UnifiedJobList, UnifiedJob)):
+        assert view_class().select_summary_related(model.objects.all()).query.select_related is False
+
+
+@pytest.mark.django_db
+def test_prefetched_summaries_match_detail(get, admin, job_template, workflow_job_template, notification_template, organization):
+    for i in range(12):
+        Job.objects.create(name='job-{}'.format(i), job_template=job_template, job_slice_count=2 if i % 3 == 0 else 1)
+        WorkflowJob.objects.create(name='wj-{}'.format(i), workflow_job_template=workflow_job_template)
+        Notification.objects.create(notification_template=notification_template, notification_type='webhook', subject='n-{}'.format(i))
+    for i in range(3):
+        label = Label.objects.create(name='label-{}'.format(i), organization=organization)
+        job_template.labels.add(label)
+        workflow_job_template.labels.add(label)
+    for list_name, detail_name, obj, keys in (
+        ('job_template_list', 'job_template_detail', job_template, ('recent_jobs', 'labels', 'credentials')),
+        ('unified_job_template_list', 'job_template_detail', job_template, ('recent_jobs', 'labels', 'credentials')),
+        ('workflow_job_template_list', 'workflow_job_template_detail', workflow_job_template, ('recent_jobs', 'labels')),
+        ('notification_template_list', 'notification_template_detail', notification_template, ('recent_notifications',)),
+    ):
+        listed = get(reverse('api:{}'.format(list_name)), admin, expect=200).data['results']
+        listed_summary = [result for result in listed if result['id'] == obj.id][0]['summary_fields']
+        detail_summary = get(reverse('api:{}'.format(detail_name), kwargs={'pk': obj.pk}), admin, expect=200).data['summary_fields']
+        for key in keys:
+            assert listed_summary[key] == detail_summary[key], (list_name, key)
+    assert len(listed_summary['recent_notifications']) == 5
@@ -1,10 +1,27 @@
 import pytest
 
 from awx.api.versioning import reverse
+from django.conf import settings
 from django.test.client import RequestFactory
 
-from awx.main.models import Role, Group, UnifiedJobTemplate, JobTemplate, WorkflowJobTemplate
-from awx.main.access import access_registry, WorkflowJobTemplateAccess
+from awx.main.models import (
+    AdHocCommand,
+    ExecutionEnvironment,
+    Group,
+    InventoryUpdate,
+    Job,
+    JobTemplate,
+    NotificationTemplate,
+    Organization,
+    ProjectUpdate,
+    Role,
+    Schedule,
+    UnifiedJob,
+    UnifiedJobTemplate,
+    WorkflowJob,
+    WorkflowJobTemplate,
+)
+from awx.main.access import access_registry, get_page_capabilities, WorkflowJobTemplateAccess
 from awx.main.utils import prefetch_page_capabilities
 from awx.api.serializers import JobTemplateSerializer, UnifiedJobTemplateSerializer
 
@@ -275,7 +292,7 @@ def test_prefetch_ujt_project_capabilities(alice, project, job_template, mocker)
 
     # Project form of UJT serializer does not fill in or reference the prefetch dict
     list_serializer.child.to_representation(project)
-    assert 'capability_map' not in list_serializer.child.context
+    assert not any(key.startswith('capability_map') for key in list_serializer.child.context)
 
 
 @pytest.mark.django_db
@@ -286,6 +303,110 @@ def test_prefetch_group_capabilities(group, rando):
     assert mapping[group.id] == {'edit': False, 'adhoc': True}
 
 
+@pytest.mark.django_db
+def test_prefetch_capabilities_single_query(job_template, project, inventory, rando, django_assert_num_queries):
+    job_template.project = project
+    job_template.inventory = inventory
+    job_template.save()
+    job_template.execute_role.members.add(rando)
+
+    qs = list(JobTemplate.objects.all())
+    with django_assert_num_queries(1):
+        mapping = prefetch_page_capabilities(JobTemplate, qs, ['admin', 'execute', {'copy': ['project.use', 'inventory.use']}], rando)
+    assert mapping[job_template.id] == {'edit': False, 'start': True, 'copy': False}
+
+
+@pytest.mark.django_db
+def test_capability_query_count_header(get, alice):
+    # a cold settings cache would add the lookup of MANAGE_ORGANIZATION_AUTH to the first count
+    settings.MANAGE_ORGANIZATION_AUTH
+    query_counts = []
+    for num_orgs in (1, 10):
+        for i in range(Organization.objects.count(), num_orgs):
+            org = Organization.objects.create(name='org-{}'.format(i))
+            org.member_role.members.add(alice)
+            if i % 2:
+                org.admin_role.members.add(alice)
+
+        response = get(reverse('api:organization_list'), alice)
+        assert [result['summary_fields']['user_capabilities']['edit'] for result in response.data['results']] == [bool(i % 2) for i in range(num_orgs)]
+        query_counts.append(response['X-API-Capability-Query-Count'])
+    # the capabilities of a page take the same queries however many rows it has
+    assert query_counts == ['1', '1']
+
+
+@pytest.fixture
+def capability_pages(
+    organization, project, inventory, inventory_source, machine_credential, notification_template, workflow_job_template, system_job_template, bob
+):
+    job_template = JobTemplate.objects.create(name='jt', organization=organization, inventory=inventory, project=project)
+    orphan_job_template = JobTemplate.objects.create(name='orphan-jt')
+    orphan_nt = NotificationTemplate.objects.create(
+        name='orphan-nt', notification_type='webhook', notification_configuration=notification_template.notification_configuration
+    )
+    jobs = [
+        Job.objects.create(name='job', job_template=job_template, organization=organization),
+        Job.objects.create(name='orphan-job'),
+        Job.objects.create(name='orphan-jt-job', job_template=orphan_job_template),
+        ProjectUpdate.objects.create(name='update', project=project),
+        InventoryUpdate.objects.create(name='update', inventory_source=inventory_source, inventory=inventory, source='ec2'),
+        InventoryUpdate.objects.create(name='update-without-inventory', inventory_source=inventory_source, source='ec2'),
+        AdHocCommand.objects.create(name='adhoc', inventory=inventory, credential=machine_credential),
+        AdHocCommand.objects.create(name='adhoc-without-credential', inventory=inventory),
+        WorkflowJob.objects.create(name='wj', workflow_job_template=workflow_job_template),
+        WorkflowJob.objects.create(name='orphan-wj'),
+    ]
+    rrule = 'DTSTART:20151117T050000Z RRULE:FREQ=DAILY;INTERVAL=1;COUNT=1'
+    for ujt in (job_template, project, inventory_source, system_job_template):
+        Schedule.objects.create(name='schedule-{}'.format(ujt.id), unified_job_template=ujt, rrule=rrule)
+    Schedule.objects.create(name='bobs-schedule', unified_job_template=job_template, rrule=rrule, created_by=bob)
+    ExecutionEnvironment.objects.create(name='managed', image='quay.io/managed', managed=True)
+    ExecutionEnvironment.objects.create(name='global', image='quay.io/global')
+    ExecutionEnvironment.objects.create(name='org', image='quay.io/org', organization=organization)
+
+    for role in (
+        job_template.execute_role,
+        workflow_job_template.execute_role,
+        machine_credential.use_role,
+        inventory.adhoc_role,
+        inventory.update_role,
+        project.update_role,
+    ):
+        role.members.add(bob)
+    # pages with the show_capabilities of their serializers
+    return [
+        (['start', 'delete'], list(UnifiedJob.objects.filter(pk__in=[job.pk for job in jobs]))),
+        (['edit', 'delete', 'copy'], list(NotificationTemplate.objects.filter(pk__in=[notification_template.pk, orphan_nt.pk]))),
+        (['edit', 'delete', 'copy'], list(ExecutionEnvironment.objects.all())),
+        (['edit', 'delete'], list(Schedule.objects.prefetch_related('unified_job_template'))),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('username', ['admin', 'alice', 'bob', 'rando'])
+def test_page_capabilities_match_object_checks(capability_pages, username, organization, request):
+    user = request.getfixturevalue(username)
+    organization.admin_role.members.add(request.getfixturevalue('alice'))
+    for method_list, page in capability_pages:
+        page_capabilities = get_page_capabilities(user, page)
+        for obj in page:
+            access = access_registry[type(obj)](user)
+            expected = {method: bool(value) for method, value in access.get_user_capabilities(obj, method_list=method_list).items()}
+            assert access.get_user_capabilities(obj, method_list=method_list, page_capabilities=page_capabilities.get(obj.id, {})) == expected, obj
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('view_name', ['unified_job_list', 'notification_template_list', 'execution_environment_list', 'schedule_list'])
+def test_page_capability_query_count(capability_pages, view_name, get, alice, organization):
+    organization.admin_role.members.add(alice)
+    settings.MANAGE_ORGANIZATION_AUTH
+    response = get(reverse('api:{}'.format(view_name)), alice)
+    assert response.data['count'] > 0
+    # one query for each type of job, the notification templates also prefetch copy,
+    # and the schedule of the inventory source is checked on its own
+    assert response['X-API-Capability-Query-Count'] == {'unified_job_list': '5', 'notification_template_list': '2', 'schedule_list': '3'}.get(view_name, '1')
+
+
 @pytest.mark.django_db
 def test_prefetch_jt_copy_capability(job_template, project, inventory, rando):
     job_template.project = project
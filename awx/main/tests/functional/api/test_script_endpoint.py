@@ -10,7 +10,7 @@ def test_empty_inventory(post, get, admin_user, organization, group_factory):
     inventory = Inventory(name='basic_inventory', kind='', organization=organization)
     inventory.save()
     resp = get(reverse('api:inventory_script_view', kwargs={'pk': inventory.pk}), admin_user)
-    jdata = json.loads(resp.content)
+    jdata = json.loads(b''.join(resp.streaming_content))
     jdata.pop('all')
 
     assert inventory.hosts.count() == 0
@@ -24,6 +24,20 @@ def test_ungrouped_hosts(post, get, admin_user, organization, group_factory):
     Host.objects.create(name='first_host', inventory=inventory)
     Host.objects.create(name='second_host', inventory=inventory)
     resp = get(reverse('api:inventory_script_view', kwargs={'pk': inventory.pk}), admin_user)
-    jdata = json.loads(resp.content)
+    jdata = json.loads(b''.join(resp.streaming_content))
     assert inventory.hosts.count() == 2
     assert len(jdata['all']['hosts']) == 2
+
+
+@pytest.mark.django_db
+def test_streamed_hostvars(get, admin_user, organization):
+    inventory = Inventory.objects.create(name='basic_inventory', kind='', organization=organization)
+    host = Host.objects.create(name='first_host', inventory=inventory, variables={'foo': 'bar'})
+    Host.objects.create(name='second_host', inventory=inventory, enabled=False)
+    inventory.groups.create(name='web').hosts.add(host)
+    resp = get(reverse('api:inventory_script_view', kwargs={'pk': inventory.pk}) + '?hostvars=1', admin_user)
+    assert json.loads(b''.join(resp.streaming_content)) == {
+        'all': {'hosts': [], 'children': ['web']},
+        'web': {'hosts': ['first_host']},
+        '_meta': {'hostvars': {'first_host': {'foo': 'bar'}}},
+    }
@@ -28,6 +28,13 @@ from awx.main.models import (
 )
 
 
+def _response_text(response):
+    # downloads are streamed
+    if response.streaming:
+        return smart_str(b''.join(response.streaming_content))
+    return smart_str(response.content)
+
+
 def _mk_project_update(created=None):
     kwargs = {}
     if created:
@@ -65,7 +72,7 @@ def test_text_stdout(sqlite_copy, Parent, Child, relation, view, get, admin):
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=txt'
 
     response = get(url, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['Testing %d' % i for i in range(3)]
+    assert _response_text(response).splitlines() == ['Testing %d' % i for i in range(3)]
 
 
 @pytest.mark.django_db
@@ -89,14 +96,14 @@ def test_ansi_stdout_filtering(sqlite_copy, Parent, Child, relation, view, downl
     # ansi codes in ?format=txt should get filtered
     fmt = "?format={}".format("txt_download" if download else "txt")
     response = get(url + fmt, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['Testing %d' % i for i in range(3)]
+    assert _response_text(response).splitlines() == ['Testing %d' % i for i in range(3)]
     has_download_header = response.has_header('Content-Disposition')
     assert has_download_header if download else not has_download_header
 
     # ask for ansi and you'll get it
     fmt = "?format={}".format("ansi_download" if download else "ansi")
     response = get(url + fmt, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['\x1b[0;36mTesting %d\x1b[0m' % i for i in range(3)]
+    assert _response_text(response).splitlines() == ['\x1b[0;36mTesting %d\x1b[0m' % i for i in range(3)]
     has_download_header = response.has_header('Content-Disposition')
     assert has_download_header if download else not has_download_header
 
@@ -119,9 +126,9 @@ def test_colorized_html_stdout(sqlite_copy, Parent, Child, relation, view, get,
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=html'
 
     response = get(url, user=admin, expect=200)
-    assert '.ansi36 { color: #2dbaba; }' in smart_str(response.content)
+    assert '.ansi36 { color: #2dbaba; }' in _response_text(response)
     for i in range(3):
-        assert '<span class="ansi36">Testing {}</span>'.format(i) in smart_str(response.content)
+        assert '<span class="ansi36">Testing {}</span>'.format(i) in _response_text(response)
 
 
 @pytest.mark.django_db
@@ -145,6 +152,27 @@ def test_stdout_line_range(sqlite_copy, Parent, Child, relation, view, get, admi
     assert re.findall('Testing [0-9]+', smart_str(response.content)) == ['Testing %d' % i for i in range(5, 10)]
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('start_line, end_line, expected', [(0, 4, range(0, 4)), (5, 13, range(5, 13)), (-3, None, range(27, 30))])
+def test_stdout_line_range_across_events(start_line, end_line, expected, get, admin, settings):
+    settings.STDOUT_LINE_INDEX_INTERVAL = 2
+    created = tz_now()
+    job = Job(created=created, status='successful', emitted_events=10)
+    job.save()
+    for i in range(10):
+        lines = ['Line {}'.format(3 * i + n) for n in range(3)]
+        JobEvent(job=job, stdout='\r\n'.join(lines), counter=i + 1, start_line=3 * i, end_line=3 * i + 3, job_created=created).save()
+    url = reverse('api:job_stdout', kwargs={'pk': job.pk}) + '?format=json&start_line={}'.format(start_line)
+    if end_line is not None:
+        url += '&end_line={}'.format(end_line)
+
+    response = get(url, user=admin, expect=200)
+    assert smart_str(response.data['content']).splitlines() == ['Line %d' % i for i in expected]
+    assert response.data['range'] == {'start': expected[0], 'end': expected[-1] + 1, 'absolute_end': 30}
+    # the line index of a finished job is cached
+    assert job.get_stdout_line_index() == (30, [(0, 1), (6, 3), (12, 5), (18, 7), (24, 9)])
+
+
 @pytest.mark.django_db
 def test_text_stdout_from_system_job_events(sqlite_copy, get, admin):
     created = tz_now()
@@ -195,13 +223,13 @@ def test_max_bytes_display(sqlite_copy, Parent, Child, relation, view, fmt, get,
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == (
+    assert _response_text(response) == (
         'Standard Output too large to display ({actual} bytes), only download '
         'supported for sizes over {max} bytes.'.format(actual=total_bytes, max=settings.STDOUT_MAX_BYTES_DISPLAY)
     )
 
     response = get(url + '?format={}_download'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == large_stdout
+    assert _response_text(response) == large_stdout
 
 
 @pytest.mark.django_db
@@ -218,7 +246,7 @@ def test_legacy_result_stdout_text_fallback(Cls, view, fmt, get, admin):
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == 'LEGACY STDOUT!'
+    assert _response_text(response) == 'LEGACY STDOUT!'
 
 
 @pytest.mark.django_db
@@ -235,13 +263,13 @@ def test_legacy_result_stdout_with_max_bytes(Cls, view, fmt, get, admin):
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == (
+    assert _response_text(response) == (
         'Standard Output too large to display ({actual} bytes), only download '
         'supported for sizes over {max} bytes.'.format(actual=total_bytes, max=settings.STDOUT_MAX_BYTES_DISPLAY)
     )
 
     response = get(url + '?format={}'.format(fmt + '_download'), user=admin, expect=200)
-    assert smart_str(response.content) == large_stdout
+    assert _response_text(response) == large_stdout
 
 
 @pytest.mark.django_db
@@ -263,7 +291,7 @@ def test_text_with_unicode_stdout(sqlite_copy, Parent, Child, relation, view, ge
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=' + fmt
 
     response = get(url, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['オ%d' % i for i in range(3)]
+    assert _response_text(response).splitlines() == ['オ%d' % i for i in range(3)]
 
 
 @pytest.mark.django_db
@@ -276,5 +304,32 @@ def test_unicode_with_base64_ansi(sqlite_copy, get, admin):
     url = reverse('api:job_stdout', kwargs={'pk': job.pk}) + '?format=json&content_encoding=base64'
 
     response = get(url, user=admin, expect=200)
-    content = base64.b64decode(json.loads(smart_str(response.content))['content'])
+    content = base64.b64decode(json.loads(_response_text(response))['content'])
     assert smart_str(content).splitlines() == ['オ%d' % i for i in range(3)]
+
+
+@pytest.mark.django_db
+def test_stdout_served_from_archive(get, admin, settings):
+    settings.STDOUT_ARCHIVE_ENABLED = True
+    settings.STDOUT_ARCHIVE_CHUNK_BYTES = 20
+    created = tz_now()
+    job = Job(created=created, status='successful', emitted_events=10)
+    job.save()
+    for i in range(10):
+        JobEvent(job=job, stdout='Line {}\r\nLine {}'.format(2 * i, 2 * i + 1), counter=i + 1, start_line=2 * i, end_line=2 * i + 2, job_created=created).save()
+    with mock.patch('awx.main.tasks.system.archive_job_stdout.apply_async') as apply_async:
+        assert job.get_stdout_archive() is None
+    apply_async.assert_called_once_with([job.pk])
+
+    archive = job.archive_stdout()
+    assert (archive.line_count, archive.size, archive.chunks.count()) == (20, 150, 5)
+    # the archive no longer needs the events
+    JobEvent.objects.filter(job=job).delete()
+    url = reverse('api:job_stdout', kwargs={'pk': job.pk})
+
+    response = get(url + '?format=json&start_line=5&end_line=9', user=admin, expect=200)
+    assert smart_str(response.data['content']).splitlines() == ['Line %d' % i for i in range(5, 9)]
+    assert response.data['range'] == {'start': 5, 'end': 9, 'absolute_end': 20}
+
+    response = get(url + '?format=txt_download', user=admin, expect=200)
+    assert _response_text(response).splitlines() == ['Line %d' % i for i in range(20)]
@@ -1,15 +1,16 @@
+import json
 import pytest
 import time
 from unittest import mock
 from uuid import uuid4
 
-from django.test import TransactionTestCase
+from django.test import TransactionTestCase, override_settings
 
 from awx.main.dispatch.worker.callback import job_stats_wrapup, CallbackBrokerWorker
 
-from awx.main.models.jobs import Job
+from awx.main.models.jobs import Job, SystemJob
 from awx.main.models.inventory import InventoryUpdate, InventorySource
-from awx.main.models.events import InventoryUpdateEvent
+from awx.main.models.events import InventoryUpdateEvent, JobEvent, SystemJobEvent
 
 
 @pytest.mark.django_db
@@ -144,3 +145,154 @@ class TestCallbackBrokerWorker(TransactionTestCase):
 
             event = InventoryUpdateEvent.objects.get(uuid=events[0].uuid)
             assert "\x00" not in event.stdout
+
+    def test_flush_isolates_bad_event_by_bisecting(self):
+        worker = self.get_worker()
+        kwargs = self.event_create_kwargs()
+        events = [InventoryUpdateEvent(uuid=str(uuid4()), stdout=f'good{i}', **kwargs) for i in range(7)]
+        bad_event = InventoryUpdateEvent(uuid=str(uuid4()), stdout='bad', counter=-2, **kwargs)
+        events.insert(5, bad_event)
+        worker.buff = {InventoryUpdateEvent: events.copy()}
+        with mock.patch.object(worker.ingest_engine, 'insert', wraps=worker.ingest_engine.insert) as insert_mock:
+            worker.flush()
+        # 1 full batch + 2 halves + 2 quarters + 2 eighths, rather than one save per event
+        assert insert_mock.call_count == 7
+        assert InventoryUpdateEvent.objects.filter(uuid__in=[e.uuid for e in events if e is not bad_event]).count() == 7
+        assert worker.buff == {InventoryUpdateEvent: [bad_event]}
+
+    def test_copy_engine_falls_back_to_bulk_create(self):
+        # tests use sqlite3, which has no COPY support
+        with override_settings(JOB_EVENT_INGEST_ENGINE='copy'):
+            worker = self.get_worker()
+        assert worker.ingest_engine.name == 'copy'
+        events = [InventoryUpdateEvent(uuid=str(uuid4()), **self.event_create_kwargs())]
+        worker.buff = {InventoryUpdateEvent: events}
+        worker.flush()
+        assert worker.buff.get(InventoryUpdateEvent, []) == []
+        assert InventoryUpdateEvent.objects.filter(uuid=events[0].uuid).count() == 1
+
+    def test_flush_records_insert_seconds_of_every_class(self):
+        worker = self.get_worker()
+        kwargs = self.event_create_kwargs()
+        system_job = SystemJob.objects.create()
+        worker.buff = {
+            InventoryUpdateEvent: [InventoryUpdateEvent(uuid=str(uuid4()), **kwargs)],
+            SystemJobEvent: [SystemJobEvent(uuid=str(uuid4()), system_job=system_job, created=system_job.created)],
+        }
+        with mock.patch.object(worker.ingest_engine, 'insert'):
+            with mock.patch('awx.main.dispatch.worker.callback.time.perf_counter', side_effect=[0.0, 1.0, 10.0, 12.0]):
+                with mock.patch.object(worker.subsystem_metrics, 'inc') as inc_mock:
+                    worker.flush(force=True)
+        inc_mock.assert_any_call('callback_receiver_events_insert_db_seconds', 3.0)
+
+    def test_adaptive_policy_samples_queue_after_every_flush(self):
+        with override_settings(JOB_EVENT_FLUSH_POLICY='adaptive', JOB_EVENT_BUFFER_MIN_EVENTS=50, JOB_EVENT_BUFFER_MAX_EVENTS=1000):
+            worker = self.get_worker()
+        pipe = mock.MagicMock()
+        pipe.__enter__.return_value = pipe
+        pipe.execute.return_value = [400]
+        worker.valkey = mock.Mock(pipeline=mock.Mock(return_value=pipe))
+        worker.buff = {InventoryUpdateEvent: [InventoryUpdateEvent(uuid=str(uuid4()), **self.event_create_kwargs())]}
+        assert worker.flush_policy.batch_size == 50
+        # an instant insert, so insert latency does not cap the batch
+        with mock.patch('awx.main.dispatch.worker.callback.time.perf_counter', return_value=0.0):
+            worker.flush(force=True)
+        pipe.llen.assert_called_once_with(worker.queue_name)
+        assert worker.flush_policy.batch_size == 400
+
+    def test_unknown_ingest_engine(self):
+        with override_settings(JOB_EVENT_INGEST_ENGINE='foobar'):
+            worker = self.get_worker()
+        assert worker.ingest_engine.name == 'bulk_create'
+
+    def get_batch_worker(self, messages, batch_size=3):
+        with override_settings(JOB_EVENT_READ_BATCH_SIZE=batch_size):
+            worker = self.get_worker()
+        queue = [json.dumps(m).encode('utf-8') if isinstance(m, dict) else m for m in messages]
+
+        def blpop(name, timeout=0):
+            return (name, queue.pop(0)) if queue else None
+
+        def lpop(name, count=None):
+            popped = queue[:count]
+            del queue[:count]
+            return popped or None
+
+        worker.valkey = mock.Mock(blpop=blpop, lpop=lpop)
+        worker.record_statistics = lambda: None
+        worker.record_read_metrics = lambda: None
+        return worker
+
+    def test_read_drains_batch(self):
+        worker = self.get_batch_worker([{'uuid': str(i)} for i in range(5)])
+        assert [b['uuid'] for b in worker.read(None)] == ['0', '1', '2']
+        assert [b['uuid'] for b in worker.read(None)] == ['3', '4']
+        assert worker.read(None) == {'event': 'FLUSH'}
+        assert worker.total == 5
+
+    def test_read_single_message_batch(self):
+        worker = self.get_batch_worker([{'uuid': 'a'}])
+        assert worker.read(None) == {'uuid': 'a'}
+
+    def test_read_batch_skips_malformed_message(self):
+        worker = self.get_batch_worker([{'uuid': 'a'}, b'{"uuid": ', {'uuid': 'c'}])
+        assert [b['uuid'] for b in worker.read(None)] == ['a', 'c']
+
+    def test_read_batch_skips_non_object_message(self):
+        for message in (b'[1]', b'"x"', b'null'):
+            worker = self.get_batch_worker([{'uuid': 'a'}, message, {'uuid': 'c'}])
+            with mock.patch.object(worker.subsystem_metrics, 'inc') as inc:
+                assert [b['uuid'] for b in worker.read(None)] == ['a', 'c']
+            inc.assert_any_call('callback_receiver_events_in_memory', 3)
+            inc.assert_any_call('callback_receiver_events_in_memory', -1)
+
+    def test_read_single_non_object_message(self):
+        worker = self.get_batch_worker([b'[1]'])
+        with mock.patch.object(worker.subsystem_metrics, 'inc') as inc:
+            assert worker.read(None) == {'event': 'FLUSH'}
+        inc.assert_any_call('callback_receiver_events_in_memory', -1)
+
+    def test_perform_work_buffers_batch(self):
+        kwargs = self.event_create_kwargs()
+        inventory_update_id = kwargs['inventory_update'].id
+        bodies = [dict(uuid=str(uuid4()), inventory_update_id=inventory_update_id, stdout=f'line{i}', counter=i) for i in range(3)]
+        worker = self.get_worker()
+        with mock.patch.object(worker, 'flush') as flush_mock:
+            worker.perform_work(bodies)
+        flush_mock.assert_called_once_with(force=False)
+        assert [e.stdout for e in worker.buff[InventoryUpdateEvent]] == ['line0', 'line1', 'line2']
+
+    def test_eof_queues_children_summary_after_flush(self):
+        job = Job.objects.create(status='running')
+        bodies = [dict(uuid=str(uuid4()), job_id=job.id, job_created=job.created, event='verbose', stdout=f'line{i}', counter=i) for i in range(1, 4)]
+        worker = self.get_worker()
+        with mock.patch('awx.main.tasks.system.save_job_events_children_summary.apply_async') as apply_async:
+            worker.perform_work(bodies[:1])
+            apply_async.assert_not_called()
+            worker.perform_work(bodies[1:] + [dict(event='EOF', job_id=job.id, final_counter=3)])
+            assert JobEvent.objects.filter(job_id=job.id).count() == 3
+            apply_async.assert_called_once_with([job.id, 3])
+            assert worker.finished_jobs == []
+
+    def test_single_eof_flushes_events(self):
+        job = Job.objects.create(status='running')
+        worker = self.get_worker()
+        worker.buff = {JobEvent: [JobEvent(uuid=str(uuid4()), job_id=job.id, job_created=job.created, event='verbose', counter=1)]}
+        with mock.patch('awx.main.tasks.system.save_job_events_children_summary.apply_async') as apply_async:
+            worker.perform_work(dict(event='EOF', job_id=job.id, final_counter=1))
+        assert JobEvent.objects.filter(job_id=job.id).count() == 1
+        apply_async.assert_called_once_with([job.id, 1])
+
+    def test_owned_queues_unsharded(self):
+        worker = self.get_worker()
+        with override_settings(CALLBACK_QUEUE_SHARDS=0):
+            assert worker.owned_queue_names(0) == [worker.queue_name]
+            assert worker.owned_queue_names(3) == [worker.queue_name]
+
+    def test_owned_queues_sharded(self):
+        worker = self.get_worker()
+        base = worker.queue_name
+        with override_settings(CALLBACK_QUEUE_SHARDS=8, JOB_EVENT_WORKERS=4):
+            assert worker.owned_queue_names(0) == [f'{base}_0', f'{base}_4', base]
+            assert worker.owned_queue_names(3) == [f'{base}_3', f'{base}_7', base]
+            assert worker.all_queue_names() == [f'{base}_{i}' for i in range(8)] + [base]
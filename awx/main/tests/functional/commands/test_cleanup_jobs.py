@@ -7,7 +7,7 @@ import pytest
 from django.utils.timezone import now
 
 from awx.main.management.commands.cleanup_jobs import Command
-from awx.main.models import Job
+from awx.main.models import Job, UnifiedJobStdoutArchive, UnifiedJobStdoutArchiveChunk
 
 
 @pytest.fixture(autouse=True)
@@ -83,3 +83,23 @@ def test_cleanup_jobs_deletes_every_old_job(old_jobs):
     assert skipped == 0
     assert deleted == len(old_jobs)
     assert not Job.objects.filter(pk__in=[job.pk for job in old_jobs]).exists()
+
+
+@pytest.mark.django_db
+def test_cleanup_stdout_archives(old_jobs, settings):
+    settings.STDOUT_ARCHIVE_ENABLED = True
+    expired = UnifiedJobStdoutArchive.objects.create(unified_job=old_jobs[0], created=now() - timedelta(days=400), line_count=1, size=5)
+    expired.chunks.create(start_line=0, end_line=1, data=UnifiedJobStdoutArchiveChunk.compress([[0, 'old\n']]))
+    UnifiedJobStdoutArchive.objects.create(unified_job=old_jobs[1])
+
+    skipped, deleted = _command(batch_size=100000).cleanup_stdout_archives()
+
+    assert (skipped, deleted) == (1, 1)
+    assert not UnifiedJobStdoutArchiveChunk.objects.filter(archive=expired).exists()
+    assert Job.objects.filter(pk=old_jobs[0].pk).exists()
+    # reading the job serves its events, and does not archive it again
+    job = Job.objects.get(pk=old_jobs[0].pk)
+    with mock.patch('awx.main.tasks.system.archive_job_stdout.apply_async') as apply_async:
+        assert job.get_stdout_archive() is None
+    apply_async.assert_not_called()
+    assert _command(batch_size=100000).cleanup_stdout_archives() == (1, 0)
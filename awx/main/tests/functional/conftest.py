@@ -13,6 +13,7 @@ from django.core.handlers.exception import response_for_exception
 from django.contrib.auth.models import User
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+from django.test import override_settings
 
 from django.db.models.signals import post_migrate
 
@@ -634,9 +635,15 @@ def _request(verb):
             assert response.status_code == expect, 'Response data: {}'.format(getattr(response, 'data', None))
         if hasattr(response, 'render'):
             response.render()
+        if response.streaming:
+            # read the stream once, and leave it in place for the test to read again
+            content = b''.join(response.streaming_content)
+            response.streaming_content = [content]
+        else:
+            content = response.content
         __SWAGGER_REQUESTS__.setdefault(request.path, {})[(request.method.lower(), response.status_code)] = (
             response.get('Content-Type', None),
-            response.content,
+            content,
             kwargs.get('data'),
         )
         return response
@@ -679,6 +686,25 @@ def options():
     return _request('options')
 
 
+@pytest.fixture
+def assert_query_budget(get):
+    """
+    GET url as user with AWX_API_QUERY_PROFILE on, and assert it makes at most
+    budget queries and repeats no query shape n_plus_one_threshold times.
+    """
+
+    def fn(url, user, budget, n_plus_one_threshold=10, **kwargs):
+        with override_settings(AWX_API_QUERY_PROFILE=True, AWX_API_QUERY_PROFILE_N_PLUS_ONE_THRESHOLD=n_plus_one_threshold):
+            with mock.patch('awx.api.generics.record_query_profile_metrics'):
+                response = get(url, user, **kwargs)
+        queries = int(response['X-API-Query-Count'])
+        assert queries <= budget, f'{url} made {queries} queries, over its budget of {budget}, most by {response["X-API-Query-Sections"]}'
+        assert 'X-API-Query-N-Plus-One' not in response, f'{url} repeated queries in {response["X-API-Query-N-Plus-One"]}'
+        return response
+
+    return fn
+
+
 @pytest.fixture
 def ad_hoc_command_factory(inventory, machine_credential, admin):
     def factory(inventory=inventory, credential=machine_credential, initial_state='new', created_by=admin):
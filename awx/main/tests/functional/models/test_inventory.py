@@ -6,7 +6,8 @@ import pytest
 from unittest import mock
 
 # AWX
-from awx.main.models import Host, Inventory, InventorySource, InventoryUpdate, CredentialType, Credential, Job
+from awx.main.models import Host, Inventory, InventorySource, InventoryUpdate, CredentialType, Credential, Job, SmartInventoryMembership
+from awx.main.tasks.system import update_smart_memberships_for_inventory
 from awx.main.constants import CLOUD_PROVIDERS
 from awx.main.utils.filters import SmartFilter
 
@@ -116,6 +117,70 @@ class TestInventoryScript:
             data = inventory.get_script_data(slice_number=i + 1, slice_count=2, slice_pinned_hosts=['does-not-exist'])
             assert data == {'all': {'hosts': ['host{}'.format(i)]}}
 
+    def test_slices_share_cached_script_data(self, inventory):
+        for i in range(3):
+            inventory.hosts.create(name='host{}'.format(i))
+        with mock.patch.object(Inventory, '_build_script_source', autospec=True, side_effect=Inventory._build_script_source) as build:
+            for i in range(3):
+                assert inventory.get_script_data(slice_number=i + 1, slice_count=3) == {'all': {'hosts': ['host{}'.format(i)]}}
+        # one build of each section of the script source, shared by every slice
+        assert sorted(call.args[1] for call in build.call_args_list) == ['groups', 'hosts']
+
+    def test_cached_script_data_invalidated(self, inventory):
+        host = inventory.hosts.create(name='ahost', variables={'foo': 'bar'})
+        assert inventory.get_script_data(hostvars=True)['_meta']['hostvars']['ahost'] == {'foo': 'bar'}
+        host.variables = 'foo: baz'
+        host.save()
+        assert inventory.get_script_data(hostvars=True)['_meta']['hostvars']['ahost'] == {'foo': 'baz'}
+        group = inventory.groups.create(name='g1')
+        group.hosts.add(host)
+        assert inventory.get_script_data()['g1'] == {'hosts': ['ahost']}
+        inventory.variables = 'a1: a1'
+        inventory.save()
+        assert inventory.get_script_data()['all']['vars'] == {'a1': 'a1'}
+        host.delete()
+        assert inventory.get_script_data()['all']['hosts'] == []
+
+
+@pytest.mark.django_db
+class TestSmartInventoryMemberships:
+    def members(self, smart_inventory):
+        return set(SmartInventoryMembership.objects.filter(inventory=smart_inventory).values_list('host_id', flat=True))
+
+    def test_full_rebuild(self, organization):
+        inventory = Inventory.objects.create(name='source', organization=organization)
+        smart_inventory = Inventory.objects.create(name='smart', kind='smart', organization=organization, host_filter='name__startswith=web')
+        web1 = inventory.hosts.create(name='web1')
+        inventory.hosts.create(name='db1')
+        assert update_smart_memberships_for_inventory(smart_inventory) is True
+        assert self.members(smart_inventory) == {web1.id}
+        assert update_smart_memberships_for_inventory(smart_inventory) is False
+
+    def test_rebuild_for_host_names(self, organization):
+        inventory = Inventory.objects.create(name='source', organization=organization)
+        smart_inventory = Inventory.objects.create(name='smart', kind='smart', organization=organization, host_filter='name__startswith=web')
+        web1 = inventory.hosts.create(name='web1')
+        web2 = inventory.hosts.create(name='web2')
+        update_smart_memberships_for_inventory(smart_inventory)
+        web1.name = 'db1'
+        web1.save()
+        web3 = inventory.hosts.create(name='web3')
+        # only the hosts by the given names are considered
+        assert update_smart_memberships_for_inventory(smart_inventory, host_names=['web1', 'db1']) is True
+        assert self.members(smart_inventory) == {web2.id}
+        assert update_smart_memberships_for_inventory(smart_inventory, host_names=['web3']) is True
+        assert self.members(smart_inventory) == {web2.id, web3.id}
+
+    def test_one_host_per_name(self, organization):
+        smart_inventory = Inventory.objects.create(name='smart', kind='smart', organization=organization, host_filter='name__startswith=web')
+        first = Inventory.objects.create(name='first', organization=organization).hosts.create(name='web1')
+        second = Inventory.objects.create(name='second', organization=organization).hosts.create(name='web1')
+        update_smart_memberships_for_inventory(smart_inventory)
+        assert self.members(smart_inventory) == {first.id}
+        first.delete()
+        assert update_smart_memberships_for_inventory(smart_inventory, host_names=['web1']) is True
+        assert self.members(smart_inventory) == {second.id}
+
 
 @pytest.mark.django_db
 class TestActiveCount:
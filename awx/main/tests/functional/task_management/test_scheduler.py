@@ -4,11 +4,17 @@ import json
 from datetime import timedelta
 
 from awx.main.scheduler import TaskManager, DependencyManager, WorkflowManager
+from awx.main.scheduler.dag_workflow import WorkflowDAG, workflow_dag_cache
+from awx.main.scheduler.incremental import task_snapshot
 from awx.main.utils import encrypt_field
-from awx.main.models import WorkflowJobTemplate, JobTemplate, Job
+from awx.main.models import WorkflowJobTemplate, WorkflowJobNode, JobTemplate, Job
 from awx.main.models.ha import Instance
 from . import create_job
 from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as tz_now
 
 
 @pytest.mark.django_db
@@ -164,6 +170,67 @@ class TestJobLifeCycle:
         assert node.retry_attempts == node.max_retries
         assert jt.jobs.count() == 1
 
+    @override_settings(WORKFLOW_MANAGER_DAG_CACHE=True)
+    def test_workflow_graph_reused_until_finished(self, inventory, project, controlplane_instance_group):
+        jt = JobTemplate.objects.create(allow_simultaneous=True, inventory=inventory, project=project, playbook='helloworld.yml')
+        wfjt = WorkflowJobTemplate.objects.create(name='cached-wf')
+        first = wfjt.workflow_nodes.create(unified_job_template=jt)
+        first.success_nodes.add(wfjt.workflow_nodes.create(unified_job_template=jt))
+        wj = wfjt.create_unified_job()
+        wj.signal_start()
+        workflow_dag_cache.clear()
+
+        self.run_tm(TaskManager(), [mock.call('running')])
+        self.run_tm(WorkflowManager(), [mock.call('pending')])
+        _, dag = workflow_dag_cache.dags[wj.id]
+
+        # the first job finishing is seen through the cached graph
+        job = jt.jobs.get()
+        job.status = 'successful'
+        job.save()
+        with mock.patch.object(WorkflowDAG, '_init_graph') as init_graph:
+            self.run_tm(WorkflowManager(), [mock.call('pending')])
+            init_graph.assert_not_called()
+        assert workflow_dag_cache.dags[wj.id] == (wj.created, dag)
+        assert jt.jobs.count() == 2
+
+        for job in jt.jobs.all():
+            job.status = 'successful'
+            job.save()
+        self.run_tm(WorkflowManager(), [mock.call('successful')])
+        assert wj.id not in workflow_dag_cache.dags
+
+    @override_settings(WORKFLOW_MANAGER_DAG_CACHE=True)
+    def test_cached_workflow_graph_keeps_other_node_writes(self, inventory, project, controlplane_instance_group):
+        jt = JobTemplate.objects.create(allow_simultaneous=True, inventory=inventory, project=project, playbook='helloworld.yml')
+        wfjt = WorkflowJobTemplate.objects.create(name='cached-wf')
+        first = wfjt.workflow_nodes.create(unified_job_template=jt)
+        first.success_nodes.add(wfjt.workflow_nodes.create(unified_job_template=jt))
+        wj = wfjt.create_unified_job()
+        wj.signal_start()
+        workflow_dag_cache.clear()
+
+        self.run_tm(TaskManager(), [mock.call('running')])
+        self.run_tm(WorkflowManager(), [mock.call('pending')])
+        _, dag = workflow_dag_cache.dags[wj.id]
+        parent = wj.workflow_nodes.get(job__isnull=False)
+        child = wj.workflow_nodes.get(job__isnull=True)
+
+        # written elsewhere while the graph is cached
+        WorkflowJobNode.objects.filter(pk=parent.pk).update(ancestor_artifacts={'a': 42})
+        WorkflowJobNode.objects.filter(pk=child.pk).update(identifier='renamed')
+        job = jt.jobs.get()
+        job.status = 'successful'
+        job.save()
+        self.run_tm(WorkflowManager(), [mock.call('pending')])
+
+        cached = {node['node_object'].id: node['node_object'] for node in dag.nodes}
+        assert cached[parent.id].ancestor_artifacts == {'a': 42}
+        child.refresh_from_db()
+        assert child.job_id is not None
+        assert child.identifier == 'renamed'
+        assert child.ancestor_artifacts == {'a': 42}
+
     def test_task_manager_workflow_workflow_rescheduling(self, controlplane_instance_group):
         wfjts = [WorkflowJobTemplate.objects.create(name='foo')]
         for i in range(5):
@@ -576,6 +643,65 @@ def test_shared_dependencies_launch(controlplane_instance_group, job_template_fa
     assert len(iu) == 1
 
 
+@pytest.mark.django_db
+def test_generate_dependencies_shares_updates(job_template_factory, inventory_source_factory):
+    objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+    p = objects.project
+    p.scm_update_on_launch = True
+    p.scm_update_cache_timeout = 300
+    p.scm_type = "git"
+    p.scm_url = "http://github.com/ansible/ansible.git"
+    p.save(skip_update=True)
+    ii = inventory_source_factory("ec2", source="ec2", inventory=objects.inventory)
+    ii.update_on_launch = True
+    ii.update_cache_timeout = 300
+    ii.save()
+    jobs = [create_job(objects.job_template, dependencies_processed=False) for _ in range(4)]
+
+    with mock.patch("awx.main.scheduler.TaskManager.start_task"):
+        DependencyManager().schedule()
+
+    assert p.project_updates.count() == 1
+    assert ii.inventory_updates.count() == 1
+    for job in jobs:
+        job.refresh_from_db()
+        assert job.dependencies_processed
+        assert set(job.dependent_jobs.all()) == {p.project_updates.get(), ii.inventory_updates.get()}
+
+
+@pytest.mark.django_db
+def test_generate_dependencies_query_count(job_template_factory, inventory_source_factory):
+    objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+    p = objects.project
+    p.scm_update_on_launch = True
+    p.scm_update_cache_timeout = 300
+    p.scm_type = "git"
+    p.scm_url = "http://github.com/ansible/ansible.git"
+    p.save(skip_update=True)
+    ii = inventory_source_factory("ec2", source="ec2", inventory=objects.inventory)
+    ii.update_on_launch = True
+    ii.update_cache_timeout = 300
+    ii.save()
+    # fresh updates exist, so no new ones are created and only lookups are counted
+    for update in (p.create_project_update(), ii.create_inventory_update()):
+        update.status = 'successful'
+        update.finished = tz_now()
+        update.save()
+
+    query_counts = []
+    for num_jobs in (2, 6):
+        for _ in range(num_jobs):
+            create_job(objects.job_template, dependencies_processed=False)
+        dm = DependencyManager()
+        dm.get_tasks(dict(status__in=["pending"], dependencies_processed=False))
+        assert len(dm.all_tasks) == num_jobs
+        with CaptureQueriesContext(connection) as ctx:
+            dm.generate_dependencies(dm.all_tasks)
+        query_counts.append(len(ctx.captured_queries))
+    assert query_counts[0] == query_counts[1]
+    assert p.project_updates.count() == 1
+
+
 @pytest.mark.django_db
 def test_job_not_blocking_project_update(controlplane_instance_group, job_template_factory):
     instance = controlplane_instance_group.instances.all()[0]
@@ -644,3 +770,86 @@ def test_generate_dependencies_only_once(job_template_factory):
         dm.generate_dependencies = mock.MagicMock(return_value=[])
         dm.schedule()
         dm.generate_dependencies.assert_not_called()
+
+
+@pytest.fixture
+def incremental_task_manager():
+    task_snapshot.clear()
+    with override_settings(TASK_MANAGER_INCREMENTAL=True, TASK_MANAGER_INCREMENTAL_OVERLAP=0, TASK_MANAGER_FULL_RECONCILE_INTERVAL=300):
+        yield task_snapshot
+    task_snapshot.clear()
+
+
+@pytest.mark.django_db
+class TestIncrementalTaskManager:
+    def test_finished_job_unblocks_next(self, incremental_task_manager, job_template_factory):
+        objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+        j1 = create_job(objects.job_template)
+        j2 = create_job(objects.job_template)
+        TaskManager().schedule()
+        assert set(incremental_task_manager.tasks) == {j1.id, j2.id}
+        last_full_sync = incremental_task_manager.last_full_sync
+
+        j1.status = "successful"
+        j1.save()
+        with mock.patch.object(incremental_task_manager, 'apply', wraps=incremental_task_manager.apply) as apply:
+            TaskManager().schedule()
+            # only the finished job was read back, and it is no longer active
+            assert apply.call_args[0][0] == {j1.id}
+        assert incremental_task_manager.last_full_sync == last_full_sync
+        assert set(incremental_task_manager.tasks) == {j2.id}
+        j2.refresh_from_db()
+        assert j2.status == "waiting"
+
+    def test_new_job_is_picked_up(self, incremental_task_manager, job_template_factory):
+        objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+        TaskManager().schedule()
+        assert incremental_task_manager.tasks == {}
+
+        j = create_job(objects.job_template)
+        TaskManager().schedule()
+        j.refresh_from_db()
+        assert j.status == "waiting"
+        assert incremental_task_manager.tasks[j.id].status == "waiting"
+
+    def test_finished_dependency_reloads_dependent_job(self, incremental_task_manager, controlplane_instance_group, job_template_factory):
+        objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+        instance = controlplane_instance_group.instances.all()[0]
+        j = create_job(objects.job_template, dependencies_processed=False)
+        p = objects.project
+        p.scm_update_on_launch = True
+        p.scm_update_cache_timeout = 0
+        p.scm_type = "git"
+        p.scm_url = "http://github.com/ansible/ansible.git"
+        p.save(skip_update=True)
+        with mock.patch("awx.main.scheduler.TaskManager.start_task"):
+            DependencyManager().schedule()
+            pu = p.project_updates.get()
+            TaskManager().schedule()
+            TaskManager.start_task.assert_called_once_with(pu, controlplane_instance_group, instance)
+            pu.status = "successful"
+            pu.save()
+        with mock.patch("awx.main.scheduler.TaskManager.start_task"):
+            with mock.patch.object(incremental_task_manager, 'apply', wraps=incremental_task_manager.apply) as apply:
+                TaskManager().schedule()
+                # the job itself did not change, but its dependency did
+                assert apply.call_args[0][0] == {pu.id, j.id}
+            TaskManager.start_task.assert_called_once_with(j, controlplane_instance_group, instance)
+
+    def test_full_reconcile_on_interval(self, incremental_task_manager, job_template_factory):
+        objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+        create_job(objects.job_template)
+        with override_settings(TASK_MANAGER_FULL_RECONCILE_INTERVAL=0):
+            with mock.patch.object(incremental_task_manager, 'replace', wraps=incremental_task_manager.replace) as replace:
+                TaskManager().schedule()
+                TaskManager().schedule()
+                assert replace.call_count == 2
+
+    def test_failed_run_clears_snapshot(self, incremental_task_manager, job_template_factory):
+        objects = job_template_factory('jt', organization='org1', project='proj', inventory='inv', credential='cred')
+        create_job(objects.job_template)
+        with mock.patch.object(TaskManager, "process_tasks", side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                TaskManager().schedule()
+        assert incremental_task_manager.tasks == {}
+        assert incremental_task_manager.needs_full_sync(300)
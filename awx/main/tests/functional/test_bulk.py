@@ -39,6 +39,15 @@ def test_bulk_host_create_num_queries(organization, inventory, post, get, user,
             assert len(bulk_host_create_response['hosts']) == len(hosts), f"unexpected number of hosts created for user {u}"
 
 
+@pytest.mark.django_db
+def test_bulk_host_create_invalidates_script_data(inventory, post, admin_user):
+    inventory.hosts.create(name='existing')
+    assert inventory.get_script_data()['all']['hosts'] == ['existing']
+    post(reverse('api:bulk_host_create'), {'inventory': inventory.id, 'hosts': [{'name': 'bulk'}]}, admin_user, expect=201)
+    inventory.refresh_from_db()
+    assert sorted(inventory.get_script_data()['all']['hosts']) == ['bulk', 'existing']
+
+
 @pytest.mark.django_db
 def test_bulk_host_create_rbac(organization, inventory, post, get, user):
     '''
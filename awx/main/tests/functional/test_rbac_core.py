@@ -1,13 +1,35 @@
 import pytest
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from awx.main.models import (
+    AccessibleObjectSet,
     Role,
     Organization,
     Project,
 )
+from awx.main.models import rbac
 from awx.main.fields import update_role_parentage_for_instance
 
 
+@pytest.fixture
+def accessible_objects_cache():
+    # as though the objects made by other fixtures were committed
+    rbac.tls.accessible_objects_bump = None
+    with override_settings(RBAC_ACCESSIBLE_OBJECTS_CACHE=True):
+        # the task building a set runs right away
+        with mock.patch('awx.main.tasks.system.build_accessible_object_set.delay', new=AccessibleObjectSet.build):
+            yield
+
+
+def organization_object_set(user):
+    return AccessibleObjectSet.lookup(user, 'admin_role', [ContentType.objects.get_for_model(Organization).id])
+
+
 @pytest.mark.django_db
 def test_auto_inheritance_by_children(organization, alice):
     A = Role.objects.create()
@@ -69,6 +91,130 @@ def test_accessible_objects(organization, alice, bob):
     assert Organization.accessible_objects(bob, 'admin_role').count() == 0
 
 
+@pytest.mark.django_db
+def test_accessible_objects_cache(organization, alice, accessible_objects_cache, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        A = Role.objects.create()
+        A.members.add(alice)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert Organization.accessible_objects(alice, 'admin_role').count() == 0
+        # the set is built by a task queued once the transaction commits
+        assert not AccessibleObjectSet.objects.filter(user=alice).exists()
+    object_set = AccessibleObjectSet.objects.get(user=alice)
+    # the set is used again while role access does not change
+    assert Organization.accessible_objects(alice, 'admin_role').count() == 0
+    assert AccessibleObjectSet.objects.get(user=alice) == object_set
+
+    with django_capture_on_commit_callbacks(execute=True):
+        A.children.add(organization.admin_role)
+        # a transaction which changed role access sees its own changes
+        assert Organization.accessible_objects(alice, 'admin_role').count() == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        assert Organization.accessible_objects(alice, 'admin_role').count() == 1
+    assert Organization.accessible_objects(alice, 'admin_role').count() == 1
+    assert AccessibleObjectSet.objects.get(user=alice, version=rbac.RoleAccessState.objects.get(user=alice).version) != object_set
+
+    with django_capture_on_commit_callbacks(execute=True):
+        A.members.remove(alice)
+    assert Organization.accessible_objects(alice, 'admin_role').count() == 0
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_invalidates_changed_users(organization, alice, bob, accessible_objects_cache, django_capture_on_commit_callbacks):
+    A = Role.objects.create()
+    B = Role.objects.create()
+    with django_capture_on_commit_callbacks(execute=True):
+        A.members.add(alice)
+        B.members.add(bob)
+    with django_capture_on_commit_callbacks(execute=True):
+        organization_object_set(alice)
+        organization_object_set(bob)
+    bob_object_set = organization_object_set(bob)
+    assert bob_object_set is not None
+
+    # only the members of the new ancestor of admin_role gain an object
+    with django_capture_on_commit_callbacks(execute=True):
+        A.children.add(organization.admin_role)
+    assert organization_object_set(alice) is None
+    assert organization_object_set(bob) == bob_object_set
+
+    # roles created for new objects have no members to invalidate
+    with django_capture_on_commit_callbacks(execute=True):
+        Role.objects.create().children.add(Role.objects.create())
+    assert organization_object_set(bob) == bob_object_set
+
+    with django_capture_on_commit_callbacks(execute=True):
+        B.delete()
+    assert organization_object_set(bob) is None
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_prunes_old_versions(organization, alice, accessible_objects_cache, django_capture_on_commit_callbacks):
+    organization.admin_role.members.add(alice)
+    rbac.tls.accessible_objects_bump = None
+    object_set_ids = []
+    for i in range(3):
+        with django_capture_on_commit_callbacks(execute=True):
+            assert Organization.accessible_objects(alice, 'admin_role').count() == 1
+        object_set_ids.append(AccessibleObjectSet.objects.get(user=alice, version=rbac.RoleAccessState.objects.get(user=alice).version).id)
+        with django_capture_on_commit_callbacks(execute=True):
+            AccessibleObjectSet.invalidate([alice.id])
+    # the set of the version just replaced is kept for requests still reading it
+    assert set(AccessibleObjectSet.objects.values_list('id', flat=True)) == {object_set_ids[-1]}
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_built_once_per_version(organization, alice, accessible_objects_cache, django_capture_on_commit_callbacks):
+    organization.admin_role.members.add(alice)
+    rbac.tls.accessible_objects_bump = None
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(2):
+                assert AccessibleObjectSet.lookup(alice, 'admin_role', [1, 2]) is None
+        # looking up a set never writes it
+        assert all(query['sql'].lstrip().upper().startswith('SELECT') for query in queries.captured_queries)
+    assert len(callbacks) == 1
+    object_set_id = AccessibleObjectSet.lookup(alice, 'admin_role', [1, 2])
+    # as though another task built the same set first
+    assert AccessibleObjectSet.build(alice.id, 'admin_role', [1, 2]) == object_set_id
+    assert AccessibleObjectSet.objects.filter(user=alice).count() == 1
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_off(organization, alice, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        organization.admin_role.members.add(alice)
+        Role.objects.create().children.add(organization.admin_role)
+    assert rbac.tls.accessible_objects_bump is None
+    assert not any(getattr(func, '__name__', None) == 'bump' for func in callbacks)
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_invalidated_after_rebuild(organization, alice, accessible_objects_cache):
+    A = Role.objects.create()
+    rbac.tls.accessible_objects_bump = None
+
+    def invalidate_roles(role_ids):
+        assert rbac.RoleAncestorEntry.objects.filter(ancestor=A, descendent=organization.admin_role).exists()
+        assert role_ids == {A.id}
+
+    with mock.patch.object(AccessibleObjectSet, 'invalidate_roles', side_effect=invalidate_roles) as invalidate_mock:
+        A.children.add(organization.admin_role)
+    invalidate_mock.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_accessible_objects_cache_cleared_when_toggled(organization, alice, accessible_objects_cache, django_capture_on_commit_callbacks):
+    organization.admin_role.members.add(alice)
+    rbac.tls.accessible_objects_bump = None
+    with django_capture_on_commit_callbacks(execute=True):
+        Organization.accessible_objects(alice, 'admin_role').count()
+    assert AccessibleObjectSet.objects.exists()
+    with override_settings(RBAC_ACCESSIBLE_OBJECTS_CACHE=False):
+        assert not AccessibleObjectSet.objects.exists()
+
+
 @pytest.mark.django_db
 def test_team_symantics(organization, team, alice):
     assert alice not in organization.auditor_role
@@ -130,8 +276,14 @@ def test_content_object(user):
     assert org.admin_role.content_object.id == org.id
 
 
+@pytest.fixture(params=['iterative', 'closure'])
+def rebuild_engine(request):
+    with override_settings(ROLE_ANCESTRY_REBUILD_ENGINE=request.param):
+        yield request.param
+
+
 @pytest.mark.django_db
-def test_hierarchy_rebuilding_multi_path():
+def test_hierarchy_rebuilding_multi_path(rebuild_engine):
     'Tests a subdtle cases around role hierarchy rebuilding when you have multiple paths to the same role of different length'
 
     X = Role.objects.create()
@@ -159,6 +311,28 @@ def test_hierarchy_rebuilding_multi_path():
     assert X.is_ancestor_of(D) is False
 
 
+@pytest.mark.django_db
+def test_hierarchy_rebuilding_loop():
+    with override_settings(ROLE_ANCESTRY_REBUILD_ENGINE='closure'):
+        X = Role.objects.create()
+        A = Role.objects.create()
+        B = Role.objects.create()
+        C = Role.objects.create()
+
+        A.children.add(B)
+        B.children.add(C)
+        C.children.add(A)
+        assert set(C.ancestors.all()) == {A, B, C}
+
+        X.children.add(B)
+        assert set(A.ancestors.all()) == {X, A, B, C}
+
+        B.children.remove(C)
+        assert set(C.ancestors.all()) == {C}
+        assert set(A.ancestors.all()) == {A, C}
+        assert set(B.ancestors.all()) == {X, A, B, C}
+
+
 @pytest.mark.django_db
 def test_auto_parenting():
     org1 = Organization.objects.create(name='org1')
@@ -5,8 +5,8 @@ import tempfile
 import shutil
 
 from awx.main.tasks.jobs import RunJob
-from awx.main.tasks.system import execution_node_health_check, _cleanup_images_and_files
-from awx.main.models import Instance, Job
+from awx.main.tasks.system import execution_node_health_check, save_job_events_children_summary, _cleanup_images_and_files
+from awx.main.models import Instance, Job, JobEvent, JobEventsChildrenSummary
 
 
 @pytest.fixture
@@ -73,3 +73,27 @@ def test_does_not_run_reaped_job(mocker, mock_me):
     job.refresh_from_db()
     assert job.status == 'failed'
     mock_run.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_children_summary_waits_for_events():
+    job = Job.objects.create(status='running')
+    JobEvent.create_from_data(job_id=job.pk, uuid='uuid1', parent_uuid='', event='playbook_on_start', counter=1, job_created=job.created).save()
+
+    def sleep(seconds):
+        # as though another callback receiver worker flushed the last event meanwhile
+        JobEvent.create_from_data(job_id=job.pk, uuid='uuid2', parent_uuid='uuid1', event='verbose', counter=2, job_created=job.created).save()
+
+    with mock.patch('awx.main.tasks.system.time.sleep', side_effect=sleep) as sleep_mock:
+        save_job_events_children_summary(job.id, 2)
+    sleep_mock.assert_called_once()
+    assert JobEventsChildrenSummary.objects.filter(job=job).exists()
+
+
+@pytest.mark.django_db
+def test_children_summary_gives_up_on_missing_events():
+    job = Job.objects.create(status='running')
+    with mock.patch('awx.main.tasks.system.time.sleep') as sleep_mock:
+        save_job_events_children_summary(job.id, 1, retries=2)
+    assert sleep_mock.call_count == 2
+    assert not JobEventsChildrenSummary.objects.filter(job=job).exists()
@@ -8,6 +8,7 @@ from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 
 # AWX
+from awx.api import generics
 from awx.api.generics import ParentMixin, SubListCreateAttachDetachAPIView, SubListAttachDetachAPIView, ResourceAccessList, ListAPIView
 from awx.main.models import Organization, Credential
 
@@ -207,3 +208,24 @@ def test_related_search_reverse_FK_field():
     view = ListAPIView()
     view.model = Credential
     assert 'unifiedjobtemplates__search' in view.related_search_fields
+
+
+def test_query_profile_metrics_saved_with_every_request():
+    with mock.patch('awx.api.generics.s_metrics.APIMetrics') as api_metrics, mock.patch.object(generics, '_api_metrics', None):
+        for i in range(2):
+            generics.record_query_profile_metrics(mock.Mock(count=3, seconds=0.01), False, False)
+    api_metrics.assert_called_once()
+    assert api_metrics.return_value.pipe_execute.call_count == 2
+
+
+def test_query_profile_metrics_shared_by_threads():
+    with mock.patch('awx.api.generics.s_metrics.APIMetrics') as api_metrics, mock.patch.object(generics, '_api_metrics', None):
+        threads = [
+            generics.threading.Thread(target=generics.record_query_profile_metrics, args=(mock.Mock(count=3, seconds=0.01), False, False)) for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    api_metrics.assert_called_once()
+    assert api_metrics.return_value.pipe_execute.call_count == 4
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from django.test import override_settings
+
+from awx.main.dispatch.worker.flush_policy import AdaptiveFlushPolicy, FixedFlushPolicy, get_flush_policy
+
+FLUSH_SETTINGS = dict(
+    JOB_EVENT_BUFFER_SECONDS=1,
+    JOB_EVENT_BUFFER_MAX_EVENTS=1000,
+    JOB_EVENT_BUFFER_MIN_EVENTS=50,
+    JOB_EVENT_BUFFER_MIN_SECONDS=0.1,
+    JOB_EVENT_BUFFER_MAX_IN_MEMORY=1500,
+)
+
+
+@pytest.fixture
+def adaptive_policy():
+    with override_settings(**FLUSH_SETTINGS):
+        yield AdaptiveFlushPolicy()
+
+
+@pytest.fixture
+def fixed_policy():
+    with override_settings(**FLUSH_SETTINGS):
+        yield FixedFlushPolicy()
+
+
+class TestFixedFlushPolicy:
+    def test_flush_on_interval(self, fixed_policy):
+        assert fixed_policy.should_flush({'a': [1]}, time.time()) is None
+        assert fixed_policy.should_flush({'a': [1]}, time.time() - 2) == 'interval'
+
+    def test_flush_on_size(self, fixed_policy):
+        assert fixed_policy.should_flush({'a': [1] * 1000}, time.time()) == 'size'
+
+    def test_flush_on_memory_ceiling(self, fixed_policy):
+        assert fixed_policy.should_flush({'a': [1] * 800, 'b': [1] * 800}, time.time()) == 'memory'
+
+    def test_policy_ignores_feedback(self, fixed_policy):
+        fixed_policy.record_queue_size(100000)
+        fixed_policy.record_insert(10, 100)
+        assert fixed_policy.batch_size == 1000
+        assert fixed_policy.interval == 1
+
+
+class TestAdaptiveFlushPolicy:
+    def test_idle_queue_flushes_small_batches_quickly(self, adaptive_policy):
+        adaptive_policy.record_queue_size(0)
+        assert adaptive_policy.batch_size == 50
+        assert adaptive_policy.interval == 0.1
+        assert adaptive_policy.should_flush({'a': [1] * 10}, time.time() - 0.2) == 'interval'
+
+    def test_backlog_grows_batches(self, adaptive_policy):
+        adaptive_policy.record_queue_size(400)
+        assert adaptive_policy.batch_size == 400
+        assert adaptive_policy.interval == 1
+        assert adaptive_policy.should_flush({'a': [1] * 10}, time.time() - 0.2) is None
+        adaptive_policy.record_queue_size(100000)
+        assert adaptive_policy.batch_size == 1000
+
+    def test_slow_database_caps_batches(self, adaptive_policy):
+        adaptive_policy.record_queue_size(100000)
+        # 5ms per event, so only 200 events fit within JOB_EVENT_BUFFER_SECONDS
+        adaptive_policy.record_insert(100, 0.5)
+        assert adaptive_policy.batch_size == 200
+
+    def test_insert_latency_is_smoothed(self, adaptive_policy):
+        adaptive_policy.record_insert(100, 0.1)
+        adaptive_policy.record_insert(100, 1.1)
+        assert adaptive_policy.seconds_per_event == pytest.approx(0.001 + 0.3 * 0.01)
+
+    def test_batches_never_exceed_memory_ceiling(self):
+        with override_settings(**dict(FLUSH_SETTINGS, JOB_EVENT_BUFFER_MAX_IN_MEMORY=300)):
+            policy = AdaptiveFlushPolicy()
+        policy.record_queue_size(100000)
+        assert policy.batch_size == 300
+        assert policy.should_flush({'a': [1] * 200, 'b': [1] * 100}, time.time()) == 'memory'
+
+
+def test_unknown_flush_policy():
+    with override_settings(**FLUSH_SETTINGS):
+        assert get_flush_policy('foobar').name == 'fixed'
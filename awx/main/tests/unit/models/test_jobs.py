@@ -7,7 +7,7 @@ from awx.main.models import (
     Inventory,
     Host,
 )
-from awx.main.tasks.facts import start_fact_cache, finish_fact_cache
+from awx.main.tasks.facts import start_fact_cache, finish_fact_cache, facts_digest, fact_cache_path, serialize_facts, _read_facts
 
 from django.utils.timezone import now
 
@@ -152,3 +152,33 @@ def test_finish_job_fact_cache_with_bad_data(hosts, mocker, tmpdir):
     finish_fact_cache(fact_cache)
 
     bulk_update.assert_not_called()
+
+
+def test_start_job_fact_cache_records_digests(hosts, tmpdir):
+    artifacts_dir = tmpdir.mkdir("artifacts")
+    start_fact_cache(hosts, str(artifacts_dir), timeout=0, inventory_id=5)
+
+    with open(os.path.join(artifacts_dir, 'host_cache_summary.json')) as f:
+        summary = json.load(f)
+    assert summary['written_ct'] == len(hosts)
+    for host in hosts:
+        with open(os.path.join(artifacts_dir, 'fact_cache', host.name), 'rb') as f:
+            assert summary['facts_digests'][host.name] == facts_digest(f.read())
+        assert host.ansible_facts_digest == summary['facts_digests'][host.name]
+
+
+def test_read_facts_skips_unchanged_content(tmpdir):
+    filepath = os.path.join(tmpdir, 'host1')
+    current_digest = facts_digest(serialize_facts({"a": 1, "b": 2}))
+    with open(filepath, 'w') as f:
+        json.dump({"b": 2, "a": 1}, f, indent=4)
+    assert _read_facts(filepath, current_digest) == (current_digest, None)
+
+    with open(filepath, 'w') as f:
+        json.dump({"a": 2}, f)
+    assert _read_facts(filepath, current_digest) == (facts_digest(serialize_facts({"a": 2})), {"a": 2})
+
+
+@pytest.mark.parametrize('name', ['', '.', '..', '../foo', 'foo/bar'])
+def test_fact_cache_path_rejects_names_outside_dir(name):
+    assert fact_cache_path('/tmp/fact_cache', name) is None
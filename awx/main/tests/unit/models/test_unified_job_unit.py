@@ -3,6 +3,7 @@ from unittest import mock
 
 from awx.main.models import UnifiedJob, UnifiedJobTemplate, WorkflowJob, WorkflowJobNode, WorkflowApprovalTemplate, Job, User, Project, JobTemplate, Inventory
 from awx.main.constants import JOB_VARIABLE_PREFIXES
+from awx.main.models.unified_jobs import stdout_lines, stdout_rows_to_text, unescape_copy_text
 
 
 def test_incorrectly_formatted_variables():
@@ -127,3 +128,39 @@ class TestMetaVars:
             assert '{}_job_template_id'.format(name) in data
             assert data['{}_job_template_id'.format(name)] == 92
             assert data['{}_job_template_name'.format(name)] == 'jobs-jt'
+
+
+def test_unescape_copy_text():
+    assert unescape_copy_text('ok: [host]\\r\\nchanged\\ttrue\\\\n\n') == 'ok: [host]\nchanged\ttrue\\n\n'
+
+
+@pytest.mark.parametrize(
+    'stdout, lines',
+    [
+        ('ok: [host]', ['ok: [host]']),
+        ('ok: [host]\r\nchanged', ['ok: [host]', 'changed']),
+        ('ok: [host]\r\n', ['ok: [host]']),
+        ('ok: [host]\r\n\r\nchanged\n', ['ok: [host]', '', 'changed']),
+    ],
+)
+def test_stdout_lines(stdout, lines):
+    assert stdout_lines(stdout) == lines
+    # the lines are those of the stdout text, which ends every event with a newline
+    assert stdout_rows_to_text([(0, stdout)]).startswith(''.join(line + '\n' for line in lines))
+
+
+def test_stdout_stream_reassembles_copy_rows(mocker):
+    # COPY rows may be split across reads, even in the middle of a character
+    rows = 'first \x1b[0;32mオ\x1b[0m\\r\\nsecond\n'.encode()
+    copy = mocker.MagicMock()
+    cursor = mocker.MagicMock()
+    cursor.__enter__.return_value.copy.return_value = copy
+    mocker.patch('awx.main.models.unified_jobs.connection.cursor', return_value=cursor)
+    mocker.patch.object(Job, 'result_stdout_text', None)
+    mocker.patch.object(Job, 'has_unpartitioned_events', False)
+    job = Job(id=1)
+
+    copy.__enter__.return_value.read.side_effect = [rows[:8], rows[8:15], rows[15:], b'third', None]
+    assert ''.join(job.result_stdout_raw_stream()) == 'first \x1b[0;32mオ\x1b[0m\nsecond\nthird'
+    copy.__enter__.return_value.read.side_effect = [rows, None]
+    assert ''.join(job.result_stdout_raw_stream(escape_ascii=True)) == 'first オ\nsecond\n'
@@ -0,0 +1,82 @@
+from awx.main.models import AdHocCommand, InventoryUpdate, Job, ProjectUpdate, SystemJob, WorkflowJob
+from awx.main.scheduler.dependency_graph import DependencyGraph
+
+
+def job(id, job_template_id=1, project_id=1, inventory_id=1, allow_simultaneous=False):
+    return Job(id=id, job_template_id=job_template_id, project_id=project_id, inventory_id=inventory_id, allow_simultaneous=allow_simultaneous)
+
+
+class TestDependencyGraph:
+    def test_project_update_blocks_job(self):
+        graph = DependencyGraph()
+        pu = ProjectUpdate(id=10, project_id=1)
+        graph.add_job(pu)
+        assert graph.task_blocked_by(job(1)) is pu
+        assert graph.blocked_on(job(1)) == ((DependencyGraph.PROJECT, 1), pu)
+        assert graph.task_blocked_by(job(2, project_id=2)) is None
+
+    def test_job_does_not_block_project_update(self):
+        graph = DependencyGraph()
+        graph.add_job(job(1))
+        assert graph.task_blocked_by(ProjectUpdate(id=10, project_id=1)) is None
+        graph.add_job(ProjectUpdate(id=10, project_id=1))
+        assert graph.task_blocked_by(ProjectUpdate(id=11, project_id=1)).id == 10
+
+    def test_job_template_concurrency(self):
+        graph = DependencyGraph()
+        first = job(1, allow_simultaneous=True)
+        graph.add_job(first)
+        assert graph.task_blocked_by(job(2, allow_simultaneous=True)) is None
+        assert graph.task_blocked_by(job(3)) is first
+        assert graph.task_blocked_by(job(4, job_template_id=2)) is None
+
+    def test_first_holder_is_reported(self):
+        graph = DependencyGraph()
+        graph.add_jobs([job(1), job(2)])
+        assert graph.task_blocked_by(job(3)).id == 1
+
+    def test_inventory_locks(self):
+        graph = DependencyGraph()
+        iu = InventoryUpdate(id=10, inventory_id=1, inventory_source_id=5)
+        graph.add_job(iu)
+        assert graph.task_blocked_by(job(1)) is iu
+        assert graph.task_blocked_by(AdHocCommand(id=11, inventory_id=1)) is iu
+        assert graph.task_blocked_by(InventoryUpdate(id=12, inventory_id=1, inventory_source_id=5)) is iu
+        # another source of the same inventory can update at the same time
+        assert graph.task_blocked_by(InventoryUpdate(id=13, inventory_id=1, inventory_source_id=6)) is None
+
+    def test_ad_hoc_command_blocks_job(self):
+        graph = DependencyGraph()
+        adhoc = AdHocCommand(id=10, inventory_id=1)
+        graph.add_job(adhoc)
+        assert graph.task_blocked_by(job(1)) is adhoc
+
+    def test_sliced_workflow_blocked_by_job(self):
+        graph = DependencyGraph()
+        graph.add_job(job(1, job_template_id=7, allow_simultaneous=True))
+        assert graph.task_blocked_by(WorkflowJob(id=2, unified_job_template_id=7, allow_simultaneous=False)).id == 1
+        assert graph.task_blocked_by(WorkflowJob(id=3, unified_job_template_id=7, allow_simultaneous=True)) is None
+
+    def test_workflow_job_template_concurrency(self):
+        graph = DependencyGraph()
+        graph.add_job(WorkflowJob(id=1, workflow_job_template_id=7, allow_simultaneous=False))
+        assert graph.task_blocked_by(WorkflowJob(id=2, workflow_job_template_id=7, allow_simultaneous=False)).id == 1
+        # a job of a job template with the same id is not blocked by the workflow
+        assert graph.task_blocked_by(job(3, job_template_id=7)) is None
+
+    def test_one_system_job_at_a_time(self):
+        graph = DependencyGraph()
+        graph.add_job(SystemJob(id=1))
+        assert graph.task_blocked_by(SystemJob(id=2)).id == 1
+
+    def test_null_keys_are_ignored(self):
+        graph = DependencyGraph()
+        graph.add_job(job(1, job_template_id=None))
+        assert graph.holders == {}
+
+    def test_explanation_is_built_once(self):
+        graph = DependencyGraph()
+        pu = ProjectUpdate(id=10, project_id=1)
+        explanation = graph.explain(pu)
+        assert explanation == 'waiting for projectupdate-10 to finish'
+        assert graph.explain(pu) is explanation
@@ -63,6 +63,7 @@ def test_pre_post_run_hook_facts(mock_create_partition, mock_facts_settings, fin
 
     # creates the task object with job object as instance
     mock_facts_settings.ANSIBLE_FACT_CACHE_TIMEOUT = False  # defines timeout to false
+    mock_facts_settings.ANSIBLE_FACT_CACHE_WORKERS = 4
     task = jobs.RunJob()
     task.instance = job
     task.update_model = mock.Mock(return_value=job)
@@ -111,6 +112,7 @@ def test_pre_post_run_hook_facts_deleted_sliced(mock_create_partition, mock_fact
 
     # creates the task object with job object as instance
     mock_facts_settings.ANSIBLE_FACT_CACHE_TIMEOUT = False
+    mock_facts_settings.ANSIBLE_FACT_CACHE_WORKERS = 4
     task = jobs.RunJob()
     task.instance = job
     task.update_model = mock.Mock(return_value=job)
@@ -208,6 +208,8 @@ class TestSelectBestInstanceForTask(object):
             assert instance_picked is None, reason
         else:
             assert instance_picked.hostname == instances[instance_fit_index].hostname, reason
+        # the default placement strategy picks the same instance
+        assert tm_models.instance_groups.fit_task_to_instance(task, 'controlplane') is instance_picked, reason
 
     def test_controller_node_tie_break_with_container_group_jobs(self):
         """Verify that controller nodes managing container-group jobs track jobs_running
@@ -289,3 +291,67 @@ class TestSelectBestInstanceForTask(object):
             assert tm_models.instance_groups.find_largest_idle_instance('controlplane') is None, reason
         else:
             assert tm_models.instance_groups.find_largest_idle_instance('controlplane').hostname == instances[instance_fit_index].hostname, reason
+
+
+class TestPlacementStrategies(object):
+    def tm_models(self, instances, strategy, **kwargs):
+        ig = InstanceGroup(id=10, name='controlplane')
+        tasks = []
+        for instance in instances:
+            ig.instances.add(instance)
+            for _ in range(instance.jobs_running):
+                tasks.append(Job(task_impact=1, execution_node=instance.hostname, controller_node=instance.hostname, instance_group=ig))
+        return TaskManagerModels.init_with_consumed_capacity(tasks=tasks, instances=instances, instance_groups=[ig], placement_strategy=strategy, **kwargs)
+
+    @pytest.mark.parametrize(
+        'strategy,instance_fit_index',
+        [
+            ('worst_fit', 3),
+            ('best_fit', 1),
+            ('spread', 2),
+        ],
+    )
+    def test_strategy_picks(self, strategy, instance_fit_index):
+        # remaining capacity: 29, 59, 199, 298
+        instances = Is([(1, 30), (1, 60), (0, 199), (2, 300)])
+        tm_models = self.tm_models(instances, strategy)
+        picked = tm_models.instance_groups.fit_task_to_instance(Job(task_impact=50), 'controlplane')
+        assert picked.hostname == instances[instance_fit_index].hostname
+
+    @pytest.mark.parametrize('strategy', ['worst_fit', 'best_fit', 'spread'])
+    def test_no_fit(self, strategy):
+        tm_models = self.tm_models(Is([10, 20, 30]), strategy)
+        assert tm_models.instance_groups.fit_task_to_instance(Job(task_impact=50), 'controlplane') is None
+
+    def test_heap_follows_consumed_capacity(self):
+        instances = Is([100, 80])
+        tm_models = self.tm_models(instances, 'worst_fit')
+        picks = []
+        for _ in range(3):
+            task = Job(task_impact=30)
+            picked = tm_models.instance_groups.fit_task_to_instance(task, 'controlplane')
+            picks.append(picked.hostname)
+            task.execution_node = picked.hostname
+            tm_models.consume_capacity(task)
+        # 100 -> 70, then 80 -> 50, then 70 -> 40
+        assert picks == ['fakehost-0', 'fakehost-1', 'fakehost-0']
+        assert tm_models.instance_groups.fit_task_to_instance(Job(task_impact=60), 'controlplane') is None
+
+    def test_hybrid_control_cost(self):
+        hybrid = Instance(capacity=100, node_type='hybrid', hostname='hybrid')
+        execution = Instance(capacity=95, node_type='execution', hostname='execution')
+        tm_models = self.tm_models([hybrid, execution], 'worst_fit', control_task_impact=10)
+        task = Job(task_impact=10)
+        assert tm_models.instance_groups.fit_task_to_instance(task, 'controlplane').hostname == 'hybrid'
+        picked = tm_models.instance_groups.fit_task_to_instance(task, 'controlplane', add_hybrid_control_cost=True)
+        assert picked.hostname == 'execution'
+
+    def test_unknown_strategy(self):
+        tm_models = self.tm_models(Is([100]), 'foobar')
+        assert tm_models.instance_groups.placement_strategy.name == 'worst_fit'
+
+    def test_fragmentation(self):
+        tm_models = self.tm_models(Is([(0, 100), (0, 100)]), 'worst_fit')
+        assert tm_models.instances.get_fragmentation() == 0.5
+        tm_models = self.tm_models(Is([(0, 100), (0, 0)]), 'worst_fit')
+        assert tm_models.instances.get_fragmentation() == 0.0
@@ -0,0 +1,45 @@
+from unittest import mock
+
+import pytest
+
+from django.test import override_settings
+
+from awx.main.queue import CallbackQueueDispatcher, callback_queue_for_job, callback_queue_shards
+
+
+@pytest.fixture
+def dispatcher():
+    with mock.patch('awx.main.queue.valkey.Valkey.from_url'):
+        return CallbackQueueDispatcher()
+
+
+@override_settings(CALLBACK_QUEUE='callback_tasks', CALLBACK_QUEUE_SHARDS=0)
+def test_unsharded_queue(dispatcher):
+    assert callback_queue_shards() == ['callback_tasks']
+    assert callback_queue_for_job(42) == 'callback_tasks'
+    assert dispatcher.queue_for({'job_id': 42}) == 'callback_tasks'
+
+
+@override_settings(CALLBACK_QUEUE='callback_tasks', CALLBACK_QUEUE_SHARDS=4)
+def test_sharded_queues():
+    assert callback_queue_shards() == ['callback_tasks_0', 'callback_tasks_1', 'callback_tasks_2', 'callback_tasks_3']
+    assert callback_queue_for_job(42) == 'callback_tasks_2'
+    assert callback_queue_for_job('43') == 'callback_tasks_3'
+    assert callback_queue_for_job(None) == 'callback_tasks'
+
+
+@override_settings(CALLBACK_QUEUE='callback_tasks', CALLBACK_QUEUE_SHARDS=4)
+@pytest.mark.parametrize(
+    'event, queue',
+    [
+        ({'job_id': 5, 'event': 'runner_on_ok'}, 'callback_tasks_1'),
+        ({'ad_hoc_command_id': 6}, 'callback_tasks_2'),
+        ({'project_update_id': 7}, 'callback_tasks_3'),
+        ({'inventory_update_id': 8}, 'callback_tasks_0'),
+        ({'system_job_id': 9}, 'callback_tasks_1'),
+        ({'event': 'EOF'}, 'callback_tasks'),
+    ],
+)
+def test_dispatch_routes_events_by_job(dispatcher, event, queue):
+    dispatcher.dispatch(event)
+    assert dispatcher.connection.rpush.call_args[0][0] == queue
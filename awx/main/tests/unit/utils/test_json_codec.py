@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from django.db import connection
+
+from awx.main.fields import JSONBlob
+from awx.main.models.events import sanitize_event_keys
+from awx.main.utils import json_codec
+from awx.main.utils.json_codec import PreEncodedJSON, get_json_codec
+
+
+class FakeVault:
+    yaml_tag = '!vault'
+    data = '$ANSIBLE_VAULT;1.1;AES256'
+
+
+# get_json_codec would log a warning for a codec which is not installed, and
+# logging reads settings from the database, which is not available on import
+CODECS = ['json'] + (['orjson'] if json_codec.orjson is not None else [])
+
+
+@pytest.fixture(params=CODECS)
+def codec(request):
+    return get_json_codec(request.param)
+
+
+def test_event_round_trip(codec):
+    event = {'event': 'runner_on_ok', 'job_id': 4, 'stdout': 'ok: [hôst]', 'event_data': {'task': 'ping', 'host': 'hôst', 'res': {'vault': FakeVault()}}}
+    message = codec.encode_event(event)
+    # the message is still plain JSON for anything else reading the queue
+    assert json.loads(message)['event_data']['host'] == 'hôst'
+
+    body = codec.decode_event(message)
+    assert 'event_data_length' not in body
+    assert body['job_id'] == 4
+    assert body['event_data'] == {'task': 'ping', 'host': 'hôst', 'res': {'vault': FakeVault.data}}
+    # only orjson publishes event_data pre-encoded, the stdlib codec keeps the message format of older releases
+    assert isinstance(body['event_data'], PreEncodedJSON) is (codec.name == 'orjson')
+    if isinstance(body['event_data'], PreEncodedJSON):
+        assert json.loads(body['event_data'].encoded) == body['event_data']
+
+
+def test_json_codec_publishes_plain_messages():
+    event = {'event': 'runner_on_ok', 'job_id': 4, 'event_data': {'task': 'ping'}}
+    assert get_json_codec('json').encode_event(event) == json.dumps(event).encode('utf-8')
+
+
+def test_event_without_event_data(codec):
+    message = codec.encode_event({'event': 'EOF', 'final_counter': 4})
+    assert codec.decode_event(message) == {'event': 'EOF', 'final_counter': 4}
+
+
+def test_event_with_only_event_data(codec):
+    assert codec.decode_event(codec.encode_event({'event_data': {'a': 1}})) == {'event_data': {'a': 1}}
+
+
+@pytest.mark.parametrize('publisher', CODECS)
+def test_decode_messages_from_any_codec(codec, publisher):
+    message = get_json_codec(publisher).encode_event({'event': 'runner_on_ok', 'event_data': {'nested': {'event_data': [1, 2]}}})
+    assert codec.decode_event(message)['event_data'] == {'nested': {'event_data': [1, 2]}}
+
+
+def test_decode_legacy_message(codec):
+    body = codec.decode_event(json.dumps({'event': 'runner_on_ok', 'event_data': {'task': 'ping'}}).encode('utf-8'))
+    assert body['event_data'] == {'task': 'ping'}
+    assert not isinstance(body['event_data'], PreEncodedJSON)
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), float('-inf')])
+def test_non_finite_floats_are_kept(codec, value):
+    event = {'event': 'runner_on_ok', 'event_data': {'res': {'ratio': value, 'none': None}}}
+    body = codec.decode_event(codec.encode_event(event))
+    assert body['event_data']['res']['ratio'] == pytest.approx(value, nan_ok=True)
+    if isinstance(body['event_data'], PreEncodedJSON):
+        assert json.loads(body['event_data'].encoded)['res']['ratio'] == pytest.approx(value, nan_ok=True)
+    assert body['event_data']['res']['none'] is None
+
+
+def test_orjson_encodes_with_orjson():
+    orjson = pytest.importorskip('orjson')
+    event = {'event': 'runner_on_ok', 'event_data': {'res': {'ratio': 0.5, 'none': None}}}
+    assert get_json_codec('auto').dumps(event) == orjson.dumps(event)
+
+
+def test_json_blob_uses_pre_encoded_json():
+    value = PreEncodedJSON({'task': 'ping'}, b'{"task": "ping", "from": "publisher"}')
+    assert JSONBlob().get_db_prep_value(value, connection) == '{"task": "ping", "from": "publisher"}'
+
+
+def test_truncation_drops_pre_encoded_json():
+    kwargs = {'event_data': PreEncodedJSON({'task': 'x' * 2000}, b'{}')}
+    sanitize_event_keys(kwargs, ['event_data'])
+    assert not isinstance(kwargs['event_data'], PreEncodedJSON)
+    assert len(kwargs['event_data']['task']) == 1024
+
+
+def test_auto_codec_without_orjson(mocker):
+    mocker.patch.object(json_codec, 'orjson', None)
+    assert get_json_codec('auto').name == 'json'
+    assert get_json_codec('orjson').name == 'json'
+
+
+def test_unknown_codec():
+    assert get_json_codec('foobar').name == 'json'
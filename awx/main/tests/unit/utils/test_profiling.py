@@ -0,0 +1,71 @@
+import os
+
+from awx.main.utils.profiling import AWXCycleProfiler, QueryCounter, QueryProfile, load_cycle_profiles, query_shape
+
+
+def run_cycle(dest, keep=50):
+    profiler = AWXCycleProfiler('task_manager', dest=str(dest), keep=keep)
+    with profiler.profile():
+        with profiler.phase('_schedule'):
+            with profiler.phase('get_tasks'):
+                profiler.queries(lambda *args: None, 'SELECT 1', None, False, {})
+            with profiler.phase('start_task'):
+                pass
+            with profiler.phase('start_task'):
+                pass
+    return profiler
+
+
+def test_phases_are_recorded(tmp_path):
+    profiler = run_cycle(tmp_path)
+    phases = profiler.results['phases']
+    assert set(phases) == {'_schedule', 'get_tasks', 'start_task'}
+    assert phases['start_task']['calls'] == 2
+    assert phases['get_tasks']['queries'] == 1
+    assert phases['_schedule']['queries'] == 1
+    assert profiler.results['queries'] == 1
+    assert phases['_schedule']['seconds'] >= phases['get_tasks']['seconds']
+
+
+def test_output_files(tmp_path):
+    run_cycle(tmp_path)
+    extensions = sorted(os.path.splitext(f)[1] for f in os.listdir(tmp_path))
+    assert extensions == ['.collapsed', '.json', '.pstats']
+    collapsed = [f for f in os.listdir(tmp_path) if f.endswith('.collapsed')][0]
+    with open(tmp_path / collapsed) as f:
+        stacks = [line.rsplit(' ', 1)[0] for line in f]
+    assert 'task_manager;_schedule;get_tasks' in stacks
+    assert 'task_manager;_schedule;start_task' in stacks
+
+
+def test_old_runs_are_rotated(tmp_path):
+    for _ in range(4):
+        run_cycle(tmp_path, keep=2)
+    assert len(os.listdir(tmp_path)) == 6
+    assert len(load_cycle_profiles(str(tmp_path), 'task_manager')) == 2
+    assert len(load_cycle_profiles(str(tmp_path), 'task_manager', last=1)) == 1
+    assert load_cycle_profiles(str(tmp_path), 'dependency_manager') == []
+
+
+def test_query_counter():
+    counter = QueryCounter()
+    assert counter(lambda sql, params, many, context: 'result', 'SELECT 1', None, False, {}) == 'result'
+    assert counter.count == 1
+
+
+def test_query_shape():
+    assert query_shape("SELECT a FROM t WHERE id IN (%s, %s, 3) AND name = 'it''s' LIMIT 21") == 'SELECT a FROM t WHERE id IN (?) AND name = ? LIMIT ?'
+
+
+def test_query_profile_n_plus_one():
+    profile = QueryProfile(n_plus_one_threshold=3)
+    execute = lambda *args: None  # noqa: E731
+    profile(execute, 'SELECT 1', None, False, {})
+    profile.section = 'HostSerializer.summary_fields'
+    for i in range(3):
+        profile(execute, f'SELECT * FROM main_inventory WHERE id = {i}', None, False, {})
+    profile.section = None
+
+    assert profile.count == 4
+    assert [(section, queries) for section, queries, seconds in profile.top_sections()] == [('HostSerializer.summary_fields', 3), ('view', 1)]
+    assert profile.n_plus_one_candidates() == [('HostSerializer.summary_fields', 3, 'SELECT * FROM main_inventory WHERE id = ?')]
@@ -29,7 +29,7 @@ from django.db import connection, DatabaseError, transaction, ProgrammingError,
 from django.db.models.fields.related import ForeignObjectRel, ManyToManyField
 from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor, ManyToManyDescriptor
 from django.db.models.query import QuerySet
-from django.db.models import Q
+from django.db.models import BooleanField, Case, Q, Value, When
 from django.db import connection as django_connection
 from django.core.cache import cache as django_cache
 
@@ -58,6 +58,7 @@ __all__ = [
     'copy_model_by_class',
     'copy_m2m_relationships',
     'prefetch_page_capabilities',
+    'evaluate_page_capabilities',
     'datetime_hook',
     'ignore_inventory_computed_fields',
     'ignore_inventory_group_removal',
@@ -598,7 +599,8 @@ def prefetch_page_capabilities(model, page, prefetch_list, user):
         4: {'edit': True, 'start': True},
         6: {'edit': False, 'start': False}
     }
-    Each capability is produced for all items in the page in a single query
+    All capabilities are produced for all items in the page in a single query,
+    with one boolean column per capability
 
     Examples of prefetch language:
     prefetch_list = ['admin', 'execute']
@@ -611,11 +613,7 @@ def prefetch_page_capabilities(model, page, prefetch_list, user):
       --> prefetch logical combination of admin permission to inventory AND
           project, put into cache dictionary as "copy"
     """
-    page_ids = [obj.id for obj in page]
-    mapping = {}
-    for obj in page:
-        mapping[obj.id] = {}
-
+    conditions = {}
     for prefetch_entry in prefetch_list:
         display_method = None
         if type(prefetch_entry) is dict:
@@ -627,8 +625,8 @@ def prefetch_page_capabilities(model, page, prefetch_list, user):
         if type(paths) is not list:
             paths = [paths]
 
-        # Build the query for accessible_objects according the user & role(s)
-        filter_args = []
+        # Build the condition for accessible_objects according the user & role(s)
+        condition = Q()
         for role_path in paths:
             if '.' in role_path:
                 res_path = '__'.join(role_path.split('.')[:-1])
@@ -636,12 +634,12 @@ def prefetch_page_capabilities(model, page, prefetch_list, user):
                 parent_model = model
                 for subpath in role_path.split('.')[:-1]:
                     parent_model = parent_model._meta.get_field(subpath).related_model
-                filter_args.append(
-                    Q(Q(**{'%s__pk__in' % res_path: parent_model.accessible_pk_qs(user, '%s_role' % role_type)}) | Q(**{'%s__isnull' % res_path: True}))
+                condition &= Q(
+                    Q(**{'%s__pk__in' % res_path: parent_model.accessible_pk_qs(user, '%s_role' % role_type)}) | Q(**{'%s__isnull' % res_path: True})
                 )
             else:
                 role_type = role_path
-                filter_args.append(Q(**{'pk__in': model.accessible_pk_qs(user, '%s_role' % role_type)}))
+                condition &= Q(**{'pk__in': model.accessible_pk_qs(user, '%s_role' % role_type)})
 
         if display_method is None:
             # Role name translation to UI names for methods
@@ -651,13 +649,39 @@ def prefetch_page_capabilities(model, page, prefetch_list, user):
             elif role_type in ['execute', 'update']:
                 display_method = 'start'
 
-        # Union that query with the list of items on page
-        filter_args.append(Q(pk__in=page_ids))
-        ids_with_role = set(model.objects.filter(*filter_args).values_list('pk', flat=True))
+        conditions[display_method] = condition
+
+    return evaluate_page_capabilities(model, page, conditions)
 
-        # Save data item-by-item
-        for obj in page:
-            mapping[obj.pk][display_method] = bool(obj.pk in ids_with_role)
+
+def evaluate_page_capabilities(model, page, conditions):
+    """
+    Given a `page` list of objects and a dictionary of conditions by
+    capability, either a Q filter on `model` or a bool which holds for all
+    objects, a nested dictionary of capabilities is returned by id, like
+    prefetch_page_capabilities does.  The Q conditions are checked for all
+    items in the page in a single query, with one boolean column per
+    capability
+    """
+    mapping = {}
+    for obj in page:
+        mapping[obj.pk] = {display_method: condition for display_method, condition in conditions.items() if isinstance(condition, bool)}
+
+    annotations = {}
+    display_methods = []
+    for display_method, condition in conditions.items():
+        if not isinstance(condition, bool):
+            annotations['capability_%d' % len(annotations)] = Case(When(condition, then=Value(True)), default=Value(False), output_field=BooleanField())
+            display_methods.append(display_method)
+
+    if not annotations or not mapping:
+        return mapping
+
+    # Save data item-by-item
+    for obj in page:
+        mapping[obj.pk].update(dict.fromkeys(display_methods, False))
+    for pk, *capabilities in model.objects.filter(pk__in=list(mapping)).annotate(**annotations).values_list('pk', *annotations).order_by():
+        mapping[pk].update(zip(display_methods, (bool(capability) for capability in capabilities)))
 
     return mapping
 
@@ -0,0 +1,163 @@
+"""
+JSON encoding and decoding of callback events on their way from
+ansible-runner, through valkey, to the event tables.
+
+A compiled JSON library (orjson) is used when it is installed, with the
+standard library json module as the fallback.
+"""
+
+import json
+import logging
+import math
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = ['AnsibleJSONEncoder', 'PreEncodedJSON', 'get_json_codec', 'JSON_CODECS']
+
+logger = logging.getLogger('awx.main.utils.json_codec')
+
+# Callback messages published by the orjson codec start with this key, whose
+# value is the byte length of the event_data JSON that immediately follows
+# it, i.e.
+#   {"event_data_length":17,"event_data":{"task":"ping"},"event":"runner_on_ok",...}
+# the message is still a valid JSON document; the receiver uses the length
+# to keep the raw event_data bytes, so that they can be written to the
+# database as-is instead of being encoded again
+EVENT_DATA_LENGTH_KEY = 'event_data_length'
+EVENT_DATA_PREFIX = b'{"event_data_length":'
+EVENT_DATA_KEY = b',"event_data":'
+
+
+def has_non_finite_float(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(has_non_finite_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_non_finite_float(value) for value in obj)
+    return False
+
+
+# use a custom JSON serializer so we can properly handle !unsafe and !vault
+# objects that may exist in events emitted by the callback plugin
+# see: https://github.com/ansible/ansible/pull/38759
+class AnsibleJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if getattr(o, 'yaml_tag', None) == '!vault':
+            return o.data
+        return super(AnsibleJSONEncoder, self).default(o)
+
+
+_ansible_json_encoder = AnsibleJSONEncoder()
+
+
+def ansible_json_default(o):
+    return _ansible_json_encoder.default(o)
+
+
+class PreEncodedJSON(dict):
+    """
+    A decoded JSON object which remembers the bytes it was decoded from.
+
+    JSONBlob writes `encoded` to the database instead of serializing the
+    dict again; anything which modifies the dict must turn it back into a
+    plain dict first.
+    """
+
+    def __init__(self, data, encoded):
+        super(PreEncodedJSON, self).__init__(data)
+        self.encoded = encoded
+
+
+class StdlibJSONCodec:
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=AnsibleJSONEncoder).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def encode_event(self, obj):
+        """
+        Encode a callback event for valkey, in the format every release of
+        the callback receiver reads
+        """
+        return self.dumps(obj)
+
+    def decode_event(self, message, body=None):
+        """
+        Decode a callback message from valkey; if body is given, message has
+        already been decoded into it, and only the pre-encoded event_data is
+        attached
+        """
+        if body is None:
+            body = self.loads(message)
+        length = body.pop(EVENT_DATA_LENGTH_KEY, None)
+        if length is not None and isinstance(message, bytes) and message.startswith(EVENT_DATA_PREFIX) and isinstance(body.get('event_data'), dict):
+            start = message.index(EVENT_DATA_KEY) + len(EVENT_DATA_KEY)
+            body['event_data'] = PreEncodedJSON(body['event_data'], message[start : start + length])
+        return body
+
+
+class OrjsonJSONCodec(StdlibJSONCodec):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        try:
+            encoded = orjson.dumps(obj, default=ansible_json_default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the stdlib can handle
+            return super(OrjsonJSONCodec, self).dumps(obj)
+        if b'null' in encoded and has_non_finite_float(obj):
+            # orjson writes NaN and Infinity as null, the stdlib keeps them
+            return super(OrjsonJSONCodec, self).dumps(obj)
+        return encoded
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN or Infinity, which the stdlib emits but orjson rejects
+            return super(OrjsonJSONCodec, self).loads(data)
+
+    def encode_event(self, obj):
+        """
+        Encode a callback event for valkey, placing the encoded event_data
+        first so that the receiver can keep it (see EVENT_DATA_PREFIX)
+        """
+        event_data = obj.get('event_data')
+        if not isinstance(event_data, dict):
+            return self.dumps(obj)
+        encoded_event_data = self.dumps(event_data)
+        rest = self.dumps({k: v for k, v in obj.items() if k != 'event_data'})
+        separator = b',' if rest != b'{}' else b''
+        return b''.join(
+            [EVENT_DATA_PREFIX, str(len(encoded_event_data)).encode(), EVENT_DATA_KEY, encoded_event_data, separator, rest[1:]],
+        )
+
+
+JSON_CODECS = {codec.name: codec for codec in (StdlibJSONCodec, OrjsonJSONCodec)}
+
+
+def get_json_codec(name=None):
+    """
+    Returns the JSON codec named by CALLBACK_EVENT_JSON_CODEC; 'auto' picks
+    the fastest one which is installed
+    """
+    name = name or settings.CALLBACK_EVENT_JSON_CODEC
+    if name == 'auto':
+        name = OrjsonJSONCodec.name if orjson is not None else StdlibJSONCodec.name
+    if name == OrjsonJSONCodec.name and orjson is None:
+        logger.warning('CALLBACK_EVENT_JSON_CODEC is orjson, but orjson is not installed, falling back to json')
+        name = StdlibJSONCodec.name
+    try:
+        return JSON_CODECS[name]()
+    except KeyError:
+        logger.error(f'Unknown CALLBACK_EVENT_JSON_CODEC {name}, falling back to json')
+        return StdlibJSONCodec()
@@ -1,12 +1,21 @@
+import contextlib
 import cProfile
 import functools
+import glob
+import logging
 import pstats
 import os
+import re
+import time
 import uuid
 import datetime
 import json
 import sys
 
+from django.db import connection
+
+logger = logging.getLogger('awx.main.utils.profiling')
+
 
 class AWXProfileBase:
     def __init__(self, name, dest):
@@ -147,3 +156,173 @@ def profile(name, *init_args, **init_kwargs):
         return wrapper_profile
 
     return decorator_profile
+
+
+class QueryCounter:
+    """A database execute_wrapper which counts queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+@contextlib.contextmanager
+def count_queries(counter=None):
+    """
+    Count the queries run on the default database connection inside the with
+    block, in the yielded QueryCounter, which adds to `counter` if given.
+    Unlike connection.queries, this does not need DEBUG.
+    """
+    if counter is None:
+        counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+SQL_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+def query_shape(sql):
+    """The SQL with its literals and parameters replaced by ?, and lists of them by a single ?"""
+    return SQL_LIST_RE.sub('?', SQL_LITERAL_RE.sub('?', sql))
+
+
+class QueryProfile(QueryCounter):
+    """
+    A QueryCounter for one API request, which also breaks the queries down by
+    section, the serializer field being rendered when there is one, and finds
+    the N+1 candidates: query shapes repeated n_plus_one_threshold or more times.
+    """
+
+    def __init__(self, n_plus_one_threshold):
+        super().__init__()
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.section = None
+        # section: [queries, seconds]
+        self.sections = {}
+        # shape: [queries, section of the first query]
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            self.count += 1
+            self.seconds += seconds
+            section = self.sections.setdefault(self.section, [0, 0.0])
+            section[0] += 1
+            section[1] += seconds
+            self.shapes.setdefault(query_shape(sql), [0, self.section])[0] += 1
+
+    def top_sections(self, limit=5):
+        """[(section, queries, seconds)] of the sections with the most queries"""
+        ranked = sorted(self.sections.items(), key=lambda item: item[1][0], reverse=True)
+        return [(section or 'view', queries, seconds) for section, (queries, seconds) in ranked[:limit]]
+
+    def n_plus_one_candidates(self):
+        """[(section, queries, shape)] of the repeated query shapes, most repeated first"""
+        candidates = [(section or 'view', queries, shape) for shape, (queries, section) in self.shapes.items() if queries >= self.n_plus_one_threshold]
+        return sorted(candidates, key=lambda candidate: candidate[1], reverse=True)
+
+
+class AWXCycleProfiler(AWXProfileBase):
+    """
+    Profiles one run of a task manager.
+
+    Records wall time, query count and query time for each phase, plus a
+    cProfile dump of the whole run and the phases as collapsed stacks
+    (flamegraph.pl / speedscope input).  Only the newest `keep` runs of
+    each manager are kept in dest.
+    """
+
+    def __init__(self, name, dest='/var/log/tower/profile/task_manager', keep=50):
+        super().__init__(name, dest)
+        self.keep = keep
+        self.queries = QueryCounter()
+        self.stack = [name]
+        # inclusive time of the children of each phase on the stack
+        self.child_seconds = [0.0]
+        self.collapsed = {}
+        self.results = {'name': name, 'phases': {}}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start, start_count, start_query_seconds = time.perf_counter(), self.queries.count, self.queries.seconds
+        self.stack.append(name)
+        self.child_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack_key = ';'.join(self.stack)
+            self.collapsed[stack_key] = self.collapsed.get(stack_key, 0.0) + seconds - self.child_seconds.pop()
+            self.stack.pop()
+            self.child_seconds[-1] += seconds
+            phase = self.results['phases'].setdefault(name, {'calls': 0, 'seconds': 0.0, 'queries': 0, 'query_seconds': 0.0})
+            phase['calls'] += 1
+            phase['seconds'] += seconds
+            phase['queries'] += self.queries.count - start_count
+            phase['query_seconds'] += self.queries.seconds - start_query_seconds
+
+    @contextlib.contextmanager
+    def profile(self):
+        self.pid = os.getpid()
+        self.results['started'] = time.time()
+        self.prof = cProfile.Profile()
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.queries):
+            self.prof.enable()
+            try:
+                yield self
+            finally:
+                self.prof.disable()
+                seconds = time.perf_counter() - start
+                self.collapsed[self.stack[0]] = seconds - self.child_seconds[0]
+                self.results.update(seconds=seconds, queries=self.queries.count, query_seconds=self.queries.seconds)
+                try:
+                    self.output_results()
+                except Exception:
+                    logger.exception(f'Failed to write {self.name} profile to {self.dest}')
+
+    def output_results(self):
+        filename_base = '%s-%d-%s-%s' % (self.name, self.results['started'] * 1000, self.pid, uuid.uuid4().hex[:8])
+        super().output_results(f'{filename_base}.json')
+        self.prof.dump_stats(os.path.join(self.dest, f'{filename_base}.pstats'))
+        with open(os.path.join(self.dest, f'{filename_base}.collapsed'), 'w') as f:
+            for stack, seconds in self.collapsed.items():
+                # collapsed stacks are weighed in integer samples, use microseconds
+                f.write(f'{stack} {int(seconds * 1000000)}\n')
+        self.rotate()
+
+    def rotate(self):
+        runs = sorted(glob.glob(os.path.join(self.dest, f'{self.name}-*.json')), key=os.path.getmtime)
+        for old_run in runs[: max(len(runs) - self.keep, 0)]:
+            filename_base = old_run[: -len('.json')]
+            for ext in ('.json', '.pstats', '.collapsed'):
+                try:
+                    os.remove(filename_base + ext)
+                except FileNotFoundError:
+                    pass
+
+
+def load_cycle_profiles(dest, name, last=None):
+    """Return the results of the newest `last` profiled runs of manager `name` in dest, oldest first"""
+    runs = sorted(glob.glob(os.path.join(dest, f'{name}-*.json')), key=os.path.getmtime)
+    if last:
+        runs = runs[-last:]
+    results = []
+    for run in runs:
+        with open(run) as f:
+            results.append(json.load(f))
+    return results
@@ -166,11 +166,6 @@ LOGIN_URL = '/api/login/'
 # This directory should not be web-accessible.
 PROJECTS_ROOT = '/var/lib/awx/projects/'
 
-# Absolute filesystem path to the directory for job status stdout (default for
-# development and tests, default for production defined in production.py). This
-# directory should not be web-accessible
-JOBOUTPUT_ROOT = '/var/lib/awx/job_status/'
-
 # Absolute filesystem path to the directory to store logs
 LOG_ROOT = '/var/log/tower/'
 
@@ -246,6 +241,19 @@ CONTROL_PLANE_EXECUTION_ENVIRONMENT = 'ghcr.io/ctrliq/ascender-ee:latest'
 # Note: This setting may be overridden by database settings.
 STDOUT_MAX_BYTES_DISPLAY = 1048576
 
+# Paginated stdout of finished jobs is read through a cached line index, with
+# a (start_line, counter) checkpoint every STDOUT_LINE_INDEX_INTERVAL events
+# so a page only scans the events between two checkpoints
+STDOUT_LINE_INDEX_INTERVAL = 500
+STDOUT_LINE_INDEX_CACHE_TIMEOUT = 86400
+
+# Once all events of a finished job are saved, copy its stdout into a gzip
+# compressed, line-indexed archive the first time it is viewed, and serve
+# stdout from the archive from then on; cleanup_jobs --stdout-archives
+# expires archives.  Chunks hold about STDOUT_ARCHIVE_CHUNK_BYTES of stdout.
+STDOUT_ARCHIVE_ENABLED = False
+STDOUT_ARCHIVE_CHUNK_BYTES = 262144
+
 # Returned in the header on event api lists as a recommendation to the UI
 # on how many events to display before truncating/hiding
 MAX_UI_JOB_EVENTS = 4000
@@ -262,10 +270,6 @@ MAX_EVENT_RES_DATA = 25000000
 EVENT_STDOUT_MAX_BYTES_DISPLAY = 1024
 MAX_WEBSOCKET_EVENT_RATE = 30
 
-# The amount of time before a stdout file is expired and removed locally
-# Note that this can be recreated if the stdout is downloaded
-LOCAL_STDOUT_EXPIRE_TIME = 2592000
-
 # The number of processes spawned by the callback receiver to process job
 # events into the database
 JOB_EVENT_WORKERS = 4
@@ -274,6 +278,34 @@ JOB_EVENT_WORKERS = 4
 # writes in memory before flushing via JobEvent.objects.bulk_create()
 JOB_EVENT_BUFFER_SECONDS = 1
 
+# How the callback receiver writes buffered job events to the database
+# 'bulk_create' uses the Django ORM, 'copy' streams each batch into the
+# event tables with PostgreSQL COPY FROM STDIN
+JOB_EVENT_INGEST_ENGINE = 'bulk_create'
+
+# How the callback receiver decides when to flush buffered job events
+# 'fixed' flushes every JOB_EVENT_BUFFER_SECONDS or when a buffer reaches
+# JOB_EVENT_BUFFER_MAX_EVENTS; 'adaptive' sizes batches and intervals between
+# JOB_EVENT_BUFFER_MIN_* and JOB_EVENT_BUFFER_MAX_EVENTS / JOB_EVENT_BUFFER_SECONDS
+# from the valkey queue backlog and the observed database insert latency
+JOB_EVENT_FLUSH_POLICY = 'fixed'
+JOB_EVENT_BUFFER_MAX_EVENTS = 1000
+JOB_EVENT_BUFFER_MIN_EVENTS = 50
+JOB_EVENT_BUFFER_MIN_SECONDS = 0.1
+
+# Hard ceiling on the number of job events a callback receiver worker
+# holds in memory before forcing a flush
+JOB_EVENT_BUFFER_MAX_IN_MEMORY = 5000
+
+# The maximum number of messages a callback receiver worker pops from
+# valkey per read; each batch is decoded and buffered as one unit
+JOB_EVENT_READ_BATCH_SIZE = 1
+
+# The JSON library used to encode callback events into valkey and decode
+# them in the callback receiver: 'json' (the standard library), 'orjson',
+# or 'auto' to use orjson when it is installed.
+CALLBACK_EVENT_JSON_CODEC = 'json'
+
 # The interval at which callback receiver statistics should be
 # recorded
 JOB_EVENT_STATISTICS_INTERVAL = 5
@@ -290,6 +322,10 @@ SUBSYSTEM_METRICS_VALKEY_KEY_PREFIX = "awx_metrics"
 # Histogram buckets for the callback_receiver_batch_events_insert_db metric
 SUBSYSTEM_METRICS_BATCH_INSERT_BUCKETS = [10, 50, 150, 350, 650, 2000]
 
+# Histogram buckets for the api_request_queries and api_request_query_milliseconds metrics
+SUBSYSTEM_METRICS_API_QUERY_BUCKETS = [5, 10, 25, 50, 100, 250, 1000]
+SUBSYSTEM_METRICS_API_QUERY_MILLISECONDS_BUCKETS = [5, 25, 100, 250, 1000, 5000]
+
 # Interval in seconds for sending local metrics to other nodes
 SUBSYSTEM_METRICS_INTERVAL_SEND_METRICS = 3
 
@@ -314,6 +350,27 @@ AWX_NOTIFICATION_REQUEST_TIMEOUT = 30
 TASK_MANAGER_TIMEOUT = 300
 TASK_MANAGER_TIMEOUT_GRACE_PERIOD = 60
 
+# Keep the active tasks seen by the task manager in memory between runs, and
+# only load the tasks which changed since (by their modified timestamp) instead
+# of every pending, waiting and running task on each run.
+# All tasks are still loaded every TASK_MANAGER_FULL_RECONCILE_INTERVAL seconds.
+# Changes made up to TASK_MANAGER_INCREMENTAL_OVERLAP seconds before the last
+# run are loaded again, to allow for long transactions and clock drift between nodes.
+TASK_MANAGER_INCREMENTAL = False
+TASK_MANAGER_FULL_RECONCILE_INTERVAL = 300
+TASK_MANAGER_INCREMENTAL_OVERLAP = 30
+
+# Keep the graphs of running workflow jobs in memory between workflow manager
+# runs. Each run then reads only the state of the workflow nodes (their jobs and
+# job statuses) with one query per workflow, instead of building the whole graph again.
+WORKFLOW_MANAGER_DAG_CACHE = False
+
+# How the task manager picks an instance for a task in an instance group:
+# 'worst_fit' - the instance with the most remaining capacity
+# 'best_fit' - the instance with the least remaining capacity the task fits in
+# 'spread' - the instance running the fewest jobs which the task fits in
+TASK_MANAGER_PLACEMENT_STRATEGY = 'worst_fit'
+
 # Number of seconds _in addition to_ the task manager timeout a job can stay
 # in waiting without being reaped
 JOB_WAITING_GRACE_PERIOD = 60
@@ -723,6 +780,11 @@ GALAXY_TASK_ENV = {'ANSIBLE_FORCE_COLOR': 'false', 'GIT_SSH_COMMAND': "ssh -o St
 # Rebuild Host Smart Inventory memberships.
 AWX_REBUILD_SMART_MEMBERSHIP = False
 
+# Seconds the hosts, groups and variables of an inventory are cached for
+# building inventory scripts, keyed by the inventory script_data_version which
+# changes whenever they do.  Job slices all share one cached copy.  0 disables.
+INVENTORY_SCRIPT_DATA_CACHE_TIMEOUT = 3600
+
 # By default, allow arbitrary Jinja templating in extra_vars defined on a Job Template
 ALLOW_JINJA_IN_EXTRA_VARS = 'template'
 
@@ -754,6 +816,10 @@ ASCENDER_AUTO_STATS_ENABLED = True
 # Note: This setting may be overridden by database settings.
 ASCENDER_AUTO_STATS_MAX_HOSTS = 100
 
+# Number of threads writing host fact cache files before a job runs, and
+# reading them back after it finishes
+ANSIBLE_FACT_CACHE_WORKERS = 8
+
 # Applies to any galaxy server
 GALAXY_IGNORE_CERTS = False
 
@@ -929,11 +995,32 @@ ACTIVITY_STREAM_ENABLED_FOR_INVENTORY_SYNC = False
 
 CALLBACK_QUEUE = "callback_tasks"
 
+# The number of valkey lists callback events are sharded across, keyed by
+# job id. Each callback receiver worker consumes its own subset of shards, so
+# that the events of a job are saved in order by a single worker.
+# Set to JOB_EVENT_WORKERS (or a multiple of it) to enable; 0 or 1 publishes
+# all events to CALLBACK_QUEUE
+CALLBACK_QUEUE_SHARDS = 0
+
 # Note: This setting may be overridden by database settings.
 ORG_ADMINS_CAN_SEE_ALL_USERS = True
 MANAGE_ORGANIZATION_AUTH = True
 DISABLE_LOCAL_AUTH = False
 
+# Materialize the ids of the objects each user has a role on (per role and
+# model) in a table, built by a background task the first time they are
+# needed, so that list views and user_capabilities look them up instead of
+# walking the role ancestors of the user's roles on every request.  A change to
+# role ancestry or membership starts over for the users whose roles it changed.
+RBAC_ACCESSIBLE_OBJECTS_CACHE = False
+
+# How role ancestors are rebuilt when role parents change.  'iterative' walks
+# down the role graph one level at a time until nothing changes, 'closure'
+# computes the full ancestors of every affected role with recursive queries,
+# in batches, and applies the differences in bulk.  The
+# benchmark_role_ancestry command compares them on a generated role graph.
+ROLE_ANCESTRY_REBUILD_ENGINE = 'iterative'
+
 # Note: This setting may be overridden by database settings.
 TOWER_URL_BASE = "https://ascenderhost"
 
@@ -1111,6 +1198,25 @@ AWX_REQUEST_PROFILE_WITH_DOT = False
 # Allow profiling callback workers via SIGUSR1
 AWX_CALLBACK_PROFILE = False
 
+# Profile every run of the task, dependency and workflow managers: wall time,
+# query count and query time per phase, a cProfile dump, and collapsed stacks
+# for flame graphs are written to AWX_TASK_MANAGER_PROFILE_DIR, which keeps the
+# newest AWX_TASK_MANAGER_PROFILE_KEEP runs of each manager.
+# Summarize them with `awx-manage profile_task_manager`.
+AWX_TASK_MANAGER_PROFILE = False
+AWX_TASK_MANAGER_PROFILE_DIR = '/var/log/tower/profile/task_manager'
+AWX_TASK_MANAGER_PROFILE_KEEP = 50
+
+# Count the queries and query time of every API request, in total and per
+# serializer field, and flag query shapes repeated
+# AWX_API_QUERY_PROFILE_N_PLUS_ONE_THRESHOLD or more times in one request as
+# N+1 candidates.  Reported in X-API-Query-* response headers and in the
+# api_request_* histograms of /api/v2/metrics/.  Requests making more than
+# AWX_API_QUERY_BUDGET queries (0 for no budget) are logged.
+AWX_API_QUERY_PROFILE = False
+AWX_API_QUERY_PROFILE_N_PLUS_ONE_THRESHOLD = 10
+AWX_API_QUERY_BUDGET = 0
+
 # Delete temporary directories created to store playbook run-time
 AWX_CLEANUP_PATHS = True
 
@@ -1244,6 +1350,7 @@ HOST_METRIC_SUMMARY_TASK_INTERVAL = 7  # days
 METRICS_SERVICE_CALLBACK_RECEIVER = 'callback_receiver'
 METRICS_SERVICE_DISPATCHER = 'dispatcher'
 METRICS_SERVICE_WEBSOCKETS = 'websockets'
+METRICS_SERVICE_API = 'api'
 
 METRICS_SUBSYSTEM_CONFIG = {
     'server': {